@@ -1,8 +1,9 @@
-from flask import Flask
+from flask import Flask, Response, g, request
 from flask_cors import CORS
 import logging
 from dotenv import load_dotenv
 import os
+import time
 
 # Load environment variables
 load_dotenv()
@@ -14,33 +15,90 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Frontend origins allowed to call the API
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "http://localhost:5173",
+    "https://*.vercel.app",
+    "https://*.railway.app"
+]
+
 def create_app():
     """Application factory pattern for Flask app"""
     app = Flask(__name__)
     
     # Configure CORS
-    CORS(app, origins=[
-        "http://localhost:3000",
-        "http://localhost:5173",
-        "https://*.vercel.app",
-        "https://*.railway.app"
-    ])
+    CORS(app, origins=CORS_ORIGINS)
     
     # Register blueprints
     from routes.sherlock_routes import sherlock_bp
     from routes.email_routes import email_bp
     from routes.domain_routes import domain_bp
     from routes.ip_routes import ip_bp
+    from routes.investigate_routes import investigate_bp
     
     app.register_blueprint(sherlock_bp, url_prefix='/api')
     app.register_blueprint(email_bp, url_prefix='/api')
     app.register_blueprint(domain_bp, url_prefix='/api')
     app.register_blueprint(ip_bp, url_prefix='/api')
+    app.register_blueprint(investigate_bp, url_prefix='/api')
+    
+    # Load the Sherlock site manifest once per worker instead of per request
+    from routes.sherlock_routes import init_sherlock_engine
+    init_sherlock_engine()
+    
+    # Attribute upstream calls to the requesting client for fair rate limiting
+    from utils.rate_limit import client_id, current_client
+    
+    @app.before_request
+    def set_current_client():
+        current_client.set(client_id(request.headers.get('X-Forwarded-For'), request.remote_addr))
+    
+    # Request latency and in-flight metrics, exported by /metrics
+    from utils.metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT, render_metrics
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.in_flight = True
+        REQUESTS_IN_FLIGHT.inc()
+    
+    @app.after_request
+    def record_request_latency(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            REQUEST_LATENCY.labels(request.method, route, str(response.status_code)).observe(time.perf_counter() - start)
+        return response
+    
+    @app.teardown_request
+    def end_request(error=None):
+        if g.pop('in_flight', False):
+            REQUESTS_IN_FLIGHT.dec()
+    
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics endpoint"""
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
     
     @app.route('/health')
     def health_check():
         """Health check endpoint"""
-        return {'status': 'healthy', 'message': 'OSINT Backend is running'}
+        from utils.circuit_breaker import circuit_stats
+        from utils.persistent_cache import persistent_cache_stats
+        from utils.rate_limit import rate_limit_stats
+        from routes.sherlock_routes import sherlock_workers
+        from utils.hot_keys import hot_keys
+        return {
+            'status': 'healthy',
+            'message': 'OSINT Backend is running',
+            'rate_limits': rate_limit_stats(),
+            'circuits': circuit_stats(),
+            'persistent_cache': persistent_cache_stats(),
+            'sherlock_workers': sherlock_workers.stats(),
+            'hot_keys': hot_keys.stats()
+        }
     
     @app.errorhandler(404)
     def not_found(error):
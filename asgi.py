@@ -0,0 +1,730 @@
+"""
+ASGI entry point
+
+Serves the lookup endpoints on an event loop with async upstream clients,
+so one process can hold many concurrent lookups without a thread each:
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+
+Endpoints without an async implementation (Sherlock jobs and streams, batch
+lookups) are served by the regular Flask app mounted underneath.
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import os
+import re
+import socket
+import time
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse as BaseJSONResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import http_date
+
+from app import CORS_ORIGINS, create_app
+from routes import domain_routes, sherlock_routes
+from routes.domain_routes import (
+    DNS_RECORD_TYPES, WHOIS_MAX_REFERRALS, WHOIS_MAX_RESPONSE_BYTES,
+    WHOIS_NOT_FOUND_PATTERN, WHOIS_QUERY_FORMATS, DNSResolverUnavailable, WhoisRecord, build_whois_data,
+    create_dns_resolver, empty_dns_records, format_dns_answer, format_domain_result, normalize_domain,
+    parse_whois_response, referral_server, validate_domain, validate_whois_backend, whois_server_for
+)
+from routes.email_routes import (
+    EMAILREP_URL, GRAVATAR_AVATAR_URL, GRAVATAR_PROFILE_URL, add_classification, cache_gravatar,
+    classify_locally, emailrep_headers, fetch_email_reputation, format_email_result, gravatar_cache, gravatar_hash,
+    parse_email_reputation_response, parse_gravatar_avatar_response, parse_gravatar_profile_response,
+    validate_email, verify_gravatar_requested
+)
+from routes.ip_routes import (
+    IPWHOIS_URL, format_ip_result, geo_block, is_own_geolocation, localize_geolocation,
+    lookup_local_geolocation, lookup_prefix_geolocation, parse_ip_geolocation_response,
+    refresh_ip_geolocation, remember_prefix_geolocation, validate_ip
+)
+from routes.sherlock_routes import (
+    is_complete_scan, normalize_username, scan_options_from_args, scan_sites, sherlock_cache,
+    sherlock_cache_ttl, sherlock_workers
+)
+from utils.circuit_breaker import (
+    CircuitOpenError, call_hedged_async, circuit_stats, get_circuit_breaker
+)
+from utils.hot_keys import hot_keys
+from utils.jobs import QueueFullError
+from utils.metrics import REQUEST_LATENCY, REQUESTS_IN_FLIGHT, track_upstream
+from utils.http_client import HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES
+from utils.persistent_cache import (
+    cached_call_async, get_persistent_cache, persistent_cache_stats, revalidate
+)
+from utils.rate_limit import (
+    RateLimitExceeded, client_id, current_client, get_rate_limiter, rate_limit_stats
+)
+from utils.sherlock_sites import ScanOptions
+from utils.singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '100'))
+
+email_flight = AsyncSingleFlight('emailrep')
+gravatar_flight = AsyncSingleFlight('gravatar')
+ip_flight = AsyncSingleFlight('ipwhois')
+whois_flight = AsyncSingleFlight('whois')
+sherlock_flight = AsyncSingleFlight('sherlock')
+
+_async_dns_resolver: Optional[dns.asyncresolver.Resolver] = None
+
+def get_async_dns_resolver() -> dns.asyncresolver.Resolver:
+    """
+    Shared async resolver, built on first use like the sync one
+    Raises DNSResolverUnavailable when there is no DNS configuration
+    """
+    global _async_dns_resolver
+    if _async_dns_resolver is None:
+        _async_dns_resolver = create_dns_resolver(dns.asyncresolver.Resolver)
+    return _async_dns_resolver
+
+# Upstream clients are bound to the event loop, they are created at startup
+clients: Dict[str, httpx.AsyncClient] = {}
+
+class JSONResponse(BaseJSONResponse):
+    """
+    JSON response encoding dates the way Flask's jsonify does
+    """
+
+    @staticmethod
+    def default(value):
+        if isinstance(value, date):
+            return http_date(value)
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+    def render(self, content) -> bytes:
+        return json.dumps(content, default=self.default, ensure_ascii=False,
+                          separators=(',', ':')).encode('utf-8')
+
+def build_async_client() -> httpx.AsyncClient:
+    """
+    Async HTTP client with keep-alive pooling and the same timeouts as sync mode
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=ASYNC_MAX_CONNECTIONS
+        ),
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        transport=httpx.AsyncHTTPTransport(retries=HTTP_RETRIES),
+        headers={'User-Agent': 'OSINT-Dashboard/1.0'}
+    )
+
+def set_current_client(request: Request):
+    current_client.set(client_id(request.headers.get('x-forwarded-for'),
+                                 request.client.host if request.client else None))
+
+def error_response(message: str, status_code: int) -> JSONResponse:
+    return JSONResponse({
+        'success': False,
+        'error': message
+    }, status_code=status_code)
+
+# Email
+
+async def fetch_email_reputation_async(email: str) -> Dict:
+    """
+    Get email reputation from emailrep.io API
+    """
+    try:
+        breaker = get_circuit_breaker('emailrep')
+        breaker.check()
+
+        # Waits on the event loop, queued clients are served round-robin
+        limiter = get_rate_limiter('emailrep')
+        await limiter.acquire_async()
+
+        response = await call_hedged_async(breaker, limiter, clients['emailrep'].get,
+                                           EMAILREP_URL.format(email), headers=emailrep_headers())
+        return parse_email_reputation_response(email, response)
+    except CircuitOpenError:
+        logger.warning(f"Emailrep circuit open, skipping lookup for {email}")
+        return {
+            'success': False,
+            'error': 'Emailrep API temporarily unavailable',
+            'email': email
+        }
+    except RateLimitExceeded:
+        return {
+            'success': False,
+            'error': 'Emailrep API rate limit exceeded, try again later',
+            'email': email
+        }
+    except httpx.TimeoutException:
+        logger.error(f"Emailrep API timeout for {email}")
+        return {
+            'success': False,
+            'error': 'Emailrep API timeout',
+            'email': email
+        }
+    except httpx.HTTPError as e:
+        logger.error(f"Emailrep API request error for {email}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Emailrep API request error: {str(e)}',
+            'email': email
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error getting email reputation for {email}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'email': email
+        }
+
+async def get_email_reputation_async(email: str) -> Dict:
+    classification, local_result = classify_locally(email)
+    if local_result is not None:
+        return add_classification(local_result, classification, 'local')
+    key = email.lower()
+    # Hot entries are refreshed from a worker thread with the sync fetch functions
+    hot_keys.record('email', key, functools.partial(fetch_email_reputation, email))
+
+    async def fetch():
+        result, _ = await email_flight.do(key, fetch_email_reputation_async, email)
+        return result
+
+    return add_classification(await cached_call_async('email', key, fetch), classification, 'emailrep.io')
+
+async def fetch_gravatar_async(email_hash: str) -> Dict:
+    """
+    Check whether a Gravatar avatar exists and fetch the public profile if it does
+    """
+    try:
+        breaker = get_circuit_breaker('gravatar')
+        breaker.check()
+
+        client = clients['gravatar']
+        avatar_response = await breaker.call_async(client.head, GRAVATAR_AVATAR_URL.format(email_hash))
+
+        profile = None
+        if avatar_response.status_code == 200:
+            profile_response = await breaker.call_async(client.get, GRAVATAR_PROFILE_URL.format(email_hash),
+                                                        follow_redirects=True)
+            profile = parse_gravatar_profile_response(email_hash, profile_response)
+        return parse_gravatar_avatar_response(email_hash, avatar_response, profile)
+    except CircuitOpenError:
+        logger.warning(f"Gravatar circuit open, skipping check for {email_hash}")
+        return {
+            'success': False,
+            'error': 'Gravatar API temporarily unavailable',
+            'hash': email_hash
+        }
+    except httpx.TimeoutException:
+        logger.error(f"Gravatar API timeout for {email_hash}")
+        return {
+            'success': False,
+            'error': 'Gravatar API timeout',
+            'hash': email_hash
+        }
+    except httpx.HTTPError as e:
+        logger.error(f"Gravatar API request error for {email_hash}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Gravatar API request error: {str(e)}',
+            'hash': email_hash
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error checking Gravatar for {email_hash}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'hash': email_hash
+        }
+
+async def get_gravatar_async(email: str) -> Dict:
+    email_hash = gravatar_hash(email)
+    cached = gravatar_cache.get(email_hash)
+    if cached is not None:
+        return cached[0]
+
+    result, shared = await gravatar_flight.do(email_hash, fetch_gravatar_async, email_hash)
+    if not shared:
+        cache_gravatar(result)
+    return result
+
+async def email_lookup(request: Request) -> JSONResponse:
+    """
+    GET /api/email?email=...[&verify_gravatar=true]
+    """
+    try:
+        logger.info(f"Email lookup request received: {dict(request.query_params)}")
+        set_current_client(request)
+        email = request.query_params.get('email')
+        if not email:
+            return error_response('Email parameter is required', 400)
+
+        email = email.strip().lower()
+        if not validate_email(email):
+            return error_response('Invalid email format', 400)
+
+        if verify_gravatar_requested(request.query_params.get('verify_gravatar')):
+            reputation_result, gravatar_result = await asyncio.gather(
+                get_email_reputation_async(email),
+                get_gravatar_async(email)
+            )
+        else:
+            reputation_result, gravatar_result = await get_email_reputation_async(email), None
+        return JSONResponse(format_email_result(email, reputation_result, gravatar_result))
+
+    except Exception as e:
+        logger.error(f"Error in email_lookup: {str(e)}")
+        return error_response(f'Internal server error: {str(e)}', 500)
+
+# IP
+
+async def fetch_ip_geolocation_async(ip: str) -> Dict:
+    """
+    Get IP geolocation data from ipwho.is API
+    """
+    try:
+        logger.info(f"Starting IP geolocation lookup for: {ip}")
+        breaker = get_circuit_breaker('ipwhois')
+        breaker.check()
+
+        limiter = get_rate_limiter('ipwhois')
+        await limiter.acquire_async()
+
+        response = await call_hedged_async(breaker, limiter, clients['ipwhois'].get, IPWHOIS_URL.format(ip))
+        return parse_ip_geolocation_response(ip, response)
+    except CircuitOpenError:
+        logger.warning(f"IPwho.is circuit open, skipping lookup for {ip}")
+        return {
+            'success': False,
+            'error': 'IPwho.is API temporarily unavailable',
+            'ip': ip
+        }
+    except RateLimitExceeded:
+        return {
+            'success': False,
+            'error': 'IPwho.is API rate limit exceeded, try again later',
+            'ip': ip
+        }
+    except httpx.TimeoutException:
+        logger.error(f"IPwho.is API timeout for {ip}")
+        return {
+            'success': False,
+            'error': 'IPwho.is API timeout',
+            'ip': ip
+        }
+    except httpx.HTTPError as e:
+        logger.error(f"IPwho.is API request error for {ip}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'IPwho.is API request error: {str(e)}',
+            'ip': ip
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error getting IP geolocation for {ip}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'ip': ip
+        }
+
+async def get_ip_geolocation_async(ip: str) -> Dict:
+    try:
+        local_result = lookup_local_geolocation(ip)
+        if local_result is not None:
+            return local_result
+    except Exception as e:
+        logger.error(f"Local geolocation lookup failed for {ip}: {str(e)}")
+
+    hot_keys.record('geo', ip, functools.partial(refresh_ip_geolocation, ip))
+    block = geo_block(ip)
+
+    async def fetch():
+        prefix_result = lookup_prefix_geolocation(ip)
+        if prefix_result is not None:
+            return prefix_result
+        result, joined = await ip_flight.do(block, fetch_ip_geolocation_async, ip)
+        return localize_geolocation(result, ip, block) if joined and result['success'] else result
+
+    result = await cached_call_async('geo', ip, fetch, cacheable=is_own_geolocation)
+    remember_prefix_geolocation(block, result)
+    return result
+
+async def ip_lookup(request: Request) -> JSONResponse:
+    """
+    GET /api/ip?ip=...
+    """
+    try:
+        logger.info(f"IP lookup request received: {dict(request.query_params)}")
+        set_current_client(request)
+        ip = request.query_params.get('ip')
+        if not ip:
+            return error_response('IP parameter is required', 400)
+
+        ip = ip.strip()
+        if not validate_ip(ip):
+            return error_response('Invalid IP address format', 400)
+
+        result = format_ip_result(ip, await get_ip_geolocation_async(ip))
+        return JSONResponse(result, status_code=200 if result['success'] else 500)
+
+    except Exception as e:
+        logger.error(f"Error in ip_lookup: {str(e)}")
+        return error_response(f'Internal server error: {str(e)}', 500)
+
+# Domain
+
+async def query_whois_server_async(server: str, query: str) -> str:
+    """
+    Send one WHOIS query over port 43, bounded by the per-hop timeout
+    """
+    async def exchange() -> bytes:
+        reader, writer = await asyncio.open_connection(server, domain_routes.WHOIS_PORT)
+        try:
+            writer.write(f"{WHOIS_QUERY_FORMATS.get(server, '{}').format(query)}\r\n".encode('utf-8'))
+            await writer.drain()
+            chunks = []
+            received = 0
+            while received < WHOIS_MAX_RESPONSE_BYTES:
+                chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                received += len(chunk)
+            return b''.join(chunks)
+        finally:
+            writer.close()
+
+    try:
+        with track_upstream('whois'):
+            data = await asyncio.wait_for(exchange(), domain_routes.WHOIS_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise socket.timeout(f'WHOIS query to {server} timed out')
+    return data.decode('utf-8', errors='replace')
+
+async def fetch_whois_socket_async(domain: str) -> Dict:
+    """
+    Get WHOIS data for domain by querying WHOIS servers directly,
+    following registrar referrals
+    """
+    try:
+        logger.info(f"Starting WHOIS lookup for domain: {domain}")
+
+        # Unknown TLDs need a (rare, cached) IANA query
+        server = await asyncio.to_thread(whois_server_for, domain)
+        if not server:
+            logger.error(f"No WHOIS server known for {domain}")
+            return {
+                'success': False,
+                'error': 'No WHOIS server known for this TLD',
+                'domain': domain
+            }
+
+        record = WhoisRecord()
+        for hop in range(WHOIS_MAX_REFERRALS + 1):
+            try:
+                response = await query_whois_server_async(server, domain)
+            except (socket.timeout, OSError) as e:
+                if hop == 0:
+                    raise
+                logger.warning(f"WHOIS referral to {server} failed for {domain}: {str(e)}")
+                break
+
+            if hop == 0 and WHOIS_NOT_FOUND_PATTERN.search(response):
+                logger.warning(f"Domain not found in WHOIS: {domain}")
+                return {
+                    'success': False,
+                    'error': f'WHOIS lookup error: No match for "{domain}"',
+                    'domain': domain
+                }
+
+            record.update(parse_whois_response(response))
+            server = referral_server(response, server)
+            if not server:
+                break
+
+        if not record:
+            return {
+                'success': False,
+                'error': 'WHOIS lookup error: empty response',
+                'domain': domain
+            }
+
+        logger.info(f"WHOIS lookup completed for {domain}")
+        return {
+            'success': True,
+            'whois_data': build_whois_data(domain, record)
+        }
+
+    except socket.timeout:
+        logger.error(f"WHOIS timeout for {domain}")
+        return {
+            'success': False,
+            'error': 'WHOIS lookup timed out',
+            'domain': domain
+        }
+    except OSError as e:
+        logger.error(f"WHOIS connection error for {domain}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'WHOIS connection error: {str(e)}',
+            'domain': domain
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error in WHOIS lookup for {domain}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'domain': domain
+        }
+
+async def get_whois_data_async(domain: str, backend: Optional[str] = None) -> Dict:
+    backend = backend or domain_routes.WHOIS_BACKEND
+    if backend != 'socket':
+        # python-whois has no async API, RDAP runs on the pooled requests session
+        return await asyncio.to_thread(domain_routes.get_whois_data, domain, backend)
+    key = domain.lower() if backend == domain_routes.WHOIS_BACKEND else f'{domain.lower()}|{backend}'
+    hot_keys.record('whois', key, functools.partial(domain_routes.fetch_whois_data, domain, backend))
+
+    async def fetch():
+        result, _ = await whois_flight.do(key, fetch_whois_socket_async, domain)
+        return result
+
+    return await cached_call_async('whois', key, fetch)
+
+async def resolve_dns_records_async(domain: str, record_type: str) -> List:
+    try:
+        with track_upstream('dns'):
+            answer = await get_async_dns_resolver().resolve(domain, record_type, raise_on_no_answer=False)
+        return format_dns_answer(answer, record_type)
+    except dns.resolver.NXDOMAIN:
+        return []
+    except (dns.exception.Timeout, dns.resolver.NoNameservers) as e:
+        logger.warning(f"DNS {record_type} lookup failed for {domain}: {str(e)}")
+        return []
+    except Exception as e:
+        logger.error(f"Error resolving {record_type} records for {domain}: {str(e)}")
+        return []
+
+async def get_dns_records_async(domain: str) -> Dict[str, List]:
+    get_async_dns_resolver()
+    answers = await asyncio.gather(*(resolve_dns_records_async(domain, record_type)
+                                     for record_type in DNS_RECORD_TYPES))
+    return dict(zip(DNS_RECORD_TYPES, answers))
+
+async def get_dns_records_or_error_async(domain: str) -> Tuple[Dict[str, List], Optional[str]]:
+    """
+    DNS records and None, or empty records and the reason DNS is unavailable
+    """
+    try:
+        return await get_dns_records_async(domain), None
+    except DNSResolverUnavailable as e:
+        logger.error(f"DNS lookup unavailable for {domain}: {str(e)}")
+        return empty_dns_records(), str(e)
+
+async def domain_lookup(request: Request) -> JSONResponse:
+    """
+    GET /api/domain?domain=...[&whois=socket|python-whois|rdap]
+    """
+    try:
+        logger.info(f"Domain lookup request received: {dict(request.query_params)}")
+        domain = request.query_params.get('domain')
+        if not domain:
+            return error_response('Domain parameter is required', 400)
+
+        domain = normalize_domain(domain)
+        if not validate_domain(domain):
+            return error_response('Invalid domain format', 400)
+
+        whois_backend = request.query_params.get('whois')
+        error = validate_whois_backend(whois_backend)
+        if error:
+            return error_response(error, 400)
+
+        (dns_records, dns_error), whois_result = await asyncio.gather(
+            get_dns_records_or_error_async(domain),
+            get_whois_data_async(domain, whois_backend)
+        )
+        return JSONResponse(format_domain_result(domain, dns_records, whois_result, dns_error), status_code=200)
+
+    except Exception as e:
+        logger.error(f"Error in domain_lookup: {str(e)}")
+        return error_response(f'Internal server error: {str(e)}', 500)
+
+# Sherlock
+
+async def run_sherlock_subprocess_async(username: str, timeout: int, sites: Optional[List[str]] = None,
+                                        partial: bool = False) -> Dict:
+    """
+    Run the Sherlock CLI on the shared worker pool without blocking the event loop
+    Raises QueueFullError when the worker pool is full
+    """
+    return await asyncio.to_thread(sherlock_routes.run_sherlock_subprocess, username, timeout, None, sites, partial)
+
+async def get_sherlock_results_async(username: str, timeout: int = 300, options: Optional[ScanOptions] = None) -> Dict:
+    """
+    Async counterpart of get_sherlock_results sharing its result cache
+    """
+    options = options or ScanOptions()
+    if sherlock_routes.SHERLOCK_ENGINE == 'native' and sherlock_routes.get_sherlock_engine() is not None:
+        # The native engine does its own concurrent I/O on a bounded pool
+        return await asyncio.to_thread(sherlock_routes.get_sherlock_results, username, timeout, None, options)
+
+    key = options.cache_key(normalize_username(username))
+    if options.deadline:
+        timeout = min(timeout, options.deadline)
+    partial = options.deadline is not None
+    if not partial:
+        hot_keys.record('sherlock', key,
+                        functools.partial(sherlock_routes.run_sherlock_with_timeout, username, timeout=timeout,
+                                          sites=scan_sites(options), pinned=options.sites),
+                        cacheable=is_complete_scan, ttl_for=sherlock_cache_ttl)
+    cached = sherlock_cache.get(key)
+    if cached is not None:
+        result, age = cached
+        result = dict(result)
+        result['cached'] = True
+        result['cache_age'] = round(age, 1)
+        return result
+
+    persistent = get_persistent_cache()
+    entry = await asyncio.to_thread(persistent.get, 'sherlock', key) if persistent else None
+    if entry is not None:
+        result, age, stale = entry
+        if stale:
+            await asyncio.to_thread(
+                revalidate, 'sherlock', key,
+                lambda: sherlock_routes.run_sherlock_with_timeout(username, timeout=timeout, sites=scan_sites(options),
+                                                                  partial=partial, pinned=options.sites),
+                cacheable=is_complete_scan, ttl_for=sherlock_cache_ttl)
+        result = dict(result)
+        result['cached'] = True
+        result['cache_age'] = round(age, 1)
+        return result
+
+    async def run_and_cache():
+        sites = scan_sites(options)
+        if sites is not None and not sites:
+            return {'success': True, 'username': username.strip(), 'results': [], 'total_found': 0}
+        with track_upstream('sherlock') as call:
+            scan = await run_sherlock_subprocess_async(username.strip(), timeout, sites, partial)
+            if not scan['success'] or scan.get('partial'):
+                call.outcome = 'timeout'
+            elif 'note' in scan:
+                call.outcome = 'failed'
+        if is_complete_scan(scan):
+            sherlock_cache.set(key, scan, negative=scan['total_found'] == 0)
+            if persistent:
+                await asyncio.to_thread(persistent.set, 'sherlock', key, scan, ttl=sherlock_cache_ttl(scan))
+        return scan
+
+    flight_key = f'{key}|deadline={options.deadline}' if options.deadline else key
+    result, _ = await sherlock_flight.do(flight_key, run_and_cache)
+    result = dict(result)
+    result['cached'] = False
+    result['cache_age'] = 0
+    return result
+
+async def sherlock_search(request: Request) -> JSONResponse:
+    """
+    GET /api/sherlock?username=...
+    """
+    try:
+        logger.info(f"Sherlock request received: {dict(request.query_params)}")
+        username = request.query_params.get('username')
+        if not username or not username.strip():
+            return error_response('Username parameter is required', 400)
+
+        try:
+            options = scan_options_from_args(request.query_params)
+        except ValueError as e:
+            return error_response(str(e), 400)
+
+        try:
+            result = await get_sherlock_results_async(username, options=options)
+        except QueueFullError as e:
+            logger.warning(f"Rejecting Sherlock search for {username}: {str(e)}")
+            return JSONResponse({'success': False, 'error': 'Sherlock workers are busy, please retry later'},
+                                status_code=503, headers={'Retry-After': '30'})
+        return JSONResponse(result, status_code=200 if result['success'] else 500)
+
+    except Exception as e:
+        logger.error(f"Error in sherlock_search: {str(e)}")
+        return error_response(f'Internal server error: {str(e)}', 500)
+
+async def health_check(request: Request) -> JSONResponse:
+    return JSONResponse({
+        'status': 'healthy',
+        'message': 'OSINT Backend is running',
+        'rate_limits': rate_limit_stats(),
+        'circuits': circuit_stats(),
+        'persistent_cache': persistent_cache_stats(),
+        'sherlock_workers': sherlock_workers.stats(),
+        'hot_keys': hot_keys.stats()
+    })
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    clients['emailrep'] = build_async_client()
+    clients['ipwhois'] = build_async_client()
+    clients['gravatar'] = build_async_client()
+    try:
+        yield
+    finally:
+        for client in clients.values():
+            await client.aclose()
+        clients.clear()
+
+def cors_origin_regex(origins: List[str]) -> str:
+    """
+    Single regex for the allowed origins, '*' matching one subdomain label
+    """
+    patterns = [re.escape(origin).replace(r'\*', r'[^./]+') for origin in origins]
+    return '^(?:' + '|'.join(patterns) + ')$'
+
+def timed(path: str, endpoint):
+    """
+    Record the same request metrics as the Flask app
+    """
+    @functools.wraps(endpoint)
+    async def handler(request: Request):
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await endpoint(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(request.method, path, str(status)).observe(time.perf_counter() - start)
+    return handler
+
+def async_route(path: str, endpoint) -> Route:
+    # CORS is applied per route, the mounted Flask app handles its own
+    return Route(path, timed(path, endpoint), methods=['GET', 'OPTIONS'], middleware=[
+        Middleware(CORSMiddleware, allow_origin_regex=cors_origin_regex(CORS_ORIGINS), allow_methods=['GET'])
+    ])
+
+app = Starlette(
+    routes=[
+        async_route('/health', health_check),
+        async_route('/api/email', email_lookup),
+        async_route('/api/ip', ip_lookup),
+        async_route('/api/domain', domain_lookup),
+        async_route('/api/sherlock', sherlock_search),
+        Mount('/', app=WSGIMiddleware(create_app()))
+    ],
+    lifespan=lifespan
+)
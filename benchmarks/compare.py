@@ -0,0 +1,43 @@
+"""
+Compare two benchmark result files
+
+    python -m benchmarks.compare baseline.json current.json
+"""
+import json
+import sys
+from typing import Dict, Optional
+
+def load(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def change(old: Optional[float], new: Optional[float]) -> str:
+    if not old or new is None:
+        return 'n/a'
+    return f'{(new - old) / old * 100:+.1f}%'
+
+def compare(baseline: Dict, current: Dict) -> str:
+    """
+    Table of throughput and latency changes for every endpoint and concurrency level in both runs
+    """
+    previous = {(r['endpoint'], r['concurrency']): r for r in baseline['results']}
+    lines = [
+        f"{'endpoint':<10} {'conc':>5} {'rps':>18} {'change':>8} {'p95 ms':>18} {'change':>8} {'p99 ms':>18} {'change':>8}"
+    ]
+    for result in current['results']:
+        old = previous.get((result['endpoint'], result['concurrency']))
+        if old is None:
+            continue
+        lines.append(
+            f"{result['endpoint']:<10} {result['concurrency']:>5} "
+            f"{old['rps']:>8.1f} -> {result['rps']:>6.1f} {change(old['rps'], result['rps']):>8} "
+            f"{old['p95_ms']:>8.1f} -> {result['p95_ms']:>6.1f} {change(old['p95_ms'], result['p95_ms']):>8} "
+            f"{old['p99_ms']:>8.1f} -> {result['p99_ms']:>6.1f} {change(old['p99_ms'], result['p99_ms']):>8}"
+        )
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print('Usage: python -m benchmarks.compare <baseline.json> <current.json>')
+        sys.exit(1)
+    print(compare(load(sys.argv[1]), load(sys.argv[2])))
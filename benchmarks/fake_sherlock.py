@@ -0,0 +1,39 @@
+"""
+Stand-in for the Sherlock CLI, printing results in Sherlock's output format
+
+    SHERLOCK_ENGINE=subprocess SHERLOCK_MODULE=benchmarks.fake_sherlock
+
+FAKE_SHERLOCK_SITES sites (or the --site arguments) are "checked"
+FAKE_SHERLOCK_LATENCY seconds apart, and a run fails with
+FAKE_SHERLOCK_ERROR_RATE probability.
+"""
+import os
+import random
+import sys
+import time
+
+def main():
+    if len(sys.argv) < 2:
+        print('usage: fake_sherlock USERNAME [--timeout SECONDS] [--site NAME ...]', file=sys.stderr)
+        sys.exit(2)
+
+    username = sys.argv[1]
+    names = [sys.argv[i + 1] for i, arg in enumerate(sys.argv[:-1]) if arg == '--site']
+    sites = names or [f'Site{index}' for index in range(int(os.getenv('FAKE_SHERLOCK_SITES', '20')))]
+    latency = float(os.getenv('FAKE_SHERLOCK_LATENCY', '0.01'))
+    error_rate = float(os.getenv('FAKE_SHERLOCK_ERROR_RATE', '0'))
+
+    print(f'[*] Checking username {username} on:', flush=True)
+    for index, site in enumerate(sites):
+        time.sleep(latency)
+        # Roughly a third of the sites report an account
+        if index % 3 == 0:
+            print(f'[+] {site}: https://{site.lower()}.example/{username}', flush=True)
+
+    if random.random() < error_rate:
+        print('simulated Sherlock failure', file=sys.stderr)
+        sys.exit(1)
+    print(f'[*] Search completed with {(len(sites) + 2) // 3} results', flush=True)
+
+if __name__ == '__main__':
+    main()
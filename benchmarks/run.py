@@ -0,0 +1,303 @@
+"""
+Offline benchmark: starts stub upstreams and the app, then drives each
+endpoint at fixed concurrency levels
+
+    python -m benchmarks.run --concurrency 1,8,32 --duration 10 --output results.json
+    python -m benchmarks.run --server uvicorn --compare results.json
+
+Reports requests per second, p50/p95/p99 latency, errors and the peak RSS of
+the server process tree, and writes everything to a JSON file.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from benchmarks.compare import compare, load
+from benchmarks.stubs import StubUpstreams
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENDPOINTS: Dict[str, Callable[[int], str]] = {
+    'email': lambda i: f'/api/email?email=user{i}@example.com',
+    'ip': lambda i: f'/api/ip?ip=10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}',
+    'domain': lambda i: f'/api/domain?domain=site{i}.com',
+    'sherlock': lambda i: f'/api/sherlock?username=user{i}'
+}
+
+# Keep benchmark numbers about the serving path, not the guards in front of upstreams
+DEFAULT_APP_ENV = {
+    'PERSISTENT_CACHE': 'false',
+    'GEO_PREFIX_CACHE': 'false',
+    'RATE_LIMIT_EMAILREP': '0',
+    'RATE_LIMIT_IPWHOIS': '0',
+    'SHERLOCK_ENGINE': 'subprocess',
+    'SHERLOCK_MODULE': 'benchmarks.fake_sherlock',
+    'SHERLOCK_PRELOAD': '',
+    'SHERLOCK_MAX_QUEUED': '1000'
+}
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def process_tree_rss(pid: int) -> int:
+    """
+    Resident memory in bytes of pid and all its descendants (Linux only, 0 elsewhere)
+    """
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir('/proc') if os.path.isdir('/proc') else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+class Server:
+    """
+    The app under test, running as a child process
+    """
+
+    def __init__(self, kind: str, workers: int, threads: int, env: Dict[str, str]):
+        self.port = free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+        if kind == 'uvicorn':
+            cmd = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(self.port),
+                   '--workers', str(workers), '--log-level', 'warning']
+        else:
+            cmd = [sys.executable, '-m', 'gunicorn', 'app:create_app()', '--bind', f'127.0.0.1:{self.port}',
+                   '--workers', str(workers), '--threads', str(threads), '--timeout', '300']
+        self.log = tempfile.NamedTemporaryFile(prefix='osint-bench-', suffix='.log', delete=False)
+        self.process = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout: float = 60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited with {self.process.returncode}, see {self.log.name}')
+            try:
+                if requests.get(f'{self.base_url}/health', timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f'Server did not become ready, see {self.log.name}')
+
+    def rss(self) -> int:
+        return process_tree_rss(self.process.pid)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+def run_level(server: Server, endpoint: str, concurrency: int, duration: float,
+              keys: itertools.count, hot_keys: int, request_timeout: float) -> Dict:
+    """
+    Drive one endpoint with concurrency clients for duration seconds
+    """
+    path_for = ENDPOINTS[endpoint]
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+    peak_rss = server.rss()
+    done = threading.Event()
+
+    def sample_memory():
+        nonlocal peak_rss
+        while not done.wait(0.25):
+            peak_rss = max(peak_rss, server.rss())
+
+    def client():
+        nonlocal errors
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            key = next(keys)
+            url = server.base_url + path_for(key % hot_keys if hot_keys else key)
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout=request_timeout)
+                ok = response.status_code == 200 and response.json().get('success', False)
+            except (requests.RequestException, ValueError):
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    elapsed = time.monotonic() - started
+    done.set()
+    sampler.join()
+
+    latencies.sort()
+    return {
+        'endpoint': endpoint,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1)
+    }
+
+def parse_upstream_profiles(args) -> Dict[str, Dict]:
+    profiles = {'default': {'latency': args.latency, 'error_rate': args.error_rate}}
+    for spec in args.upstream:
+        # NAME=LATENCY[:ERROR_RATE]
+        name, _, values = spec.partition('=')
+        latency, _, error_rate = values.partition(':')
+        profile = profiles.setdefault(name, {})
+        if latency:
+            profile['latency'] = float(latency)
+        if error_rate:
+            profile['error_rate'] = float(error_rate)
+    return profiles
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the API against local stub upstreams')
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--endpoints', default='email,ip,domain,sherlock')
+    parser.add_argument('--concurrency', default='1,8,32', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per endpoint and level')
+    parser.add_argument('--hot-keys', type=int, default=0,
+                        help='cycle through this many distinct keys (0 = every request is a new key)')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub upstream latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='stub upstream error rate')
+    parser.add_argument('--upstream', action='append', default=[], metavar='NAME=LATENCY[:ERROR_RATE]',
+                        help='override for emailrep, ipwhois, whois or dns')
+    parser.add_argument('--sherlock-latency', type=float, default=0.01, help='fake Sherlock delay per site')
+    parser.add_argument('--sherlock-sites', type=int, default=20)
+    parser.add_argument('--sherlock-error-rate', type=float, default=0.0)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app environment')
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help='print changes against an earlier result file')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    stubs = StubUpstreams(parse_upstream_profiles(args))
+    stubs.start()
+
+    env = dict(os.environ)
+    env.update(DEFAULT_APP_ENV)
+    env.update(stubs.app_env())
+    env.update({
+        'FAKE_SHERLOCK_LATENCY': str(args.sherlock_latency),
+        'FAKE_SHERLOCK_SITES': str(args.sherlock_sites),
+        'FAKE_SHERLOCK_ERROR_RATE': str(args.sherlock_error_rate),
+        'PROMETHEUS_MULTIPROC_DIR': tempfile.mkdtemp(prefix='osint-bench-metrics-')
+    })
+    env.pop('GEOIP_DB_PATH', None)
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+
+    server = Server(args.server, args.workers, args.threads, env)
+    results = []
+    try:
+        server.wait_ready()
+        idle_rss = server.rss()
+        keys = itertools.count()
+        for endpoint in endpoints:
+            for level in levels:
+                result = run_level(server, endpoint, level, args.duration, keys, args.hot_keys, args.request_timeout)
+                results.append(result)
+                print(f"{endpoint:<10} c={level:<4} {result['rps']:>8.1f} rps  "
+                      f"p50 {result['p50_ms']:>8.1f}ms  p95 {result['p95_ms']:>8.1f}ms  "
+                      f"p99 {result['p99_ms']:>8.1f}ms  errors {result['errors']:<5} "
+                      f"rss {result['peak_rss_mb']:.0f}MB", flush=True)
+    finally:
+        server.stop()
+        stubs.stop()
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'server': args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'duration': args.duration,
+            'hot_keys': args.hot_keys,
+            'upstreams': parse_upstream_profiles(args),
+            'sherlock': {'latency': args.sherlock_latency, 'sites': args.sherlock_sites,
+                         'error_rate': args.sherlock_error_rate},
+            'env': dict(item.partition('=')[::2] for item in args.env),
+            'idle_rss_mb': round(idle_rss / (1024 * 1024), 1)
+        },
+        'upstream_requests': stubs.stats(),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    if args.compare:
+        print(compare(load(args.compare), report))
+
+if __name__ == '__main__':
+    main()
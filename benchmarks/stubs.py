@@ -0,0 +1,209 @@
+"""
+Local stand-ins for the upstreams, with configurable latency and error rate
+
+- HTTP server answering emailrep.io (/emailrep/<email>) and ipwho.is (/ipwhois/<ip>)
+- WHOIS server speaking the port 43 protocol
+- DNS server answering A, AAAA, MX, NS and TXT queries for any name
+"""
+import json
+import random
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+DEFAULT_PROFILE = {'latency': 0.05, 'jitter': 0.2, 'error_rate': 0.0}
+
+WHOIS_TEMPLATE = """   Domain Name: {domain}
+   Registry Domain ID: 1234567_DOMAIN_COM-VRSN
+   Registrar: Benchmark Registrar, Inc.
+   Updated Date: 2024-08-14T07:01:34Z
+   Creation Date: 1995-08-14T04:00:00Z
+   Registry Expiry Date: 2030-08-13T04:00:00Z
+   Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+   Name Server: NS1.{domain}
+   Name Server: NS2.{domain}
+   DNSSEC: unsigned
+"""
+
+DNS_ANSWERS = {
+    dns.rdatatype.A: '93.184.216.34',
+    dns.rdatatype.AAAA: '2606:2800:220:1:248:1893:25c8:1946',
+    dns.rdatatype.MX: '10 mail.{name}',
+    dns.rdatatype.NS: 'ns1.{name}',
+    dns.rdatatype.TXT: '"v=spf1 -all"'
+}
+
+class Upstream:
+    """
+    Latency and error behaviour of one stub upstream, with request counters
+    """
+
+    def __init__(self, name: str, latency: float, jitter: float, error_rate: float):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def serve(self) -> bool:
+        """
+        Wait out the simulated latency, returns False when this request should fail
+        """
+        delay = self.latency * random.uniform(1 - self.jitter, 1 + self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.errors += 1
+        return not failed
+
+    def stats(self) -> Dict:
+        return {'requests': self.requests, 'errors': self.errors}
+
+def make_http_handler(upstreams: Dict[str, Upstream]):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, status: int, body: Dict):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            name, _, key = self.path.lstrip('/').partition('/')
+            upstream = upstreams.get(name)
+            if upstream is None:
+                self.send_json(404, {'error': 'unknown upstream'})
+                return
+            if not upstream.serve():
+                self.send_json(503, {'error': 'simulated failure'})
+                return
+
+            if name == 'emailrep':
+                self.send_json(200, {
+                    'email': key,
+                    'reputation': 'medium',
+                    'suspicious': False,
+                    'references': 3,
+                    'details': {'blacklisted': False, 'malicious_activity': False, 'free_provider': True}
+                })
+            else:
+                self.send_json(200, {
+                    'ip': key,
+                    'success': True,
+                    'type': 'IPv4',
+                    'continent': 'North America',
+                    'country': 'United States',
+                    'country_code': 'US',
+                    'city': 'Mountain View',
+                    'latitude': 37.386,
+                    'longitude': -122.0838,
+                    'timezone': {'id': 'America/Los_Angeles'},
+                    'connection': {'asn': 15169, 'org': 'Benchmark', 'isp': 'Benchmark ISP'}
+                })
+
+    return Handler
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def make_whois_handler(upstream: Upstream):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            domain = self.rfile.readline().decode('utf-8', errors='replace').strip()
+            if upstream.serve():
+                self.wfile.write(WHOIS_TEMPLATE.format(domain=domain.upper()).encode('utf-8'))
+
+    return Handler
+
+def serve_dns(sock: socket.socket, upstream: Upstream):
+    def answer(data: bytes, address):
+        try:
+            query = dns.message.from_wire(data)
+        except Exception:
+            return
+        response = dns.message.make_response(query)
+        if not upstream.serve():
+            response.set_rcode(dns.rcode.SERVFAIL)
+        else:
+            question = query.question[0]
+            value = DNS_ANSWERS.get(question.rdtype)
+            if value is not None:
+                name = question.name.to_text()
+                response.answer.append(dns.rrset.from_text(
+                    question.name, 300, 'IN', dns.rdatatype.to_text(question.rdtype), value.format(name=name)
+                ))
+        sock.sendto(response.to_wire(), address)
+
+    while True:
+        try:
+            data, address = sock.recvfrom(4096)
+        except OSError:
+            return
+        threading.Thread(target=answer, args=(data, address), daemon=True).start()
+
+class StubUpstreams:
+    """
+    All stub servers, bound to free ports on 127.0.0.1
+    """
+
+    def __init__(self, profiles: Dict[str, Dict]):
+        def upstream(name: str) -> Upstream:
+            profile = dict(DEFAULT_PROFILE, **profiles.get('default', {}))
+            profile.update(profiles.get(name, {}))
+            return Upstream(name, **profile)
+
+        self.upstreams = {name: upstream(name) for name in ('emailrep', 'ipwhois', 'whois', 'dns')}
+
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), make_http_handler(self.upstreams))
+        self.http.daemon_threads = True
+        self.whois = ThreadingTCPServer(('127.0.0.1', 0), make_whois_handler(self.upstreams['whois']))
+        self.dns = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.dns.bind(('127.0.0.1', 0))
+
+    def start(self):
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+        threading.Thread(target=self.whois.serve_forever, daemon=True).start()
+        threading.Thread(target=serve_dns, args=(self.dns, self.upstreams['dns']), daemon=True).start()
+
+    def stop(self):
+        self.http.shutdown()
+        self.whois.shutdown()
+        self.dns.close()
+
+    def app_env(self) -> Dict[str, str]:
+        """
+        Environment pointing the app at these stubs
+        """
+        http_port = self.http.server_address[1]
+        return {
+            'EMAILREP_URL': f'http://127.0.0.1:{http_port}/emailrep/{{}}',
+            'IPWHOIS_URL': f'http://127.0.0.1:{http_port}/ipwhois/{{}}',
+            'WHOIS_SERVER': '127.0.0.1',
+            'WHOIS_PORT': str(self.whois.server_address[1]),
+            'DNS_NAMESERVERS': '127.0.0.1',
+            'DNS_PORT': str(self.dns.getsockname()[1])
+        }
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: upstream.stats() for name, upstream in self.upstreams.items()}
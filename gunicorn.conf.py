@@ -0,0 +1,23 @@
+"""
+Gunicorn settings, loaded automatically from the working directory
+
+Workers share Prometheus metrics through files in PROMETHEUS_MULTIPROC_DIR.
+"""
+import os
+import shutil
+
+from utils.state_dir import app_state_dir, private_dir
+
+# Must be set before the workers import prometheus_client
+if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(app_state_dir(), 'prometheus')
+
+def on_starting(server):
+    # Samples from a previous run would be added to the new totals
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    private_dir(path)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,12 +1,222 @@
 from flask import Blueprint, request, jsonify
 import whois
 import logging
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Sequence
 import socket
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import functools
+import threading
+import dns.exception
+import dns.resolver
+import requests
+from utils.batch import get_batch_items, run_batch
+from utils.hot_keys import hot_keys
+from utils.http_client import HTTP_TIMEOUT
+from utils.metrics import track_upstream
+from utils.persistent_cache import cached_call
+from utils.rdap import rdap_bootstrap, rdap_session
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 domain_bp = Blueprint('domain', __name__)
 
+# Concurrent lookups for the same domain share one WHOIS query
+whois_flight = SingleFlight('whois')
+
+# DNS and WHOIS run side by side for each domain lookup
+domain_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DOMAIN_LOOKUP_WORKERS', '8')),
+    thread_name_prefix='domain-lookup'
+)
+
+DNS_RECORD_TYPES = ('A', 'AAAA', 'MX', 'NS', 'TXT')
+DNS_TIMEOUT = float(os.getenv('DNS_TIMEOUT', '3'))
+
+# Record types are queried concurrently on their own pool so they never
+# wait behind the WHOIS lookups above
+dns_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DNS_QUERY_WORKERS', '16')),
+    thread_name_prefix='dns-query'
+)
+
+class DNSResolverUnavailable(Exception):
+    pass
+
+def dns_nameservers() -> List[str]:
+    """
+    Nameservers from DNS_NAMESERVERS, empty to use the system configuration
+    """
+    return [ns.strip() for ns in os.getenv('DNS_NAMESERVERS', '').split(',') if ns.strip()]
+
+def configure_dns_resolver(resolver):
+    """
+    Apply the nameserver, timeout and TTL-respecting cache settings to a
+    dnspython resolver (sync or async)
+    """
+    nameservers = dns_nameservers()
+    if nameservers:
+        resolver.nameservers = nameservers
+    resolver.port = int(os.getenv('DNS_PORT', '53'))
+    resolver.timeout = DNS_TIMEOUT
+    resolver.lifetime = DNS_TIMEOUT
+    resolver.cache = dns.resolver.LRUCache(int(os.getenv('DNS_CACHE_SIZE', '10000')))
+    return resolver
+
+def create_dns_resolver(resolver_class=dns.resolver.Resolver):
+    """
+    Build a configured resolver of resolver_class (sync or async)
+    With DNS_NAMESERVERS set the system configuration is not read at all.
+    Raises DNSResolverUnavailable when neither is available
+    """
+    if dns_nameservers():
+        return configure_dns_resolver(resolver_class(configure=False))
+    try:
+        return configure_dns_resolver(resolver_class())
+    except dns.resolver.NoResolverConfiguration as e:
+        raise DNSResolverUnavailable(f'No system DNS configuration ({str(e) or "no nameservers"}), set DNS_NAMESERVERS') from e
+
+_dns_resolver = None
+_dns_resolver_lock = threading.Lock()
+
+def get_dns_resolver():
+    """
+    Shared resolver, built on first use so a host without DNS configuration
+    can still start the app
+    """
+    global _dns_resolver
+    if _dns_resolver is not None:
+        return _dns_resolver
+
+    with _dns_resolver_lock:
+        if _dns_resolver is None:
+            _dns_resolver = create_dns_resolver()
+    return _dns_resolver
+
+# 'socket' queries WHOIS servers directly, 'python-whois' uses the library,
+# 'rdap' queries the registry's RDAP service (WHOIS for TLDs without one)
+WHOIS_BACKENDS = ('socket', 'python-whois', 'rdap')
+WHOIS_BACKEND = os.getenv('WHOIS_BACKEND', 'socket').lower()
+WHOIS_PORT = int(os.getenv('WHOIS_PORT', '43'))
+# Send every query to this server instead of the TLD's registry (for testing)
+WHOIS_SERVER = os.getenv('WHOIS_SERVER')
+WHOIS_TIMEOUT = float(os.getenv('WHOIS_TIMEOUT', '5'))
+WHOIS_MAX_REFERRALS = int(os.getenv('WHOIS_MAX_REFERRALS', '1'))
+WHOIS_MAX_RESPONSE_BYTES = 256 * 1024
+IANA_WHOIS_SERVER = 'whois.iana.org'
+
+# Registry WHOIS servers for common TLDs, anything else is looked up at IANA once
+WHOIS_SERVERS = {
+    'com': 'whois.verisign-grs.com',
+    'net': 'whois.verisign-grs.com',
+    'org': 'whois.pir.org',
+    'info': 'whois.nic.info',
+    'biz': 'whois.nic.biz',
+    'io': 'whois.nic.io',
+    'co': 'whois.nic.co',
+    'me': 'whois.nic.me',
+    'tv': 'whois.nic.tv',
+    'cc': 'ccwhois.verisign-grs.com',
+    'xyz': 'whois.nic.xyz',
+    'app': 'whois.nic.google',
+    'dev': 'whois.nic.google',
+    'ai': 'whois.nic.ai',
+    'us': 'whois.nic.us',
+    'uk': 'whois.nic.uk',
+    'eu': 'whois.eu',
+    'de': 'whois.denic.de',
+    'fr': 'whois.nic.fr',
+    'nl': 'whois.domain-registry.nl',
+    'it': 'whois.nic.it',
+    'es': 'whois.nic.es',
+    'ch': 'whois.nic.ch',
+    'se': 'whois.iis.se',
+    'ca': 'whois.cira.ca',
+    'au': 'whois.auda.org.au',
+    'in': 'whois.registry.in',
+    'jp': 'whois.jprs.jp',
+    'br': 'whois.registro.br',
+    'ru': 'whois.tcinet.ru',
+    'edu': 'whois.educause.edu',
+    'gov': 'whois.dotgov.gov'
+}
+_discovered_servers: Dict[str, str] = {}
+
+# Servers that need a non-default query syntax
+WHOIS_QUERY_FORMATS = {
+    'whois.denic.de': '-T dn,ace {}',
+    'whois.jprs.jp': '{}/e'
+}
+
+def whois_field_pattern(*labels: str):
+    return re.compile(r'^[ \t]*(?:' + '|'.join(labels) + r')[ \t]*:[ \t]*(\S.*?)[ \t]*$', re.IGNORECASE | re.MULTILINE)
+
+# Precompiled extractors, keyed by the attribute names python-whois uses
+WHOIS_FIELD_PATTERNS = {
+    'registrar': whois_field_pattern('Registrar', 'Sponsoring Registrar', 'Registrar Name'),
+    'creation_date': whois_field_pattern('Creation Date', 'Created On', 'Created', 'Registered On', 'Registration Time', 'Domain Registration Date'),
+    'expiration_date': whois_field_pattern('Registry Expiry Date', 'Registrar Registration Expiration Date', 'Expiration Date', 'Expiry Date', 'Expires On', 'paid-till'),
+    'updated_date': whois_field_pattern('Updated Date', 'Last Updated On', 'Last Modified', 'changed'),
+    'status': whois_field_pattern('Domain Status', 'Status', 'state'),
+    'name_servers': whois_field_pattern('Name Server', 'Nameserver', 'nserver'),
+    'dnssec': whois_field_pattern('DNSSEC'),
+    'registrant_name': whois_field_pattern('Registrant Name'),
+    'registrant_organization': whois_field_pattern('Registrant Organization', 'Registrant Organisation'),
+    'registrant_email': whois_field_pattern('Registrant Email'),
+    'registrant_phone': whois_field_pattern('Registrant Phone'),
+    'registrant_address': whois_field_pattern('Registrant Street'),
+    'admin_name': whois_field_pattern('Admin Name'),
+    'admin_organization': whois_field_pattern('Admin Organization', 'Admin Organisation'),
+    'admin_email': whois_field_pattern('Admin Email'),
+    'admin_phone': whois_field_pattern('Admin Phone'),
+    'admin_address': whois_field_pattern('Admin Street'),
+    'tech_name': whois_field_pattern('Tech Name'),
+    'tech_organization': whois_field_pattern('Tech Organization', 'Tech Organisation'),
+    'tech_email': whois_field_pattern('Tech Email'),
+    'tech_phone': whois_field_pattern('Tech Phone'),
+    'tech_address': whois_field_pattern('Tech Street')
+}
+WHOIS_DATE_FIELDS = ('creation_date', 'expiration_date', 'updated_date')
+WHOIS_LIST_FIELDS = ('status', 'name_servers')
+WHOIS_DATE_FORMATS = (
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d',
+    '%d-%b-%Y',
+    '%d.%m.%Y',
+    '%Y.%m.%d',
+    '%Y/%m/%d'
+)
+WHOIS_REFERRAL_PATTERN = re.compile(r'^[ \t]*(?:Registrar WHOIS Server|ReferralServer|Whois Server)[ \t]*:[ \t]*(\S+)', re.IGNORECASE | re.MULTILINE)
+WHOIS_NOT_FOUND_PATTERN = re.compile(r'^\s*(?:No match for|NOT FOUND|No Data Found|Domain not found|No entries found|Status:\s*free)', re.IGNORECASE | re.MULTILINE)
+IANA_REFER_PATTERN = re.compile(r'^whois:[ \t]*(\S+)', re.IGNORECASE | re.MULTILINE)
+
+# RDAP event actions and entity roles, mapped to the python-whois attribute names
+RDAP_EVENT_FIELDS = {
+    'registration': 'creation_date',
+    'expiration': 'expiration_date',
+    'last changed': 'updated_date'
+}
+RDAP_CONTACT_ROLES = {
+    'registrant': 'registrant',
+    'administrative': 'admin',
+    'technical': 'tech'
+}
+
+class WhoisRecord(dict):
+    """
+    Parsed WHOIS fields with python-whois style attribute access
+    """
+
+    def __getattr__(self, name):
+        return self.get(name)
+
 def validate_domain(domain: str) -> bool:
     """
     Basic domain validation
@@ -16,11 +226,74 @@ def validate_domain(domain: str) -> bool:
     pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?)*$'
     return re.match(pattern, domain) is not None
 
+def resolve_dns_records(domain: str, record_type: str) -> List:
+    """
+    Resolve one record type, returning an empty list when there is no answer
+    """
+    with track_upstream('dns'):
+        answer = get_dns_resolver().resolve(domain, record_type, raise_on_no_answer=False)
+    return format_dns_answer(answer, record_type)
+
+def format_dns_answer(answer, record_type: str) -> List:
+    """
+    Convert a dnspython answer into JSON-friendly values
+    """
+    if answer.rrset is None:
+        return []
+    
+    records = []
+    for rdata in answer:
+        if record_type in ('A', 'AAAA'):
+            records.append(rdata.address)
+        elif record_type == 'MX':
+            records.append({
+                'preference': rdata.preference,
+                'exchange': rdata.exchange.to_text().rstrip('.')
+            })
+        elif record_type == 'NS':
+            records.append(rdata.target.to_text().rstrip('.'))
+        elif record_type == 'TXT':
+            records.append(b''.join(rdata.strings).decode('utf-8', errors='replace'))
+        else:
+            records.append(rdata.to_text())
+    return records
+
+def get_dns_records(domain: str, record_types: Sequence[str] = DNS_RECORD_TYPES) -> Dict[str, List]:
+    """
+    Resolve several record types for domain concurrently
+    Raises DNSResolverUnavailable when there is no resolver to ask
+    """
+    get_dns_resolver()
+    futures = {
+        record_type: dns_executor.submit(resolve_dns_records, domain, record_type)
+        for record_type in record_types
+    }
+    
+    records = {}
+    for record_type, future in futures.items():
+        try:
+            records[record_type] = future.result()
+        except dns.resolver.NXDOMAIN:
+            records[record_type] = []
+        except (dns.exception.Timeout, dns.resolver.NoNameservers) as e:
+            logger.warning(f"DNS {record_type} lookup failed for {domain}: {str(e)}")
+            records[record_type] = []
+        except Exception as e:
+            logger.error(f"Error resolving {record_type} records for {domain}: {str(e)}")
+            records[record_type] = []
+    return records
+
 def get_domain_ip(domain: str) -> Optional[str]:
     """
     Get IP address for domain
     """
     try:
+        try:
+            addresses = get_dns_records(domain, ('A',))['A']
+        except DNSResolverUnavailable:
+            addresses = []
+        if addresses:
+            return addresses[0]
         ip = socket.gethostbyname(domain)
         return ip
     except socket.gaierror:
@@ -29,65 +302,271 @@ def get_domain_ip(domain: str) -> Optional[str]:
         logger.error(f"Error getting IP for domain {domain}: {str(e)}")
         return None
 
-def get_whois_data(domain: str) -> Dict:
+def get_whois_data(domain: str, backend: Optional[str] = None) -> Dict:
     """
-    Get WHOIS data for domain using python-whois
+    Get WHOIS data for domain from the persistent cache, coalescing concurrent
+    lookups for the same domain on a miss
+    backend overrides WHOIS_BACKEND for this lookup
+    """
+    backend = backend or WHOIS_BACKEND
+    key = domain.lower() if backend == WHOIS_BACKEND else f'{domain.lower()}|{backend}'
+    # Popular domains are re-fetched before their entry expires
+    hot_keys.record('whois', key, functools.partial(fetch_whois_data, domain, backend))
+    return cached_call('whois', key, lambda: whois_flight.do(key, fetch_whois_data, domain, backend)[0])
+
+def build_whois_data(domain: str, w) -> Dict:
+    """
+    Build the whois_data structure from a parsed WHOIS record
+    """
+    # Extract relevant information
+    whois_data = {
+        'domain': domain,
+        'registrar': w.registrar,
+        'creation_date': w.creation_date,
+        'expiration_date': w.expiration_date,
+        'updated_date': w.updated_date,
+        'status': w.status,
+        'name_servers': w.name_servers,
+        'dnssec': w.dnssec,
+        'registrant': {
+            'name': w.registrant_name,
+            'organization': w.registrant_organization,
+            'email': w.registrant_email,
+            'phone': w.registrant_phone,
+            'address': w.registrant_address
+        },
+        'admin': {
+            'name': w.admin_name,
+            'organization': w.admin_organization,
+            'email': w.admin_email,
+            'phone': w.admin_phone,
+            'address': w.admin_address
+        },
+        'tech': {
+            'name': w.tech_name,
+            'organization': w.tech_organization,
+            'email': w.tech_email,
+            'phone': w.tech_phone,
+            'address': w.tech_address
+        }
+    }
+    
+    # Clean up None values
+    cleaned_data = {}
+    for key, value in whois_data.items():
+        if value is not None:
+            if isinstance(value, list):
+                # Filter out None values from lists
+                cleaned_value = [item for item in value if item is not None]
+                if cleaned_value:
+                    cleaned_data[key] = cleaned_value
+            else:
+                cleaned_data[key] = value
+    
+    return cleaned_data
+
+def fetch_whois_data(domain: str, backend: Optional[str] = None) -> Dict:
+    """
+    Get WHOIS data for domain with the given or configured backend
+    """
+    backend = backend or WHOIS_BACKEND
+    if backend == 'python-whois':
+        return fetch_whois_library(domain)
+    if backend == 'rdap':
+        return fetch_whois_rdap(domain)
+    return fetch_whois_socket(domain)
+
+def whois_server_for(domain: str) -> Optional[str]:
+    """
+    WHOIS server for the domain's TLD, asking IANA for TLDs not in the table
+    """
+    if WHOIS_SERVER:
+        return WHOIS_SERVER
+    
+    tld = domain.rsplit('.', 1)[-1].lower()
+    server = WHOIS_SERVERS.get(tld) or _discovered_servers.get(tld)
+    if server:
+        return server
+    
+    response = query_whois_server(IANA_WHOIS_SERVER, tld)
+    match = IANA_REFER_PATTERN.search(response)
+    if not match:
+        return None
+    
+    server = match.group(1).strip().lower()
+    _discovered_servers[tld] = server
+    return server
+
+def query_whois_server(server: str, query: str, timeout: float = None) -> str:
+    """
+    Send one WHOIS query over port 43 and return the raw response
+    The timeout bounds the whole exchange with this server
+    """
+    timeout = timeout or WHOIS_TIMEOUT
+    deadline = time.monotonic() + timeout
+    query = WHOIS_QUERY_FORMATS.get(server, '{}').format(query)
+    
+    chunks = []
+    received = 0
+    with track_upstream('whois'), socket.create_connection((server, WHOIS_PORT), timeout=timeout) as sock:
+        sock.sendall(f'{query}\r\n'.encode('utf-8'))
+        while received < WHOIS_MAX_RESPONSE_BYTES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout(f'WHOIS query to {server} timed out')
+            sock.settimeout(remaining)
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+    
+    return b''.join(chunks).decode('utf-8', errors='replace')
+
+def parse_whois_date(value: str):
+    """
+    Parse a WHOIS date into a datetime, keeping the raw string if the format is unknown
+    """
+    value = value.strip()
+    for fmt in WHOIS_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return value
+
+def parse_whois_response(text: str) -> WhoisRecord:
+    """
+    Extract known fields from a raw WHOIS response
+    """
+    record = WhoisRecord()
+    for field, pattern in WHOIS_FIELD_PATTERNS.items():
+        values = []
+        for value in pattern.findall(text):
+            value = value.strip()
+            if field in WHOIS_DATE_FIELDS:
+                value = parse_whois_date(value)
+            elif field == 'name_servers':
+                value = value.split()[0].rstrip('.').lower()
+            if value and value not in values:
+                values.append(value)
+        
+        if not values:
+            continue
+        # Mirror python-whois: a single value is returned as is, several as a list
+        if field in WHOIS_LIST_FIELDS or len(values) > 1:
+            record[field] = values
+        else:
+            record[field] = values[0]
+    return record
+
+def referral_server(text: str, current: str) -> Optional[str]:
+    """
+    Registrar WHOIS server referenced by a registry response, if any
+    """
+    match = WHOIS_REFERRAL_PATTERN.search(text)
+    if not match:
+        return None
+    
+    server = match.group(1).strip().lower()
+    # Some registries publish the referral as a URL
+    server = server.split('://', 1)[-1].split('/', 1)[0].split(':', 1)[0]
+    if not server or server == current:
+        return None
+    return server
+
+def fetch_whois_socket(domain: str) -> Dict:
+    """
+    Get WHOIS data for domain by querying WHOIS servers directly,
+    following registrar referrals
     """
     try:
         logger.info(f"Starting WHOIS lookup for domain: {domain}")
         
-        # Perform WHOIS lookup
-        w = whois.whois(domain)
+        server = whois_server_for(domain)
+        if not server:
+            logger.error(f"No WHOIS server known for {domain}")
+            return {
+                'success': False,
+                'error': 'No WHOIS server known for this TLD',
+                'domain': domain
+            }
         
-        # Extract relevant information
-        whois_data = {
-            'domain': domain,
-            'registrar': w.registrar,
-            'creation_date': w.creation_date,
-            'expiration_date': w.expiration_date,
-            'updated_date': w.updated_date,
-            'status': w.status,
-            'name_servers': w.name_servers,
-            'dnssec': w.dnssec,
-            'registrant': {
-                'name': w.registrant_name,
-                'organization': w.registrant_organization,
-                'email': w.registrant_email,
-                'phone': w.registrant_phone,
-                'address': w.registrant_address
-            },
-            'admin': {
-                'name': w.admin_name,
-                'organization': w.admin_organization,
-                'email': w.admin_email,
-                'phone': w.admin_phone,
-                'address': w.admin_address
-            },
-            'tech': {
-                'name': w.tech_name,
-                'organization': w.tech_organization,
-                'email': w.tech_email,
-                'phone': w.tech_phone,
-                'address': w.tech_address
+        record = WhoisRecord()
+        for hop in range(WHOIS_MAX_REFERRALS + 1):
+            try:
+                response = query_whois_server(server, domain)
+            except (socket.timeout, OSError) as e:
+                if hop == 0:
+                    raise
+                # The registry answer is still usable when a registrar server fails
+                logger.warning(f"WHOIS referral to {server} failed for {domain}: {str(e)}")
+                break
+            
+            if hop == 0 and WHOIS_NOT_FOUND_PATTERN.search(response):
+                logger.warning(f"Domain not found in WHOIS: {domain}")
+                return {
+                    'success': False,
+                    'error': f'WHOIS lookup error: No match for "{domain}"',
+                    'domain': domain
+                }
+            
+            # Registrar answers carry the contact details, let them override the registry
+            record.update(parse_whois_response(response))
+            
+            server = referral_server(response, server)
+            if not server:
+                break
+        
+        if not record:
+            return {
+                'success': False,
+                'error': 'WHOIS lookup error: empty response',
+                'domain': domain
             }
+        
+        logger.info(f"WHOIS lookup completed for {domain}")
+        return {
+            'success': True,
+            'whois_data': build_whois_data(domain, record)
+        }
+        
+    except socket.timeout:
+        logger.error(f"WHOIS timeout for {domain}")
+        return {
+            'success': False,
+            'error': 'WHOIS lookup timed out',
+            'domain': domain
+        }
+    except OSError as e:
+        logger.error(f"WHOIS connection error for {domain}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'WHOIS connection error: {str(e)}',
+            'domain': domain
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error in WHOIS lookup for {domain}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'domain': domain
         }
+
+def fetch_whois_library(domain: str) -> Dict:
+    """
+    Get WHOIS data for domain using python-whois
+    """
+    try:
+        logger.info(f"Starting WHOIS lookup for domain: {domain}")
         
-        # Clean up None values
-        cleaned_data = {}
-        for key, value in whois_data.items():
-            if value is not None:
-                if isinstance(value, list):
-                    # Filter out None values from lists
-                    cleaned_value = [item for item in value if item is not None]
-                    if cleaned_value:
-                        cleaned_data[key] = cleaned_value
-                else:
-                    cleaned_data[key] = value
+        # Perform WHOIS lookup
+        w = whois.whois(domain)
         
         logger.info(f"WHOIS lookup completed for {domain}")
         return {
             'success': True,
-            'whois_data': cleaned_data
+            'whois_data': build_whois_data(domain, w)
         }
         
     except whois.parser.PywhoisError as e:
@@ -105,10 +584,258 @@ def get_whois_data(domain: str) -> Dict:
             'domain': domain
         }
 
+def vcard_fields(entity: Dict) -> Dict[str, str]:
+    """
+    Contact name, organization, email, phone and address from an RDAP entity's jCard
+    """
+    fields = {}
+    vcard = entity.get('vcardArray')
+    if not isinstance(vcard, list) or len(vcard) < 2:
+        return fields
+    
+    for prop in vcard[1]:
+        if not isinstance(prop, list) or len(prop) < 4:
+            continue
+        name, params, value = prop[0], prop[1], prop[3]
+        if name == 'adr':
+            # Prefer the formatted label over the structured parts
+            label = params.get('label') if isinstance(params, dict) else None
+            parts = value if isinstance(value, list) else [value]
+            flat = [part for item in parts for part in (item if isinstance(item, list) else [item])]
+            value = label or ', '.join(part for part in flat if part)
+        elif name == 'org' and isinstance(value, list):
+            value = ', '.join(part for part in value if part)
+        elif name == 'tel' and isinstance(value, str) and value.startswith('tel:'):
+            value = value[4:]
+        
+        field = {'fn': 'name', 'org': 'organization', 'email': 'email', 'tel': 'phone', 'adr': 'address'}.get(name)
+        if field and value and field not in fields:
+            fields[field] = value
+    return fields
+
+def parse_rdap_response(data: Dict) -> WhoisRecord:
+    """
+    Map an RDAP domain object onto the fields of a parsed WHOIS record
+    """
+    record = WhoisRecord()
+    for event in data.get('events', []):
+        field = RDAP_EVENT_FIELDS.get(event.get('eventAction'))
+        if field and event.get('eventDate') and field not in record:
+            record[field] = parse_whois_date(event['eventDate'])
+    
+    if data.get('status'):
+        record['status'] = list(data['status'])
+    name_servers = [ns['ldhName'].rstrip('.').lower() for ns in data.get('nameservers', []) if ns.get('ldhName')]
+    if name_servers:
+        record['name_servers'] = name_servers
+    secure_dns = data.get('secureDNS')
+    if isinstance(secure_dns, dict) and 'delegationSigned' in secure_dns:
+        record['dnssec'] = 'signedDelegation' if secure_dns['delegationSigned'] else 'unsigned'
+    
+    # Some registries nest the contacts under the registrar entity
+    entities = list(data.get('entities', []))
+    for entity in list(entities):
+        entities.extend(entity.get('entities', []))
+    
+    for entity in entities:
+        roles = entity.get('roles', [])
+        fields = vcard_fields(entity)
+        if 'registrar' in roles and fields.get('name') and 'registrar' not in record:
+            record['registrar'] = fields['name']
+        for role in roles:
+            prefix = RDAP_CONTACT_ROLES.get(role)
+            if not prefix:
+                continue
+            for field, value in fields.items():
+                record.setdefault(f'{prefix}_{field}', value)
+    return record
+
+def rdap_referral(data: Dict, current: str) -> Optional[str]:
+    """
+    Registrar RDAP URL linked from a registry response, if any
+    """
+    for link in data.get('links', []):
+        href = link.get('href')
+        if link.get('rel') == 'related' and link.get('type') == 'application/rdap+json' and href and href != current:
+            return href
+    return None
+
+def query_rdap_server(url: str):
+    """
+    Fetch one RDAP object over the shared keep-alive session
+    """
+    with track_upstream('rdap'):
+        return rdap_session().get(url, headers={'Accept': 'application/rdap+json'}, timeout=HTTP_TIMEOUT)
+
+def fetch_whois_rdap(domain: str) -> Dict:
+    """
+    Get WHOIS data for domain from the registry's RDAP service, following
+    the registrar link. TLDs without RDAP are looked up over WHOIS
+    """
+    try:
+        base_url = rdap_bootstrap.server_for(domain)
+        if not base_url:
+            logger.info(f"No RDAP service known for {domain}, falling back to WHOIS")
+            return fetch_whois_socket(domain)
+        
+        logger.info(f"Starting RDAP lookup for domain: {domain}")
+        url = f'{base_url}domain/{domain}'
+        record = WhoisRecord()
+        for hop in range(WHOIS_MAX_REFERRALS + 1):
+            try:
+                response = query_rdap_server(url)
+            except requests.exceptions.RequestException as e:
+                if hop == 0:
+                    raise
+                # The registry answer is still usable when a registrar server fails
+                logger.warning(f"RDAP referral to {url} failed for {domain}: {str(e)}")
+                break
+            
+            if hop == 0 and response.status_code == 404:
+                logger.warning(f"Domain not found in RDAP: {domain}")
+                return {
+                    'success': False,
+                    'error': f'RDAP lookup error: No match for "{domain}"',
+                    'domain': domain
+                }
+            if response.status_code != 200:
+                if hop == 0:
+                    logger.error(f"RDAP error for {domain}: {response.status_code}")
+                    return {
+                        'success': False,
+                        'error': f'RDAP lookup error: {response.status_code}',
+                        'domain': domain
+                    }
+                logger.warning(f"RDAP referral to {url} failed for {domain}: {response.status_code}")
+                break
+            
+            data = response.json()
+            # Registrar answers carry the contact details, let them override the registry
+            record.update(parse_rdap_response(data))
+            
+            url = rdap_referral(data, url)
+            if not url:
+                break
+        
+        if not record:
+            return {
+                'success': False,
+                'error': 'RDAP lookup error: empty response',
+                'domain': domain
+            }
+        
+        logger.info(f"RDAP lookup completed for {domain}")
+        return {
+            'success': True,
+            'whois_data': build_whois_data(domain, record)
+        }
+        
+    except requests.exceptions.Timeout:
+        logger.error(f"RDAP timeout for {domain}")
+        return {
+            'success': False,
+            'error': 'RDAP lookup timed out',
+            'domain': domain
+        }
+    except requests.exceptions.RequestException as e:
+        logger.error(f"RDAP connection error for {domain}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'RDAP connection error: {str(e)}',
+            'domain': domain
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error in RDAP lookup for {domain}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'domain': domain
+        }
+
+def normalize_domain(domain: str) -> str:
+    """
+    Strip protocol, path and port from user input
+    """
+    # Clean domain
+    domain = domain.strip().lower()
+    
+    # Remove protocol if present
+    if domain.startswith(('http://', 'https://')):
+        domain = domain.split('://', 1)[1]
+    
+    # Remove path if present
+    domain = domain.split('/')[0]
+    
+    # Remove port if present
+    domain = domain.split(':')[0]
+    return domain
+
+def build_domain_result(domain: str, whois_backend: Optional[str] = None) -> Dict:
+    """
+    DNS records and WHOIS data for a validated domain
+    """
+    # Resolve DNS and fetch WHOIS data at the same time
+    whois_future = domain_executor.submit(get_whois_data, domain, whois_backend)
+    dns_error = None
+    try:
+        dns_records = get_dns_records(domain)
+    except DNSResolverUnavailable as e:
+        logger.error(f"DNS lookup unavailable for {domain}: {str(e)}")
+        dns_records, dns_error = empty_dns_records(), str(e)
+    whois_result = whois_future.result()
+    
+    return format_domain_result(domain, dns_records, whois_result, dns_error)
+
+def empty_dns_records() -> Dict[str, List]:
+    return {record_type: [] for record_type in DNS_RECORD_TYPES}
+
+def format_domain_result(domain: str, dns_records: Dict[str, List], whois_result: Dict,
+                         dns_error: Optional[str] = None) -> Dict:
+    """
+    Response body for a domain lookup
+    """
+    # Keep the first IPv4 address as the primary IP
+    addresses = dns_records.get('A') or []
+    ip_address = addresses[0] if addresses else None
+    
+    # Combine results
+    result = {
+        'success': True,
+        'domain': domain,
+        'ip_address': ip_address,
+        'dns_records': dns_records,
+        'whois_data': whois_result.get('whois_data', {}) if whois_result['success'] else None,
+        'whois_error': whois_result.get('error') if not whois_result['success'] else None
+    }
+    if dns_error:
+        # DNS records could not be looked up at all, not merely empty
+        result['dns_error'] = dns_error
+    return result
+
+def lookup_domain_item(domain: str, whois_backend: Optional[str] = None) -> Dict:
+    """
+    Validate and look up a single batch item
+    """
+    if not validate_domain(domain):
+        return {
+            'success': False,
+            'error': 'Invalid domain format',
+            'domain': domain
+        }
+    return build_domain_result(domain, whois_backend)
+
+def validate_whois_backend(backend: Optional[str]) -> Optional[str]:
+    """
+    Error message for an unknown per-request WHOIS backend, None when valid
+    """
+    if backend is None or backend in WHOIS_BACKENDS:
+        return None
+    return f"Invalid whois backend, expected one of: {', '.join(WHOIS_BACKENDS)}"
+
 @domain_bp.route('/domain', methods=['GET'])
 def domain_lookup():
     """
-    GET /api/domain?domain=...
+    GET /api/domain?domain=...[&whois=socket|python-whois|rdap]
     Return WHOIS data for the domain
     """
     try:
@@ -124,18 +851,7 @@ def domain_lookup():
                 'error': 'Domain parameter is required'
             }), 400
         
-        # Clean domain
-        domain = domain.strip().lower()
-        
-        # Remove protocol if present
-        if domain.startswith(('http://', 'https://')):
-            domain = domain.split('://', 1)[1]
-        
-        # Remove path if present
-        domain = domain.split('/')[0]
-        
-        # Remove port if present
-        domain = domain.split(':')[0]
+        domain = normalize_domain(domain)
         
         if not validate_domain(domain):
             return jsonify({
@@ -143,20 +859,15 @@ def domain_lookup():
                 'error': 'Invalid domain format'
             }), 400
         
-        # Get IP address
-        ip_address = get_domain_ip(domain)
-        
-        # Get WHOIS data
-        whois_result = get_whois_data(domain)
+        whois_backend = request.args.get('whois')
+        error = validate_whois_backend(whois_backend)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error
+            }), 400
         
-        # Combine results
-        result = {
-            'success': True,
-            'domain': domain,
-            'ip_address': ip_address,
-            'whois_data': whois_result.get('whois_data', {}) if whois_result['success'] else None,
-            'whois_error': whois_result.get('error') if not whois_result['success'] else None
-        }
+        result = build_domain_result(domain, whois_backend)
         
         return jsonify(result), 200
         
@@ -165,4 +876,44 @@ def domain_lookup():
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@domain_bp.route('/domain/batch', methods=['POST'])
+def domain_batch_lookup():
+    """
+    POST /api/domain/batch  {"domains": [...], "whois": "rdap"}
+    Return DNS records and WHOIS data for each domain, keyed by input
+    """
+    try:
+        data = request.get_json(silent=True)
+        try:
+            domains = get_batch_items(data, 'domains')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        whois_backend = data.get('whois')
+        error = validate_whois_backend(whois_backend)
+        if error:
+            return jsonify({
+                'success': False,
+                'error': error
+            }), 400
+        
+        logger.info(f"Domain batch request received: {len(domains)} items")
+        results = run_batch(domains, normalize_domain, lambda domain: lookup_domain_item(domain, whois_backend))
+        
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error in domain_batch_lookup: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
\ No newline at end of file
@@ -1,75 +1,315 @@
 from flask import Blueprint, request, jsonify
 import requests
+import functools
 import hashlib
 import logging
 import os
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from utils.batch import get_batch_items, run_batch
+from utils.cache import TTLCache
+from utils.circuit_breaker import CircuitOpenError, call_hedged, get_circuit_breaker
+from utils.email_classifier import email_classifier, local_reputation
+from utils.hot_keys import hot_keys
+from utils.http_client import HTTP_TIMEOUT, get_session
+from utils.persistent_cache import cached_call
+from utils.rate_limit import RateLimitExceeded, get_rate_limiter
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 email_bp = Blueprint('email', __name__)
 
+# Concurrent lookups for the same email share one emailrep.io call
+email_flight = SingleFlight('emailrep')
+
+EMAILREP_URL = os.getenv('EMAILREP_URL', 'https://emailrep.io/{}')
+
+GRAVATAR_AVATAR_URL = os.getenv('GRAVATAR_AVATAR_URL', 'https://www.gravatar.com/avatar/{}?d=404')
+GRAVATAR_PROFILE_URL = os.getenv('GRAVATAR_PROFILE_URL', 'https://en.gravatar.com/{}.json')
+
+# Gravatar checks are remembered per hash, missing avatars for less time
+gravatar_cache = TTLCache(
+    'gravatar',
+    ttl=float(os.getenv('GRAVATAR_CACHE_TTL', '86400')),
+    negative_ttl=float(os.getenv('GRAVATAR_CACHE_NEGATIVE_TTL', '3600')),
+    max_entries=int(os.getenv('GRAVATAR_CACHE_MAX_ENTRIES', '10000')),
+    max_bytes=int(os.getenv('GRAVATAR_CACHE_MAX_BYTES', str(10 * 1024 * 1024)))
+)
+
+# Concurrent checks for the same hash share one round of Gravatar requests
+gravatar_flight = SingleFlight('gravatar')
+
+# Gravatar checks run alongside the emailrep.io lookup
+email_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('EMAIL_LOOKUP_WORKERS', '8')),
+    thread_name_prefix='email-lookup'
+)
+
+def gravatar_hash(email: str) -> str:
+    """
+    MD5 hash Gravatar uses to identify an email address
+    """
+    return hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()
+
 def get_gravatar_url(email: str, size: int = 200) -> str:
     """
     Generate Gravatar URL for email address
     """
     try:
-        # Create MD5 hash of email (lowercase)
-        email_hash = hashlib.md5(email.lower().encode('utf-8')).hexdigest()
+        email_hash = gravatar_hash(email)
         return f"https://www.gravatar.com/avatar/{email_hash}?s={size}&d=404"
     except Exception as e:
         logger.error(f"Error generating Gravatar URL for {email}: {str(e)}")
         return ""
 
-def get_email_reputation(email: str) -> Dict:
+def parse_gravatar_profile_response(email_hash: str, response) -> Optional[Dict]:
     """
-    Get email reputation from emailrep.io API
+    Public fields of a Gravatar profile response (requests or httpx), None
+    when the hash has no public profile
     """
-    try:
-        # Get API key from environment
-        api_key = os.getenv('EMAILREP_API_KEY')
-        
-        headers = {
-            'User-Agent': 'OSINT-Dashboard/1.0'
+    if response.status_code != 200:
+        if response.status_code != 404:
+            logger.warning(f"Gravatar profile error for {email_hash}: {response.status_code}")
+        return None
+    
+    entries = response.json().get('entry') or []
+    if not entries:
+        return None
+    entry = entries[0]
+    name = entry.get('name') or {}
+    return {
+        'display_name': entry.get('displayName'),
+        'username': entry.get('preferredUsername'),
+        'full_name': name.get('formatted') if isinstance(name, dict) else None,
+        'location': entry.get('currentLocation'),
+        'about': entry.get('aboutMe'),
+        'profile_url': entry.get('profileUrl'),
+        'urls': [url['value'] for url in entry.get('urls', []) if url.get('value')],
+        'accounts': [
+            {
+                'service': account.get('shortname'),
+                'username': account.get('username'),
+                'url': account.get('url')
+            }
+            for account in entry.get('accounts', [])
+        ]
+    }
+
+def parse_gravatar_avatar_response(email_hash: str, response, profile: Optional[Dict]) -> Dict:
+    """
+    Turn a Gravatar avatar check (requests or httpx) and the profile fetched
+    alongside it into a Gravatar result
+    """
+    if response.status_code in (200, 404):
+        exists = response.status_code == 200
+        logger.info(f"Gravatar for {email_hash} {'exists' if exists else 'does not exist'}")
+        return {
+            'success': True,
+            'hash': email_hash,
+            'exists': exists,
+            'profile': profile
         }
+    
+    logger.error(f"Gravatar API error for {email_hash}: {response.status_code}")
+    return {
+        'success': False,
+        'error': f'Gravatar API error: {response.status_code}',
+        'hash': email_hash
+    }
+
+def fetch_gravatar(email_hash: str) -> Dict:
+    """
+    Check whether a Gravatar avatar exists and fetch the public profile if it does
+    """
+    try:
+        breaker = get_circuit_breaker('gravatar')
+        breaker.check()
         
-        if api_key:
-            headers['Authorization'] = f'Bearer {api_key}'
-        
-        # Make request to emailrep.io
-        response = requests.get(
-            f'https://emailrep.io/{email}',
-            headers=headers,
-            timeout=10
-        )
+        session = get_session('gravatar')
+        avatar_response = breaker.call(session.head, GRAVATAR_AVATAR_URL.format(email_hash), timeout=HTTP_TIMEOUT)
         
-        if response.status_code == 200:
-            data = response.json()
-            logger.info(f"Email reputation retrieved for {email}")
-            return {
-                'success': True,
-                'email': email,
-                'reputation': data
-            }
-        elif response.status_code == 404:
-            logger.warning(f"Email not found in reputation database: {email}")
-            return {
-                'success': True,
+        # Only hashes with an avatar can have a public profile
+        profile = None
+        if avatar_response.status_code == 200:
+            profile_response = breaker.call(session.get, GRAVATAR_PROFILE_URL.format(email_hash), timeout=HTTP_TIMEOUT)
+            profile = parse_gravatar_profile_response(email_hash, profile_response)
+        return parse_gravatar_avatar_response(email_hash, avatar_response, profile)
+            
+    except CircuitOpenError:
+        logger.warning(f"Gravatar circuit open, skipping check for {email_hash}")
+        return {
+            'success': False,
+            'error': 'Gravatar API temporarily unavailable',
+            'hash': email_hash
+        }
+    except requests.exceptions.Timeout:
+        logger.error(f"Gravatar API timeout for {email_hash}")
+        return {
+            'success': False,
+            'error': 'Gravatar API timeout',
+            'hash': email_hash
+        }
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Gravatar API request error for {email_hash}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Gravatar API request error: {str(e)}',
+            'hash': email_hash
+        }
+    except Exception as e:
+        logger.error(f"Unexpected error checking Gravatar for {email_hash}: {str(e)}")
+        return {
+            'success': False,
+            'error': f'Unexpected error: {str(e)}',
+            'hash': email_hash
+        }
+
+def cache_gravatar(result: Dict):
+    """
+    Remember a Gravatar check, failed checks are not cached
+    """
+    if result['success']:
+        gravatar_cache.set(result['hash'], result, negative=not result['exists'])
+
+def get_gravatar(email: str) -> Dict:
+    """
+    Get Gravatar existence and profile from the cache, coalescing concurrent
+    checks for the same hash on a miss
+    """
+    email_hash = gravatar_hash(email)
+    cached = gravatar_cache.get(email_hash)
+    if cached is not None:
+        return cached[0]
+    
+    result, shared = gravatar_flight.do(email_hash, fetch_gravatar, email_hash)
+    if not shared:
+        cache_gravatar(result)
+    return result
+
+def classify_locally(email: str) -> Tuple[Dict, Optional[Dict]]:
+    """
+    Classify email locally, returning the classification and, when it is
+    conclusive, the reputation result so emailrep.io need not be asked
+    """
+    classification = email_classifier.classify(email)
+    if not classification['conclusive']:
+        return classification, None
+    
+    logger.info(f"Email reputation for {email} answered locally")
+    return classification, {
+        'success': True,
+        'email': email,
+        'reputation': local_reputation(email, classification)
+    }
+
+def add_classification(result: Dict, classification: Dict, source: str) -> Dict:
+    result = dict(result)
+    result['classification'] = classification
+    result['source'] = source
+    return result
+
+def get_email_reputation(email: str) -> Dict:
+    """
+    Get email reputation from the local classifier, then the persistent
+    cache, coalescing concurrent lookups for the same email on a miss
+    """
+    classification, local_result = classify_locally(email)
+    if local_result is not None:
+        return add_classification(local_result, classification, 'local')
+    
+    key = email.lower()
+    hot_keys.record('email', key, functools.partial(fetch_email_reputation, email))
+    result = cached_call('email', key, lambda: email_flight.do(key, fetch_email_reputation, email)[0])
+    return add_classification(result, classification, 'emailrep.io')
+
+def emailrep_headers() -> Dict:
+    """
+    Request headers for emailrep.io, including the API key when configured
+    """
+    # Get API key from environment
+    api_key = os.getenv('EMAILREP_API_KEY')
+    
+    headers = {
+        'User-Agent': 'OSINT-Dashboard/1.0'
+    }
+    
+    if api_key:
+        headers['Authorization'] = f'Bearer {api_key}'
+    return headers
+
+def parse_email_reputation_response(email: str, response) -> Dict:
+    """
+    Turn an emailrep.io response (requests or httpx) into a reputation result
+    """
+    if response.status_code == 200:
+        data = response.json()
+        logger.info(f"Email reputation retrieved for {email}")
+        # Domains emailrep.io keeps calling disposable are later classified locally
+        email_classifier.record(email, data)
+        return {
+            'success': True,
+            'email': email,
+            'reputation': data
+        }
+    elif response.status_code == 404:
+        logger.warning(f"Email not found in reputation database: {email}")
+        return {
+            'success': True,
+            'email': email,
+            'reputation': {
                 'email': email,
-                'reputation': {
-                    'email': email,
-                    'reputation': 'unknown',
-                    'suspicious': False,
-                    'references': 0
-                }
-            }
-        else:
-            logger.error(f"Emailrep API error for {email}: {response.status_code}")
-            return {
-                'success': False,
-                'error': f'Emailrep API error: {response.status_code}',
-                'email': email
+                'reputation': 'unknown',
+                'suspicious': False,
+                'references': 0
             }
+        }
+    else:
+        logger.error(f"Emailrep API error for {email}: {response.status_code}")
+        return {
+            'success': False,
+            'error': f'Emailrep API error: {response.status_code}',
+            'email': email
+        }
+
+def request_email_reputation(email: str):
+    """
+    Make request to emailrep.io over the shared keep-alive session
+    """
+    return get_session('emailrep').get(
+        EMAILREP_URL.format(email),
+        headers=emailrep_headers(),
+        timeout=HTTP_TIMEOUT
+    )
+
+def fetch_email_reputation(email: str) -> Dict:
+    """
+    Get email reputation from emailrep.io API
+    """
+    try:
+        # Fail fast while emailrep.io is known to be down
+        breaker = get_circuit_breaker('emailrep')
+        breaker.check()
+        
+        # Wait for a slot in the emailrep.io quota shared by all workers
+        limiter = get_rate_limiter('emailrep')
+        limiter.acquire()
+        
+        response = call_hedged(breaker, limiter, request_email_reputation, email)
+        return parse_email_reputation_response(email, response)
             
+    except CircuitOpenError:
+        logger.warning(f"Emailrep circuit open, skipping lookup for {email}")
+        return {
+            'success': False,
+            'error': 'Emailrep API temporarily unavailable',
+            'email': email
+        }
+    except RateLimitExceeded:
+        return {
+            'success': False,
+            'error': 'Emailrep API rate limit exceeded, try again later',
+            'email': email
+        }
     except requests.exceptions.Timeout:
         logger.error(f"Emailrep API timeout for {email}")
         return {
@@ -100,10 +340,71 @@ def validate_email(email: str) -> bool:
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+def build_email_result(email: str, verify_gravatar: bool = False) -> Dict:
+    """
+    Combine Gravatar URL and reputation for a validated email, checking the
+    Gravatar at the same time when verify_gravatar is set
+    """
+    gravatar_future = email_executor.submit(get_gravatar, email) if verify_gravatar else None
+    
+    # Get email reputation
+    reputation_result = get_email_reputation(email)
+    
+    gravatar_result = gravatar_future.result() if gravatar_future is not None else None
+    return format_email_result(email, reputation_result, gravatar_result)
+
+def format_email_result(email: str, reputation_result: Dict, gravatar_result: Optional[Dict] = None) -> Dict:
+    """
+    Response body for an email lookup, with the Gravatar check when one was made
+    """
+    # Get Gravatar URL
+    gravatar_url = get_gravatar_url(email)
+    
+    # Combine results
+    result = {
+        'success': True,
+        'email': email,
+        'gravatar_url': gravatar_url,
+        'reputation': reputation_result.get('reputation', {}) if reputation_result['success'] else None,
+        'reputation_error': reputation_result.get('error') if not reputation_result['success'] else None,
+        'classification': reputation_result.get('classification'),
+        'source': reputation_result.get('source')
+    }
+    
+    if gravatar_result is not None:
+        verified = gravatar_result['success']
+        if verified and not gravatar_result['exists']:
+            # Spare the client a probe that would only 404
+            result['gravatar_url'] = None
+        result['gravatar_exists'] = gravatar_result['exists'] if verified else None
+        result['gravatar_profile'] = gravatar_result['profile'] if verified else None
+        result['gravatar_error'] = gravatar_result.get('error') if not verified else None
+    return result
+
+def verify_gravatar_requested(value) -> bool:
+    """
+    Whether the verify_gravatar query parameter or batch field asks for a Gravatar check
+    """
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return value is True
+
+def lookup_email_item(email: str, verify_gravatar: bool = False) -> Dict:
+    """
+    Validate and look up a single batch item
+    """
+    if not validate_email(email):
+        return {
+            'success': False,
+            'error': 'Invalid email format',
+            'email': email
+        }
+    return build_email_result(email, verify_gravatar)
+
 @email_bp.route('/email', methods=['GET'])
 def email_lookup():
     """
-    GET /api/email?email=...
+    GET /api/email?email=...[&verify_gravatar=true]
     Return Gravatar URL and email reputation
     """
     try:
@@ -128,20 +429,7 @@ def email_lookup():
                 'error': 'Invalid email format'
             }), 400
         
-        # Get Gravatar URL
-        gravatar_url = get_gravatar_url(email)
-        
-        # Get email reputation
-        reputation_result = get_email_reputation(email)
-        
-        # Combine results
-        result = {
-            'success': True,
-            'email': email,
-            'gravatar_url': gravatar_url,
-            'reputation': reputation_result.get('reputation', {}) if reputation_result['success'] else None,
-            'reputation_error': reputation_result.get('error') if not reputation_result['success'] else None
-        }
+        result = build_email_result(email, verify_gravatar_requested(request.args.get('verify_gravatar')))
         
         return jsonify(result), 200
         
@@ -150,4 +438,38 @@ def email_lookup():
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@email_bp.route('/email/batch', methods=['POST'])
+def email_batch_lookup():
+    """
+    POST /api/email/batch  {"emails": [...], "verify_gravatar": true}
+    Return Gravatar URL and email reputation for each email, keyed by input
+    """
+    try:
+        data = request.get_json(silent=True)
+        try:
+            emails = get_batch_items(data, 'emails')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        logger.info(f"Email batch request received: {len(emails)} items")
+        verify_gravatar = verify_gravatar_requested(data.get('verify_gravatar'))
+        results = run_batch(emails, lambda email: email.strip().lower(),
+                            lambda email: lookup_email_item(email, verify_gravatar))
+        
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error in email_batch_lookup: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
\ No newline at end of file
@@ -0,0 +1,320 @@
+from flask import Blueprint, Response, request, jsonify
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from routes.domain_routes import WHOIS_SERVERS, get_domain_ip, get_whois_data, normalize_domain, validate_domain
+from routes.email_routes import format_email_result, get_email_reputation, validate_email
+from routes.ip_routes import format_ip_result, get_ip_geolocation, validate_ip
+from routes.sherlock_routes import SSE_HEARTBEAT_INTERVAL, format_sse, scan_options_from_args, submit_sherlock_job
+from utils.jobs import Job, QueueFullError
+from utils.rdap import rdap_bootstrap
+from utils.sherlock_sites import ScanOptions
+
+logger = logging.getLogger(__name__)
+investigate_bp = Blueprint('investigate', __name__)
+
+# Lookups of all running investigations share this pool
+investigate_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('INVESTIGATE_WORKERS', '16')),
+    thread_name_prefix='investigate'
+)
+
+SEED_TYPES = ('email', 'domain', 'ip', 'username')
+
+def has_known_tld(domain: str) -> bool:
+    """
+    Whether the last label is a real TLD: a country code, a TLD with a known
+    WHOIS server or one listed in the RDAP bootstrap
+    """
+    tld = domain.rsplit('.', 1)[-1].lower()
+    if tld in WHOIS_SERVERS or (len(tld) == 2 and tld.isalpha()):
+        return True
+    return tld in rdap_bootstrap.servers()
+
+def detect_seed_type(seed: str) -> str:
+    """
+    Guess what kind of indicator a seed is
+    Dotted names such as john.doe are usernames unless they end in a known
+    TLD, type= states the seed type when the guess is wrong
+    """
+    if validate_email(seed):
+        return 'email'
+    if validate_ip(seed):
+        return 'ip'
+    domain = normalize_domain(seed)
+    if '.' in domain and validate_domain(domain) and has_known_tld(domain):
+        return 'domain'
+    return 'username'
+
+def related_indicators(seed: str, seed_type: str) -> Dict[str, str]:
+    """
+    Indicators derived from the seed: an email yields its domain and a
+    username (the local part without any +tag)
+    """
+    if seed_type == 'email':
+        local_part, domain = seed.lower().rsplit('@', 1)
+        return {'email': seed.lower(), 'domain': domain, 'username': local_part.split('+', 1)[0]}
+    if seed_type == 'domain':
+        return {'domain': normalize_domain(seed)}
+    return {seed_type: seed}
+
+class Investigation:
+    """
+    Lookups for one seed, run as a dependency graph
+
+    Each section starts as soon as the indicator it needs is known, and
+    completed sections are queued as (name, indicator, result) in
+    completion order. None marks the end of the investigation.
+    """
+
+    def __init__(self, seed: str, seed_type: str, include_sherlock: bool = True,
+                 sherlock_options: Optional[ScanOptions] = None):
+        self.seed = seed
+        self.seed_type = seed_type
+        self.indicators = related_indicators(seed, seed_type)
+        self.include_sherlock = include_sherlock
+        self.sherlock_options = sherlock_options
+        self.started = time.perf_counter()
+        self.sections: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return round(time.perf_counter() - self.started, 3)
+
+    def start(self):
+        email = self.indicators.get('email')
+        domain = self.indicators.get('domain')
+        ip = self.indicators.get('ip')
+        username = self.indicators.get('username')
+
+        # Hold one pending slot so early completions cannot end the investigation
+        with self._lock:
+            self._pending += 1
+
+        if email:
+            self.run('email', email, lambda: format_email_result(email, get_email_reputation(email)))
+        if domain:
+            self.run('whois', domain, lambda: get_whois_data(domain))
+            self.run('dns', domain, lambda: {'success': True, 'domain': domain, 'ip_address': get_domain_ip(domain)},
+                     then=self.geolocate_resolved)
+        if ip:
+            self.geolocate(ip)
+        if username and self.include_sherlock:
+            self.run_sherlock(username)
+
+        self.finish_one()
+
+    def geolocate(self, ip: str):
+        self.run('ip', ip, lambda: format_ip_result(ip, get_ip_geolocation(ip)))
+
+    def geolocate_resolved(self, dns_result: Dict):
+        ip = dns_result.get('ip_address')
+        if ip:
+            self.indicators['ip'] = ip
+            self.geolocate(ip)
+        else:
+            self.sections.put(('ip', None, {
+                'success': False,
+                'error': 'Domain did not resolve to an IP address'
+            }))
+
+    def run(self, section: str, indicator: str, lookup: Callable[[], Dict],
+            then: Optional[Callable[[Dict], None]] = None):
+        """
+        Run one section in the pool, then start its dependents
+        """
+        with self._lock:
+            self._pending += 1
+        # Run in the caller's context so upstream calls are attributed to the same client
+        investigate_executor.submit(contextvars.copy_context().run, self._run, section, indicator, lookup, then)
+
+    def run_sherlock(self, username: str):
+        """
+        Queue the scan on the Sherlock job queue, which bounds concurrent
+        scans, instead of holding a thread of the shared pool for its length
+        """
+        with self._lock:
+            self._pending += 1
+        try:
+            job = submit_sherlock_job(username, self.sherlock_options)
+        except QueueFullError as e:
+            logger.warning(f"Investigation Sherlock scan for {username} rejected: {str(e)}")
+            self.sections.put(('sherlock', username, {
+                'success': False,
+                'error': 'Sherlock workers are busy, please retry later'
+            }))
+            self.finish_one()
+            return
+        job.add_done_callback(lambda job: self._sherlock_done(username, job))
+
+    def _sherlock_done(self, username: str, job: Job):
+        try:
+            result = job.result or {
+                'success': False,
+                'error': job.error or 'Sherlock scan failed'
+            }
+            self.sections.put(('sherlock', username, result))
+        finally:
+            self.finish_one()
+
+    def _run(self, section: str, indicator: str, lookup: Callable[[], Dict],
+             then: Optional[Callable[[Dict], None]]):
+        try:
+            try:
+                result = lookup()
+            except Exception as e:
+                logger.error(f"Investigation section {section} failed for {indicator}: {str(e)}")
+                result = {
+                    'success': False,
+                    'error': f'Unexpected error: {str(e)}'
+                }
+            self.sections.put((section, indicator, result))
+            if then and result.get('success'):
+                then(result)
+        finally:
+            self.finish_one()
+
+    def finish_one(self):
+        with self._lock:
+            self._pending -= 1
+            done = self._pending == 0
+        if done:
+            self.sections.put(None)
+
+    def completed(self, heartbeat: Optional[float] = None) -> Iterator[Optional[Tuple[str, Optional[str], Dict]]]:
+        """
+        Yield sections as they complete, or None every heartbeat seconds while waiting
+        """
+        while True:
+            try:
+                item = self.sections.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            if item is None:
+                return
+            yield item
+
+def section_event(investigation: Investigation, section: str, indicator: Optional[str], result: Dict) -> Dict:
+    return {
+        'section': section,
+        'indicator': indicator,
+        'elapsed': investigation.elapsed(),
+        'result': result
+    }
+
+def stream_investigation(investigation: Investigation):
+    """
+    Yield an SSE event per completed section, then a summary event
+    """
+    yield format_sse('investigation', {
+        'seed': investigation.seed,
+        'type': investigation.seed_type,
+        'indicators': dict(investigation.indicators)
+    })
+
+    sections = []
+    for item in investigation.completed(SSE_HEARTBEAT_INTERVAL):
+        if item is None:
+            yield ': keep-alive\n\n'
+            continue
+        section, indicator, result = item
+        sections.append(section)
+        yield format_sse('section', section_event(investigation, section, indicator, result))
+
+    logger.info(f"Investigation of {investigation.seed} completed in {investigation.elapsed():.2f}s")
+    yield format_sse('summary', {
+        'success': True,
+        'seed': investigation.seed,
+        'type': investigation.seed_type,
+        'indicators': investigation.indicators,
+        'sections': sections,
+        'elapsed': investigation.elapsed()
+    })
+
+@investigate_bp.route('/investigate', methods=['GET'])
+def investigate():
+    """
+    GET /api/investigate?target=...[&type=email|domain|ip|username][&sherlock=false][&stream=false]
+    Look up a seed indicator and everything derived from it concurrently,
+    streaming each section as Server-Sent Events as soon as it completes
+    Sherlock scan options (sites, groups, top, deadline) are passed through
+    """
+    try:
+        # Log incoming request
+        logger.info(f"Investigate request received: {request.args}")
+
+        target = request.args.get('target')
+
+        if not target or not target.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Target parameter is required'
+            }), 400
+
+        target = target.strip()
+        seed_type = request.args.get('type') or detect_seed_type(target)
+        if seed_type not in SEED_TYPES:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid type, expected one of: {', '.join(SEED_TYPES)}"
+            }), 400
+
+        valid = {
+            'email': validate_email(target.lower()),
+            'domain': validate_domain(normalize_domain(target)),
+            'ip': validate_ip(target),
+            'username': True
+        }[seed_type]
+        if not valid:
+            return jsonify({
+                'success': False,
+                'error': f'Invalid {seed_type} format'
+            }), 400
+
+        try:
+            sherlock_options = scan_options_from_args(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        investigation = Investigation(
+            target, seed_type,
+            include_sherlock=request.args.get('sherlock', 'true').lower() != 'false',
+            sherlock_options=sherlock_options
+        )
+        investigation.start()
+
+        if request.args.get('stream', 'true').lower() == 'false':
+            sections = {
+                section: section_event(investigation, section, indicator, result)
+                for section, indicator, result in investigation.completed()
+            }
+            return jsonify({
+                'success': True,
+                'seed': target,
+                'type': seed_type,
+                'indicators': investigation.indicators,
+                'sections': sections,
+                'elapsed': investigation.elapsed()
+            }), 200
+
+        response = Response(stream_investigation(investigation), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in investigate: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
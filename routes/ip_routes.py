@@ -2,11 +2,40 @@ from flask import Blueprint, request, jsonify
 import requests
 import logging
 from typing import Dict, Optional
+import functools
 import ipaddress
+import os
+from utils.batch import get_batch_items, run_batch
+from utils.geoip import get_geoip_database
+from utils.hot_keys import hot_keys
+from utils.circuit_breaker import CircuitOpenError, call_hedged, get_circuit_breaker
+from utils.http_client import HTTP_TIMEOUT, get_session
+from utils.persistent_cache import cached_call, is_success
+from utils.prefix_cache import PrefixCache
+from utils.rate_limit import RateLimitExceeded, get_rate_limiter
+from utils.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 ip_bp = Blueprint('ip', __name__)
 
+# Concurrent lookups for the same IP (or block) share one ipwho.is call
+ip_flight = SingleFlight('ipwhois')
+
+IPWHOIS_URL = os.getenv('IPWHOIS_URL', 'https://ipwho.is/{}')
+
+# Addresses in the same block almost always share geolocation, so remote
+# results are reused for every address in their /24 (IPv4) or /48 (IPv6)
+GEO_PREFIX_CACHE = os.getenv('GEO_PREFIX_CACHE', 'true').lower() == 'true'
+GEO_PREFIX_LENGTHS = {
+    4: int(os.getenv('GEO_PREFIX_V4', '24')),
+    6: int(os.getenv('GEO_PREFIX_V6', '48'))
+}
+geo_prefix_cache = PrefixCache(
+    'geo-prefix',
+    ttl=float(os.getenv('GEO_PREFIX_TTL', '86400')),
+    max_entries=int(os.getenv('GEO_PREFIX_MAX_ENTRIES', '100000'))
+)
+
 def validate_ip(ip: str) -> bool:
     """
     Validate IP address format
@@ -17,122 +46,310 @@ def validate_ip(ip: str) -> bool:
     except ValueError:
         return False
 
+def clean_geolocation_data(geolocation_data: Dict) -> Dict:
+    """
+    Drop None values, including inside nested dictionaries
+    """
+    cleaned_data = {}
+    for key, value in geolocation_data.items():
+        if value is not None:
+            if isinstance(value, dict):
+                # Clean nested dictionaries
+                cleaned_nested = {k: v for k, v in value.items() if v is not None}
+                if cleaned_nested:
+                    cleaned_data[key] = cleaned_nested
+            else:
+                cleaned_data[key] = value
+    return cleaned_data
+
+def lookup_local_geolocation(ip: str) -> Optional[Dict]:
+    """
+    Answer from the local GeoIP database, None when it is not configured or misses
+    """
+    database = get_geoip_database()
+    if database is None:
+        return None
+    
+    data = database.lookup(ip)
+    if data is None:
+        return None
+    
+    geolocation_data = {
+        'ip': data['ip'],
+        'type': data['type'],
+        'continent': data['continent'],
+        'continent_code': data['continent_code'],
+        'country': data['country'],
+        'country_code': data['country_code'],
+        'region': data['region'],
+        'region_code': data['region_code'],
+        'city': data['city'],
+        'latitude': data['latitude'],
+        'longitude': data['longitude'],
+        'timezone': {
+            'id': data['timezone']
+        },
+        'isp': data['isp'],
+        'org': data['org'],
+        'as': data['asn'],
+        'asname': data['asname'],
+        'postal': data['postal']
+    }
+    
+    logger.info(f"IP geolocation for {ip} answered from local database")
+    return {
+        'success': True,
+        'geolocation_data': clean_geolocation_data(geolocation_data),
+        'source': 'local'
+    }
+
+# Connection and security flags that describe one address, never shared across its block
+PER_ADDRESS_FIELDS = frozenset(['mobile', 'proxy', 'hosting', 'vpn', 'tor', 'relay', 'service', 'security'])
+
+def geo_block(ip: str) -> str:
+    """
+    Network that shares a geolocation result with ip, ip itself when
+    block caching is disabled
+    """
+    if not GEO_PREFIX_CACHE:
+        return ip
+    address = ipaddress.ip_address(ip)
+    return str(ipaddress.ip_network(f'{address}/{GEO_PREFIX_LENGTHS[address.version]}', strict=False))
+
+def localize_geolocation(result: Dict, ip: str, network: str) -> Dict:
+    """
+    Copy of another address's result for ip, keeping only the location and
+    ASN data the block shares
+    The neighbour's proxy, VPN, Tor, hosting and mobile flags say nothing
+    about ip, so they are dropped rather than reported for the wrong address.
+    A result that is already for ip is returned unchanged
+    """
+    address = ipaddress.ip_address(ip)
+    if same_address(result['geolocation_data'].get('ip'), address):
+        return result
+    geolocation_data = {field: value for field, value in result['geolocation_data'].items()
+                        if field not in PER_ADDRESS_FIELDS}
+    geolocation_data['ip'] = str(address)
+    geolocation_data['type'] = f'IPv{address.version}'
+    
+    result = dict(result)
+    result['geolocation_data'] = geolocation_data
+    result['network'] = network
+    return result
+
+def same_address(value: Optional[str], address) -> bool:
+    try:
+        return value is not None and ipaddress.ip_address(value) == address
+    except ValueError:
+        return False
+
+def is_own_geolocation(result: Dict) -> bool:
+    """
+    Whether a result was fetched for the queried address itself, only those
+    are kept per IP or shared with the block
+    """
+    return is_success(result) and 'network' not in result
+
+def lookup_prefix_geolocation(ip: str) -> Optional[Dict]:
+    """
+    Answer from a remote result for another address in the same block,
+    None on a miss
+    """
+    if not GEO_PREFIX_CACHE:
+        return None
+    
+    cached = geo_prefix_cache.get(ip)
+    if cached is None:
+        return None
+    
+    result, network = cached
+    logger.info(f"IP geolocation for {ip} answered from cached block {network}")
+    return localize_geolocation(result, ip, network)
+
+def remember_prefix_geolocation(block: str, result: Dict):
+    """
+    Keep a successful remote result for the rest of its block
+    """
+    if GEO_PREFIX_CACHE and is_own_geolocation(result):
+        geo_prefix_cache.set(block, result)
+
 def get_ip_geolocation(ip: str) -> Dict:
     """
-    Get IP geolocation data from ipwho.is API
+    Get IP geolocation data from the local database, falling back to ipwho.is
+    Remote results are kept in the persistent cache and reused for the rest
+    of their block, and concurrent remote lookups in one block are coalesced.
+    The address's own cached result is preferred over its block's, and
+    results borrowed from the block are never cached for the address
     """
     try:
-        logger.info(f"Starting IP geolocation lookup for: {ip}")
-        
-        # Make request to ipwho.is API
-        response = requests.get(
-            f'https://ipwho.is/{ip}',
-            headers={
-                'User-Agent': 'OSINT-Dashboard/1.0'
-            },
-            timeout=10
-        )
+        local_result = lookup_local_geolocation(ip)
+        if local_result is not None:
+            return local_result
+    except Exception as e:
+        logger.error(f"Local geolocation lookup failed for {ip}: {str(e)}")
+    
+    # Counted before the block cache so IPs it answers can still become hot
+    hot_keys.record('geo', ip, functools.partial(refresh_ip_geolocation, ip))
+    block = geo_block(ip)
+    
+    def fetch():
+        prefix_result = lookup_prefix_geolocation(ip)
+        if prefix_result is not None:
+            return prefix_result
+        result, joined = ip_flight.do(block, fetch_ip_geolocation, ip)
+        return localize_geolocation(result, ip, block) if joined and result['success'] else result
+    
+    result = cached_call('geo', ip, fetch, cacheable=is_own_geolocation)
+    remember_prefix_geolocation(block, result)
+    return result
+
+def refresh_ip_geolocation(ip: str) -> Dict:
+    """
+    Re-fetch a hot IP's geolocation ahead of expiry, renewing its block in this worker too
+    """
+    result = fetch_ip_geolocation(ip)
+    remember_prefix_geolocation(geo_block(ip), result)
+    return result
+
+def parse_ip_geolocation_response(ip: str, response) -> Dict:
+    """
+    Turn an ipwho.is response (requests or httpx) into a geolocation result
+    """
+    if response.status_code == 200:
+        data = response.json()
         
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Check if the API returned an error
-            if data.get('success') == False:
-                logger.error(f"IPwho.is API error for {ip}: {data.get('message', 'Unknown error')}")
-                return {
-                    'success': False,
-                    'error': data.get('message', 'IPwho.is API error'),
-                    'ip': ip
-                }
-            
-            # Extract relevant information
-            geolocation_data = {
-                'ip': data.get('ip'),
-                'type': data.get('type'),  # ipv4 or ipv6
-                'continent': data.get('continent'),
-                'continent_code': data.get('continent_code'),
-                'country': data.get('country'),
-                'country_code': data.get('country_code'),
-                'region': data.get('region'),
-                'region_code': data.get('region_code'),
-                'city': data.get('city'),
-                'latitude': data.get('latitude'),
-                'longitude': data.get('longitude'),
-                'timezone': {
-                    'id': data.get('timezone', {}).get('id'),
-                    'abbr': data.get('timezone', {}).get('abbr'),
-                    'utc': data.get('timezone', {}).get('utc'),
-                    'current_time': data.get('timezone', {}).get('current_time')
-                },
-                'isp': data.get('connection', {}).get('isp'),
-                'org': data.get('connection', {}).get('org'),
-                'as': data.get('connection', {}).get('as'),
-                'asname': data.get('connection', {}).get('asname'),
-                'domain': data.get('connection', {}).get('domain'),
-                'mobile': data.get('connection', {}).get('mobile'),
-                'proxy': data.get('connection', {}).get('proxy'),
-                'hosting': data.get('connection', {}).get('hosting'),
-                'vpn': data.get('connection', {}).get('vpn'),
-                'tor': data.get('connection', {}).get('tor'),
-                'relay': data.get('connection', {}).get('relay'),
-                'service': data.get('connection', {}).get('service'),
-                'postal': data.get('postal'),
-                'calling_code': data.get('calling_code'),
-                'flag': data.get('flag'),
-                'flag_img': data.get('flag_img'),
-                'flag_emoji': data.get('flag_emoji'),
-                'flag_emoji_unicode': data.get('flag_emoji_unicode'),
-                'currency': {
-                    'name': data.get('currency', {}).get('name'),
-                    'code': data.get('currency', {}).get('code'),
-                    'symbol': data.get('currency', {}).get('symbol'),
-                    'plural': data.get('currency', {}).get('plural'),
-                    'exchange_rate': data.get('currency', {}).get('exchange_rate')
-                },
-                'security': {
-                    'anonymous': data.get('security', {}).get('anonymous'),
-                    'proxy': data.get('security', {}).get('proxy'),
-                    'vpn': data.get('security', {}).get('vpn'),
-                    'tor': data.get('security', {}).get('tor'),
-                    'relay': data.get('security', {}).get('relay'),
-                    'hosting': data.get('security', {}).get('hosting'),
-                    'service': data.get('security', {}).get('service')
-                }
-            }
-            
-            # Clean up None values
-            cleaned_data = {}
-            for key, value in geolocation_data.items():
-                if value is not None:
-                    if isinstance(value, dict):
-                        # Clean nested dictionaries
-                        cleaned_nested = {k: v for k, v in value.items() if v is not None}
-                        if cleaned_nested:
-                            cleaned_data[key] = cleaned_nested
-                    else:
-                        cleaned_data[key] = value
-            
-            logger.info(f"IP geolocation lookup completed for {ip}")
-            return {
-                'success': True,
-                'geolocation_data': cleaned_data
-            }
-            
-        elif response.status_code == 404:
-            logger.warning(f"IP not found in geolocation database: {ip}")
+        # Check if the API returned an error
+        if data.get('success') == False:
+            logger.error(f"IPwho.is API error for {ip}: {data.get('message', 'Unknown error')}")
             return {
                 'success': False,
-                'error': 'IP not found in geolocation database',
+                'error': data.get('message', 'IPwho.is API error'),
                 'ip': ip
             }
-        else:
-            logger.error(f"IPwho.is API error for {ip}: {response.status_code}")
-            return {
-                'success': False,
-                'error': f'IPwho.is API error: {response.status_code}',
-                'ip': ip
+        
+        # Extract relevant information
+        geolocation_data = {
+            'ip': data.get('ip'),
+            'type': data.get('type'),  # ipv4 or ipv6
+            'continent': data.get('continent'),
+            'continent_code': data.get('continent_code'),
+            'country': data.get('country'),
+            'country_code': data.get('country_code'),
+            'region': data.get('region'),
+            'region_code': data.get('region_code'),
+            'city': data.get('city'),
+            'latitude': data.get('latitude'),
+            'longitude': data.get('longitude'),
+            'timezone': {
+                'id': data.get('timezone', {}).get('id'),
+                'abbr': data.get('timezone', {}).get('abbr'),
+                'utc': data.get('timezone', {}).get('utc'),
+                'current_time': data.get('timezone', {}).get('current_time')
+            },
+            'isp': data.get('connection', {}).get('isp'),
+            'org': data.get('connection', {}).get('org'),
+            'as': data.get('connection', {}).get('as'),
+            'asname': data.get('connection', {}).get('asname'),
+            'domain': data.get('connection', {}).get('domain'),
+            'mobile': data.get('connection', {}).get('mobile'),
+            'proxy': data.get('connection', {}).get('proxy'),
+            'hosting': data.get('connection', {}).get('hosting'),
+            'vpn': data.get('connection', {}).get('vpn'),
+            'tor': data.get('connection', {}).get('tor'),
+            'relay': data.get('connection', {}).get('relay'),
+            'service': data.get('connection', {}).get('service'),
+            'postal': data.get('postal'),
+            'calling_code': data.get('calling_code'),
+            'flag': data.get('flag'),
+            'flag_img': data.get('flag_img'),
+            'flag_emoji': data.get('flag_emoji'),
+            'flag_emoji_unicode': data.get('flag_emoji_unicode'),
+            'currency': {
+                'name': data.get('currency', {}).get('name'),
+                'code': data.get('currency', {}).get('code'),
+                'symbol': data.get('currency', {}).get('symbol'),
+                'plural': data.get('currency', {}).get('plural'),
+                'exchange_rate': data.get('currency', {}).get('exchange_rate')
+            },
+            'security': {
+                'anonymous': data.get('security', {}).get('anonymous'),
+                'proxy': data.get('security', {}).get('proxy'),
+                'vpn': data.get('security', {}).get('vpn'),
+                'tor': data.get('security', {}).get('tor'),
+                'relay': data.get('security', {}).get('relay'),
+                'hosting': data.get('security', {}).get('hosting'),
+                'service': data.get('security', {}).get('service')
             }
+        }
+        
+        # Clean up None values
+        cleaned_data = clean_geolocation_data(geolocation_data)
+        
+        logger.info(f"IP geolocation lookup completed for {ip}")
+        return {
+            'success': True,
+            'geolocation_data': cleaned_data,
+            'source': 'ipwho.is'
+        }
+        
+    elif response.status_code == 404:
+        logger.warning(f"IP not found in geolocation database: {ip}")
+        return {
+            'success': False,
+            'error': 'IP not found in geolocation database',
+            'ip': ip
+        }
+    else:
+        logger.error(f"IPwho.is API error for {ip}: {response.status_code}")
+        return {
+            'success': False,
+            'error': f'IPwho.is API error: {response.status_code}',
+            'ip': ip
+        }
+
+def request_ip_geolocation(ip: str):
+    """
+    Make request to ipwho.is API over the shared keep-alive session
+    """
+    return get_session('ipwhois').get(
+        IPWHOIS_URL.format(ip),
+        headers={
+            'User-Agent': 'OSINT-Dashboard/1.0'
+        },
+        timeout=HTTP_TIMEOUT
+    )
+
+def fetch_ip_geolocation(ip: str) -> Dict:
+    """
+    Get IP geolocation data from ipwho.is API
+    """
+    try:
+        logger.info(f"Starting IP geolocation lookup for: {ip}")
+        
+        # Fail fast while ipwho.is is known to be down
+        breaker = get_circuit_breaker('ipwhois')
+        breaker.check()
+        
+        # Wait for a slot in the ipwho.is quota shared by all workers
+        limiter = get_rate_limiter('ipwhois')
+        limiter.acquire()
+        
+        response = call_hedged(breaker, limiter, request_ip_geolocation, ip)
+        return parse_ip_geolocation_response(ip, response)
             
+    except CircuitOpenError:
+        logger.warning(f"IPwho.is circuit open, skipping lookup for {ip}")
+        return {
+            'success': False,
+            'error': 'IPwho.is API temporarily unavailable',
+            'ip': ip
+        }
+    except RateLimitExceeded:
+        return {
+            'success': False,
+            'error': 'IPwho.is API rate limit exceeded, try again later',
+            'ip': ip
+        }
     except requests.exceptions.Timeout:
         logger.error(f"IPwho.is API timeout for {ip}")
         return {
@@ -155,6 +372,45 @@ def get_ip_geolocation(ip: str) -> Dict:
             'ip': ip
         }
 
+def build_ip_result(ip: str) -> Dict:
+    """
+    Geolocation result for a validated IP
+    """
+    # Get geolocation data
+    geolocation_result = get_ip_geolocation(ip)
+    
+    return format_ip_result(ip, geolocation_result)
+
+def format_ip_result(ip: str, geolocation_result: Dict) -> Dict:
+    """
+    Response body for an IP lookup
+    """
+    if not geolocation_result['success']:
+        return geolocation_result
+    
+    result = {
+        'success': True,
+        'ip': ip,
+        'geolocation': geolocation_result['geolocation_data'],
+        'source': geolocation_result.get('source')
+    }
+    if 'network' in geolocation_result:
+        # Answered from the cached result for this block
+        result['network'] = geolocation_result['network']
+    return result
+
+def lookup_ip_item(ip: str) -> Dict:
+    """
+    Validate and look up a single batch item
+    """
+    if not validate_ip(ip):
+        return {
+            'success': False,
+            'error': 'Invalid IP address format',
+            'ip': ip
+        }
+    return build_ip_result(ip)
+
 @ip_bp.route('/ip', methods=['GET'])
 def ip_lookup():
     """
@@ -184,23 +440,47 @@ def ip_lookup():
                 'error': 'Invalid IP address format'
             }), 400
         
-        # Get geolocation data
-        geolocation_result = get_ip_geolocation(ip)
-        
         # Prepare response
-        if geolocation_result['success']:
-            result = {
-                'success': True,
-                'ip': ip,
-                'geolocation': geolocation_result['geolocation_data']
-            }
+        result = build_ip_result(ip)
+        if result['success']:
             return jsonify(result), 200
         else:
-            return jsonify(geolocation_result), 500
+            return jsonify(result), 500
         
     except Exception as e:
         logger.error(f"Error in ip_lookup: {str(e)}")
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+@ip_bp.route('/ip/batch', methods=['POST'])
+def ip_batch_lookup():
+    """
+    POST /api/ip/batch  {"ips": [...]}
+    Return geolocation information for each IP, keyed by input
+    """
+    try:
+        try:
+            ips = get_batch_items(request.get_json(silent=True), 'ips')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        logger.info(f"IP batch request received: {len(ips)} items")
+        results = run_batch(ips, lambda ip: ip.strip(), lookup_ip_item)
+        
+        return jsonify({
+            'success': True,
+            'count': len(results),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error in ip_batch_lookup: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
\ No newline at end of file
@@ -1,24 +1,212 @@
-from flask import Blueprint, request, jsonify
-import subprocess
+from flask import Blueprint, Response, request, jsonify
 import logging
 import os
-import signal
-import threading
-import time
-from typing import Dict, List, Optional
+import sys
+import re
+import json
+from typing import Callable, Dict, List, Optional
+from werkzeug.http import http_date
+from utils.cache import TTLCache
+from utils.hot_keys import hot_keys
+from utils.jobs import JobQueue, QueueFullError
+from utils.metrics import track_upstream
+from utils.persistent_cache import get_persistent_cache, revalidate
+from utils.process_pool import ProcessPool
+from utils.singleflight import SingleFlight
+from utils.sherlock_engine import get_sherlock_engine
+from utils.sherlock_sites import SITE_GROUPS, ScanOptions, parse_scan_options, select_sites, site_stats, split_names
 
 logger = logging.getLogger(__name__)
 sherlock_bp = Blueprint('sherlock', __name__)
 
-class TimeoutError(Exception):
-    pass
+# 'native' checks sites in-process, 'subprocess' runs the Sherlock CLI per request
+SHERLOCK_ENGINE = os.getenv('SHERLOCK_ENGINE', 'native').lower()
+SHERLOCK_MODULE = os.getenv('SHERLOCK_MODULE', 'sherlock_project')
 
-def timeout_handler(signum, frame):
-    raise TimeoutError("Sherlock execution timed out")
+SHERLOCK_FOUND_PATTERN = re.compile(r'\[\+\] ([^:]+): (.+)')
 
-def run_sherlock_with_timeout(username: str, timeout: int = 300) -> Dict:
+# Background executor for Sherlock scans so long runs never hold a request thread
+sherlock_jobs = JobQueue(
+    'sherlock',
+    max_workers=int(os.getenv('SHERLOCK_MAX_CONCURRENT_JOBS', '2')),
+    max_pending=int(os.getenv('SHERLOCK_MAX_PENDING_JOBS', '20')),
+    retention=int(os.getenv('SHERLOCK_JOB_RETENTION', '3600'))
+)
+
+# Repeated searches for the same username are served from memory
+sherlock_cache = TTLCache(
+    'sherlock',
+    ttl=float(os.getenv('SHERLOCK_CACHE_TTL', '3600')),
+    negative_ttl=float(os.getenv('SHERLOCK_CACHE_NEGATIVE_TTL', '600')),
+    max_entries=int(os.getenv('SHERLOCK_CACHE_MAX_ENTRIES', '1000')),
+    max_bytes=int(os.getenv('SHERLOCK_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+)
+
+# Concurrent searches for the same username share one scan
+sherlock_flight = SingleFlight('sherlock')
+
+# Subprocess scans run on a fixed pool of warm workers with hard limits
+sherlock_workers = ProcessPool(
+    'sherlock-workers',
+    [sys.executable, '-m', 'utils.sherlock_worker', SHERLOCK_MODULE,
+     *split_names(os.getenv('SHERLOCK_PRELOAD', 'sherlock_project.sherlock'))],
+    size=int(os.getenv('SHERLOCK_WORKERS', '2')),
+    max_queued=int(os.getenv('SHERLOCK_MAX_QUEUED', '8')),
+    memory_mb=int(os.getenv('SHERLOCK_WORKER_MEMORY_MB', '1024')),
+    cpu_seconds=int(os.getenv('SHERLOCK_WORKER_CPU_SECONDS', '300')),
+    kill_grace=float(os.getenv('SHERLOCK_KILL_GRACE', '2')),
+    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+# Seconds between keep-alive comments on idle event streams
+SSE_HEARTBEAT_INTERVAL = 15
+
+def parse_sherlock_line(line: str) -> Optional[Dict]:
+    """
+    Parse a single line of Sherlock output into a found profile record
+    """
+    # Look for lines that start with [+] indicating found profiles
+    if not line.strip().startswith('[+]'):
+        return None
+    
+    # Extract site name and URL
+    match = SHERLOCK_FOUND_PATTERN.search(line)
+    if not match:
+        return None
+    
+    return {
+        'site': match.group(1).strip(),
+        'url': match.group(2).strip(),
+        'status': 'found'
+    }
+
+def init_sherlock_engine():
+    """
+    Load the native engine's site manifest once at startup
+    """
+    if SHERLOCK_ENGINE == 'native' and get_sherlock_engine() is not None:
+        return
+    if SHERLOCK_ENGINE == 'native':
+        logger.warning("Falling back to the Sherlock subprocess engine")
+    sherlock_workers.start()
+
+def partial_scan_result(username: str, results: List[Dict]) -> Dict:
+    """
+    Profiles found before the scan deadline
+    """
+    logger.warning(f"Sherlock deadline reached for {username}, returning {len(results)} profiles found so far")
+    return {
+        'success': True,
+        'username': username,
+        'results': results,
+        'total_found': len(results),
+        'partial': True
+    }
+
+def run_sherlock_native(engine, username: str, timeout: int,
+                        on_result: Optional[Callable[[Dict], None]] = None,
+                        sites: Optional[List[str]] = None, partial: bool = False,
+                        pinned: Optional[List[str]] = None) -> Dict:
+    """
+    Run a Sherlock search with the in-process engine
+    """
+    with track_upstream('sherlock') as call:
+        results, timed_out = engine.search(username, timeout=timeout, on_result=on_result, sites=sites,
+                                           pinned=pinned)
+        if timed_out:
+            call.outcome = 'timeout'
+    
+    if timed_out:
+        if partial:
+            return partial_scan_result(username, results)
+        logger.warning(f"Sherlock timeout for {username}")
+        return {
+            'success': False,
+            'error': 'Sherlock execution timed out',
+            'username': username
+        }
+    
+    logger.info(f"Sherlock completed successfully for {username}, found {len(results)} profiles")
+    return {
+        'success': True,
+        'username': username,
+        'results': results,
+        'total_found': len(results)
+    }
+
+def sherlock_args(username: str, sites: Optional[List[str]] = None) -> List[str]:
+    """
+    Sherlock CLI arguments, limited to sites when given
+    """
+    args = [username, '--timeout', '10']
+    for site in sites or []:
+        args.extend(['--site', site])
+    return args
+
+def run_sherlock_subprocess(username: str, timeout: int,
+                            on_result: Optional[Callable[[Dict], None]] = None,
+                            sites: Optional[List[str]] = None, partial: bool = False) -> Dict:
+    """
+    Run a Sherlock search with the Sherlock CLI on a pooled worker
+    Raises QueueFullError when the worker pool is full
+    """
+    args = sherlock_args(username, sites)
+    logger.info(f"Running Sherlock {SHERLOCK_MODULE} with arguments: {' '.join(args)}")
+    
+    # Found profiles are reported as soon as Sherlock prints them
+    results = []
+    
+    def read_line(line: str):
+        record = parse_sherlock_line(line)
+        if record:
+            results.append(record)
+            if on_result:
+                on_result(record)
+    
+    returncode, stderr = sherlock_workers.run(args, timeout, read_line)
+    
+    if returncode is None:
+        if partial:
+            return partial_scan_result(username, list(results))
+        logger.warning(f"Sherlock timeout for {username}")
+        return {
+            'success': False,
+            'error': 'Sherlock execution timed out',
+            'username': username
+        }
+    
+    if returncode == 0:
+        logger.info(f"Sherlock completed successfully for {username}, found {len(results)} profiles")
+        site_stats.record_scan(sites, [record['site'] for record in results])
+        return {
+            'success': True,
+            'username': username,
+            'results': results,
+            'total_found': len(results)
+        }
+    
+    # A negative status means a signal, e.g. SIGXCPU for the CPU limit
+    logger.error(f"Sherlock failed for {username} with status {returncode}: {stderr}")
+    # Return a graceful fallback response
+    return {
+        'success': True,
+        'username': username,
+        'results': [],
+        'total_found': 0,
+        'note': f'Sherlock execution failed: {stderr[:100]}...'
+    }
+
+def run_sherlock_with_timeout(username: str, timeout: int = 300,
+                              on_result: Optional[Callable[[Dict], None]] = None,
+                              sites: Optional[List[str]] = None, partial: bool = False,
+                              pinned: Optional[List[str]] = None) -> Dict:
     """
     Run Sherlock tool with timeout and return results
+    
+    on_result is called with each found profile as soon as Sherlock prints it.
+    sites limits the scan to those sites, and pinned sites (requested by name)
+    are checked even while they are being skipped for failures. With partial,
+    hitting the timeout returns the profiles found so far instead of an error.
     """
     try:
         # Check if username is provided
@@ -33,79 +221,32 @@ def run_sherlock_with_timeout(username: str, timeout: int = 300) -> Dict:
         username = username.strip()
         logger.info(f"Starting Sherlock search for username: {username}")
         
-        # Try to run Sherlock using python -m sherlock_project
-        cmd = ['python', '-m', 'sherlock_project', username, '--timeout', '10']
-        
-        logger.info(f"Executing Sherlock command: {' '.join(cmd)}")
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            shell=False
-        )
-        
-        try:
-            stdout, stderr = process.communicate(timeout=timeout)
-            
-            if process.returncode == 0:
-                # Parse text output from Sherlock
-                import re
-                try:
-                    # Parse the text output to extract found profiles
-                    results = []
-                    lines = stdout.split('\n')
-                    
-                    for line in lines:
-                        # Look for lines that start with [+] indicating found profiles
-                        if line.strip().startswith('[+]'):
-                            # Extract site name and URL
-                            match = re.search(r'\[\+\] ([^:]+): (.+)', line)
-                            if match:
-                                site_name = match.group(1).strip()
-                                url = match.group(2).strip()
-                                results.append({
-                                    'site': site_name,
-                                    'url': url,
-                                    'status': 'found'
-                                })
-                    
-                    logger.info(f"Sherlock completed successfully for {username}, found {len(results)} profiles")
-                    return {
-                        'success': True,
-                        'username': username,
-                        'results': results,
-                        'total_found': len(results)
-                    }
-                except Exception as parse_error:
-                    logger.error(f"Failed to parse Sherlock output for {username}: {parse_error}")
-                    return {
-                        'success': False,
-                        'error': 'Failed to parse Sherlock results',
-                        'username': username,
-                        'raw_output': stdout[:500]  # First 500 chars for debugging
-                    }
-            else:
-                logger.error(f"Sherlock failed for {username}: {stderr}")
-                # Return a graceful fallback response
-                return {
-                    'success': True,
-                    'username': username,
-                    'results': [],
-                    'total_found': 0,
-                    'note': f'Sherlock execution failed: {stderr[:100]}...'
-                }
-                
-        except subprocess.TimeoutExpired:
-            # Kill the process
-            process.terminate()
-            
-            logger.warning(f"Sherlock timeout for {username}")
+        if sites is not None and not sites:
+            # None of the requested sites are in the manifest
             return {
-                'success': False,
-                'error': 'Sherlock execution timed out',
-                'username': username
+                'success': True,
+                'username': username,
+                'results': [],
+                'total_found': 0
             }
+        
+        # Prefer the in-process engine, it avoids an interpreter start per request
+        engine = get_sherlock_engine() if SHERLOCK_ENGINE == 'native' else None
+        if engine is not None:
+            return run_sherlock_native(engine, username, timeout, on_result, sites, partial, pinned)
+        
+        # Fall back to running the Sherlock CLI
+        with track_upstream('sherlock') as call:
+            result = run_sherlock_subprocess(username, timeout, on_result, sites, partial)
+            if not result['success'] or result.get('partial'):
+                call.outcome = 'timeout'
+            elif 'note' in result:
+                call.outcome = 'failed'
+        return result
+    
+    except QueueFullError:
+        # Callers answer with 503 and Retry-After
+        raise
             
     except Exception as e:
         logger.error(f"Unexpected error in Sherlock for {username}: {str(e)}")
@@ -115,10 +256,106 @@ def run_sherlock_with_timeout(username: str, timeout: int = 300) -> Dict:
             'username': username
         }
 
+def normalize_username(username: str) -> str:
+    """
+    Cache key for a username
+    """
+    return username.strip().lower()
+
+def is_complete_scan(scan: Dict) -> bool:
+    return scan['success'] and 'note' not in scan and not scan.get('partial')
+
+def sherlock_cache_ttl(scan: Dict) -> float:
+    return sherlock_cache.negative_ttl if scan['total_found'] == 0 else sherlock_cache.ttl
+
+def scan_sites(options: ScanOptions) -> Optional[List[str]]:
+    """
+    Sites selected by options among those the active engine can check
+    """
+    engine = get_sherlock_engine() if SHERLOCK_ENGINE == 'native' else None
+    return select_sites(options, list(engine.sites) if engine else None)
+
+def scan_options_from_args(args) -> ScanOptions:
+    """
+    Scan options from request arguments or a JSON body
+    Raises ValueError with a client-facing message when a value is invalid
+    """
+    return parse_scan_options(args.get('sites'), args.get('groups'), args.get('top'), args.get('deadline'))
+
+def get_sherlock_results(username: str, timeout: int = 300,
+                         on_result: Optional[Callable[[Dict], None]] = None,
+                         options: Optional[ScanOptions] = None) -> Dict:
+    """
+    Run Sherlock through the result cache
+    Cached results are replayed to on_result so callers see the same events
+    """
+    options = options or ScanOptions()
+    key = options.cache_key(normalize_username(username))
+    if options.deadline:
+        timeout = min(timeout, options.deadline)
+    
+    def scan(on_result=None):
+        return run_sherlock_with_timeout(username, timeout=timeout, on_result=on_result,
+                                         sites=scan_sites(options), partial=options.deadline is not None,
+                                         pinned=options.sites)
+    # Scans with a deadline may end partial and are never cached, so they cannot refresh one
+    if not options.deadline:
+        hot_keys.record('sherlock', key, scan, cacheable=is_complete_scan, ttl_for=sherlock_cache_ttl)
+    cached = sherlock_cache.get(key)
+    if cached is not None:
+        result, age = cached
+        logger.info(f"Sherlock cache hit for {username} (age {age:.0f}s)")
+        if on_result:
+            for record in result.get('results', []):
+                on_result(record)
+        result = dict(result)
+        result['cached'] = True
+        result['cache_age'] = round(age, 1)
+        return result
+    
+    # Scans survive restarts and are shared between workers through the persistent cache
+    persistent = get_persistent_cache()
+    entry = persistent.get('sherlock', key) if persistent else None
+    if entry is not None:
+        result, age, stale = entry
+        logger.info(f"Sherlock persistent cache hit for {username} (age {age:.0f}s{', stale' if stale else ''})")
+        if stale:
+            revalidate('sherlock', key, scan, cacheable=is_complete_scan, ttl_for=sherlock_cache_ttl)
+        if on_result:
+            for record in result.get('results', []):
+                on_result(record)
+        result = dict(result)
+        result['cached'] = True
+        result['cache_age'] = round(age, 1)
+        return result
+    
+    def run_and_cache():
+        result = scan(on_result)
+        
+        # Only cache complete scans, not timeouts, partial scans or failed executions
+        if is_complete_scan(result):
+            sherlock_cache.set(key, result, negative=result['total_found'] == 0)
+            if persistent:
+                persistent.set('sherlock', key, result, ttl=sherlock_cache_ttl(result))
+        return result
+    
+    # Callers that joined another caller's scan get its results replayed,
+    # scans with different deadlines are not shared
+    flight_key = f'{key}|deadline={options.deadline}' if options.deadline else key
+    result, joined = sherlock_flight.do(flight_key, run_and_cache)
+    if joined and on_result and result.get('results'):
+        for record in result['results']:
+            on_result(record)
+    
+    result = dict(result)
+    result['cached'] = False
+    result['cache_age'] = 0
+    return result
+
 @sherlock_bp.route('/sherlock', methods=['GET'])
 def sherlock_search():
     """
-    GET /api/sherlock?username=...
+    GET /api/sherlock?username=...[&sites=...][&groups=...][&top=N][&deadline=SECONDS]
     Run Sherlock tool to find social media accounts
     """
     try:
@@ -134,8 +371,20 @@ def sherlock_search():
                 'error': 'Username parameter is required'
             }), 400
         
+        try:
+            options = scan_options_from_args(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Run Sherlock
-        result = run_sherlock_with_timeout(username)
+        try:
+            result = get_sherlock_results(username, options=options)
+        except QueueFullError as e:
+            logger.warning(f"Rejecting Sherlock search for {username}: {str(e)}")
+            return queue_full_response('Sherlock workers are busy, please retry later')
         
         if result['success']:
             return jsonify(result), 200
@@ -147,4 +396,220 @@ def sherlock_search():
         return jsonify({
             'success': False,
             'error': f'Internal server error: {str(e)}'
-        }), 500 
\ No newline at end of file
+        }), 500 
+
+def submit_sherlock_job(username: str, options: Optional[ScanOptions] = None):
+    """
+    Queue a Sherlock scan that reports each found profile on the job
+    """
+    options = options or ScanOptions()
+    params = {'username': username}
+    if not options.full_scan or options.deadline:
+        params['scan'] = options.to_dict()
+    return sherlock_jobs.submit(
+        lambda job: get_sherlock_results(username, on_result=job.add_result, options=options),
+        params
+    )
+
+def queue_full_response(error: str = 'Sherlock job queue is full, please retry later'):
+    """
+    503 response telling the client when to retry a rejected Sherlock job
+    """
+    response = jsonify({
+        'success': False,
+        'error': error
+    })
+    response.headers['Retry-After'] = '30'
+    return response, 503
+
+def format_sse(event: str, data: Dict) -> str:
+    """
+    Format a single Server-Sent Event, encoding dates like jsonify
+    """
+    return f"event: {event}\ndata: {json.dumps(data, default=http_date)}\n\n"
+
+def stream_job_events(job):
+    """
+    Yield SSE events for each found profile of a job, then a summary event
+    """
+    yield format_sse('job', {'job_id': job.job_id, 'status': job.status})
+    
+    seen = 0
+    while True:
+        new_results, finished = job.wait_for_update(seen, SSE_HEARTBEAT_INTERVAL)
+        for record in new_results:
+            yield format_sse('result', record)
+        seen += len(new_results)
+        
+        if finished:
+            break
+        if not new_results:
+            yield ': keep-alive\n\n'
+    
+    result = job.result or {}
+    yield format_sse('summary', {
+        'success': job.status == 'completed',
+        'job_id': job.job_id,
+        'username': job.params.get('username'),
+        'status': job.status,
+        'total_found': seen,
+        'error': job.error,
+        'note': result.get('note'),
+        'partial': result.get('partial', False),
+        'cached': result.get('cached', False),
+        'cache_age': result.get('cache_age')
+    })
+
+@sherlock_bp.route('/sherlock/jobs', methods=['POST'])
+def create_sherlock_job():
+    """
+    POST /api/sherlock/jobs
+    Queue a Sherlock search and return its job ID right away
+    """
+    try:
+        # Log incoming request
+        logger.info(f"Sherlock job request received: {request.args}")
+        
+        # Accept the username from a JSON body, form data or query parameters
+        payload = request.get_json(silent=True) or {}
+        username = payload.get('username') or request.form.get('username') or request.args.get('username')
+        
+        if not username or not username.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Username parameter is required'
+            }), 400
+        
+        username = username.strip()
+        
+        try:
+            # Scan options may come from the JSON body or the query string
+            options = scan_options_from_args(dict(request.args.to_dict(), **payload))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        try:
+            job = submit_sherlock_job(username, options)
+        except QueueFullError as e:
+            logger.warning(f"Rejecting Sherlock job for {username}: {str(e)}")
+            return queue_full_response()
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.job_id,
+            'status': job.status,
+            'status_url': f'/api/sherlock/jobs/{job.job_id}'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error in create_sherlock_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@sherlock_bp.route('/sherlock/jobs/<job_id>', methods=['GET'])
+def get_sherlock_job(job_id: str):
+    """
+    GET /api/sherlock/jobs/<job_id>
+    Return status, partial results and final results of a Sherlock job
+    """
+    try:
+        job = sherlock_jobs.get(job_id)
+        
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': 'Job not found'
+            }), 404
+        
+        result = {'success': True}
+        result.update(job.to_dict())
+        return jsonify(result), 200
+        
+    except Exception as e:
+        logger.error(f"Error in get_sherlock_job: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@sherlock_bp.route('/sherlock/stream', methods=['GET'])
+def sherlock_stream():
+    """
+    GET /api/sherlock/stream?username=...[&sites=...][&groups=...][&top=N][&deadline=SECONDS] or ?job_id=...
+    Stream found profiles as Server-Sent Events while Sherlock runs
+    """
+    try:
+        # Log incoming request
+        logger.info(f"Sherlock stream request received: {request.args}")
+        
+        job_id = request.args.get('job_id')
+        username = request.args.get('username')
+        
+        if job_id:
+            # Attach to an existing background job
+            job = sherlock_jobs.get(job_id)
+            if job is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Job not found'
+                }), 404
+        else:
+            if not username or not username.strip():
+                return jsonify({
+                    'success': False,
+                    'error': 'Username parameter is required'
+                }), 400
+            
+            username = username.strip()
+            try:
+                options = scan_options_from_args(request.args)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            try:
+                job = submit_sherlock_job(username, options)
+            except QueueFullError as e:
+                logger.warning(f"Rejecting Sherlock stream for {username}: {str(e)}")
+                return queue_full_response()
+        
+        response = Response(stream_job_events(job), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error in sherlock_stream: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
+@sherlock_bp.route('/sherlock/sites', methods=['GET'])
+def sherlock_sites():
+    """
+    GET /api/sherlock/sites
+    Return the site groups, the sites with the best hit rates, the slowest
+    sites with their adaptive timeouts and the sites being skipped
+    """
+    try:
+        result = {
+            'success': True,
+            'groups': SITE_GROUPS
+        }
+        result.update(site_stats.stats())
+        return jsonify(result), 200
+        
+    except Exception as e:
+        logger.error(f"Error in sherlock_sites: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Internal server error: {str(e)}'
+        }), 500
@@ -118,6 +118,48 @@ def test_sherlock_endpoint():
         print(f"❌ Sherlock endpoint error: {e}")
         return False
 
+def test_sherlock_job_endpoint():
+    """Test asynchronous Sherlock job endpoints"""
+    print(f"🔍 Testing Sherlock job endpoints with {TEST_USERNAME}...")
+    try:
+        response = requests.post(f"{BASE_URL}/api/sherlock/jobs", json={"username": TEST_USERNAME}, timeout=10)
+        if response.status_code != 202:
+            print(f"❌ Sherlock job creation failed: {response.status_code}")
+            return False
+        job_id = response.json().get('job_id')
+        response = requests.get(f"{BASE_URL}/api/sherlock/jobs/{job_id}", timeout=10)
+        if response.status_code == 200:
+            data = response.json()
+            print("✅ Sherlock job endpoints passed")
+            print(f"   Job status: {data.get('status', 'N/A')}")
+            return True
+        else:
+            print(f"❌ Sherlock job status failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Sherlock job endpoint error: {e}")
+        return False
+
+def test_ip_batch_endpoint():
+    """Test batch IP geolocation endpoint"""
+    print(f"🔍 Testing IP batch endpoint with {TEST_IP}...")
+    try:
+        response = requests.post(f"{BASE_URL}/api/ip/batch", json={"ips": [TEST_IP, TEST_IP]}, timeout=30)
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('success') and TEST_IP in data.get('results', {}):
+                print("✅ IP batch endpoint passed")
+                return True
+            else:
+                print(f"❌ IP batch endpoint failed: {data.get('error')}")
+                return False
+        else:
+            print(f"❌ IP batch endpoint failed: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ IP batch endpoint error: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("🚀 Starting OSINT Backend Tests")
@@ -128,7 +170,9 @@ def main():
         test_email_endpoint,
         test_domain_endpoint,
         test_ip_endpoint,
-        test_sherlock_endpoint
+        test_ip_batch_endpoint,
+        test_sherlock_endpoint,
+        test_sherlock_job_endpoint
     ]
     
     passed = 0
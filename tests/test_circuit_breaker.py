@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, percentile
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+def test_opens_after_consecutive_failures_and_rejects_calls():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+    for _ in range(3):
+        breaker.call(lambda: Response(503))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: Response(200))
+    assert breaker.stats()['rejected'] == 1
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker('test', failure_threshold=2)
+    breaker.call(lambda: Response(500))
+    breaker.call(lambda: Response(200))
+    breaker.call(lambda: Response(500))
+    assert breaker.state == CLOSED
+
+def test_half_open_probe_closes_the_circuit():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.call(lambda: Response(429))
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    breaker.check()
+    assert breaker.call(lambda: Response(200)).status_code == 200
+    assert breaker.state == CLOSED
+
+def test_failed_probe_reopens_and_only_one_probe_runs():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+    breaker.call(lambda: Response(500))
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+
+def test_slow_successes_count_as_failures():
+    breaker = CircuitBreaker('test', failure_threshold=2, slow_call_seconds=0.01)
+    breaker.record(True, 0.5)
+    breaker.record(True, 0.5)
+    assert breaker.state == OPEN
+
+def test_exceptions_count_as_failures_and_propagate():
+    breaker = CircuitBreaker('test', failure_threshold=1)
+
+    def fail():
+        raise ConnectionError('down')
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail)
+    assert breaker.state == OPEN
+
+def test_percentile_is_nearest_rank():
+    samples = [float(value) for value in range(1, 101)]
+    assert percentile(samples, 50) == 51.0
+    assert percentile(samples, 95) == 96.0
+    assert percentile([], 95) is None
@@ -0,0 +1,37 @@
+import dns.resolver
+import pytest
+
+from routes import domain_routes
+from routes.domain_routes import DNSResolverUnavailable, create_dns_resolver, format_domain_result
+
+class UnconfiguredResolver(dns.resolver.Resolver):
+    """
+    Resolver on a host without /etc/resolv.conf
+    """
+
+    def __init__(self, configure=True):
+        if configure:
+            raise dns.resolver.NoResolverConfiguration('no resolv.conf')
+        super().__init__(configure=False)
+
+def test_missing_system_configuration_is_a_clear_error(monkeypatch):
+    monkeypatch.delenv('DNS_NAMESERVERS', raising=False)
+    with pytest.raises(DNSResolverUnavailable, match='DNS_NAMESERVERS'):
+        create_dns_resolver(UnconfiguredResolver)
+
+def test_configured_nameservers_do_not_need_the_system_configuration(monkeypatch):
+    monkeypatch.setenv('DNS_NAMESERVERS', '192.0.2.53, 198.51.100.53')
+    resolver = create_dns_resolver(UnconfiguredResolver)
+    assert resolver.nameservers == ['192.0.2.53', '198.51.100.53']
+    assert resolver.lifetime == domain_routes.DNS_TIMEOUT
+
+def test_domain_lookup_reports_unavailable_dns(monkeypatch):
+    monkeypatch.delenv('DNS_NAMESERVERS', raising=False)
+    monkeypatch.setattr(domain_routes, '_dns_resolver', None)
+    monkeypatch.setattr(domain_routes, 'create_dns_resolver', lambda: create_dns_resolver(UnconfiguredResolver))
+    monkeypatch.setattr(domain_routes, 'get_whois_data', lambda domain, backend=None: {'success': False, 'error': 'offline'})
+
+    result = domain_routes.build_domain_result('example.com')
+    assert result['dns_records'] == {record_type: [] for record_type in domain_routes.DNS_RECORD_TYPES}
+    assert 'DNS_NAMESERVERS' in result['dns_error']
+    assert 'dns_error' not in format_domain_result('example.com', {}, {'success': False, 'error': 'offline'})
@@ -0,0 +1,60 @@
+from utils.email_classifier import (
+    DOMAIN_MIN_SAMPLES, DISPOSABLE_DOMAINS, FREE_PROVIDER_DOMAINS, ROLE_LOCAL_PARTS,
+    EmailClassifier, domain_suffixes, load_domain_file, local_reputation
+)
+
+def classifier():
+    return EmailClassifier(DISPOSABLE_DOMAINS, FREE_PROVIDER_DOMAINS, ROLE_LOCAL_PARTS)
+
+def test_domain_suffixes_stop_at_two_labels():
+    assert list(domain_suffixes('a.b.example.com')) == ['a.b.example.com', 'b.example.com', 'example.com']
+
+def test_disposable_domains_and_their_subdomains_are_conclusive():
+    email_classifier = classifier()
+    assert email_classifier.classify('bob@mailinator.com')['conclusive']
+    result = email_classifier.classify('Bob@Inbox.Mailinator.com')
+    assert result['disposable'] and result['domain'] == 'inbox.mailinator.com'
+
+def test_free_provider_and_role_accounts_are_flagged_but_not_conclusive():
+    result = classifier().classify('admin+alerts@gmail.com')
+    assert result['free_provider'] and result['role_account']
+    assert not result['disposable'] and not result['conclusive']
+
+def test_domain_is_learned_disposable_only_when_every_answer_agrees():
+    email_classifier = classifier()
+    for index in range(DOMAIN_MIN_SAMPLES):
+        email_classifier.record(f'user{index}@fresh-trash.test', {'details': {'disposable': True}})
+    result = email_classifier.classify('new@fresh-trash.test')
+    assert result['conclusive'] and result['learned']
+    assert result['domain_reputation']['lookups'] == DOMAIN_MIN_SAMPLES
+
+    email_classifier.record('real@fresh-trash.test', {'details': {'disposable': False}})
+    assert not email_classifier.classify('new@fresh-trash.test')['conclusive']
+
+def test_learned_verdicts_expire_until_upstream_agrees_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('utils.email_classifier.time.monotonic', lambda: now[0])
+    monkeypatch.setattr('utils.email_classifier.LEARNED_TTL', 60)
+    email_classifier = classifier()
+    for index in range(DOMAIN_MIN_SAMPLES):
+        email_classifier.record(f'user{index}@fresh-trash.test', {'details': {'disposable': True}})
+    assert email_classifier.classify('new@fresh-trash.test')['learned']
+
+    # Past the TTL the next address goes to emailrep.io again
+    now[0] += 61
+    assert not email_classifier.classify('new@fresh-trash.test')['conclusive']
+    email_classifier.record('new@fresh-trash.test', {'details': {'disposable': True}})
+    assert email_classifier.classify('new@fresh-trash.test')['learned']
+
+def test_local_reputation_matches_emailrep_shape():
+    email_classifier = classifier()
+    reputation = local_reputation('x@yopmail.com', email_classifier.classify('x@yopmail.com'))
+    assert reputation['suspicious'] and reputation['reputation'] == 'low'
+    assert reputation['details']['disposable']
+
+def test_load_domain_file_skips_comments(tmp_path):
+    path = tmp_path / 'domains.txt'
+    path.write_text('# list\nTrash.Example\n\nspam.example # inline\n')
+    assert load_domain_file(str(path)) == frozenset({'trash.example', 'spam.example'})
+    assert load_domain_file(str(tmp_path / 'missing.txt')) == frozenset()
+    assert load_domain_file(None) == frozenset()
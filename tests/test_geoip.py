@@ -0,0 +1,53 @@
+import pytest
+
+from utils.geoip import GeoIPDatabase
+
+CSV = """network,start_ip,end_ip,country,country_code,city,latitude,longitude,asn
+,1.0.0.0,1.0.0.255,Australia,AU,Sydney,-33.87,151.21,13335
+,16777472,16777727,China,CN,Fuzhou,26.06,119.3,
+8.8.8.0/24,,,United States,US,Mountain View,37.4,-122.08,15169
+2001:db8::/32,,,Testland,TL,,,,
+"""
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / 'ranges.csv'
+    path.write_text(CSV)
+    return GeoIPDatabase.load(str(path))
+
+def test_lookup_finds_covering_range(database):
+    assert len(database) == 4
+    result = database.lookup('8.8.8.8')
+    assert result['country_code'] == 'US'
+    assert result['latitude'] == pytest.approx(37.4)
+    assert result['ip'] == '8.8.8.8' and result['type'] == 'IPv4'
+    assert database.lookup('1.0.1.10')['city'] == 'Fuzhou'
+
+def test_addresses_between_ranges_miss(database):
+    assert database.lookup('1.0.2.0') is None
+    assert database.lookup('0.255.255.255') is None
+    assert database.lookup('8.8.9.0') is None
+
+def test_ipv6_lookup(database):
+    result = database.lookup('2001:db8::1')
+    assert result['country'] == 'Testland' and result['type'] == 'IPv6'
+    assert database.lookup('2001:db9::1') is None
+
+def test_binary_snapshot_round_trips(database, tmp_path):
+    path = tmp_path / 'ranges.bin'
+    database.save_binary(str(path))
+    loaded = GeoIPDatabase.load(str(path))
+    for ip in ('1.0.0.1', '8.8.8.8', '2001:db8::1', '9.9.9.9'):
+        assert loaded.lookup(ip) == database.lookup(ip)
+
+def test_snapshot_is_not_pickled(database, tmp_path):
+    path = tmp_path / 'ranges.bin'
+    database.save_binary(str(path))
+    assert b'Mountain View' in path.read_bytes()
+    assert b'\x80\x04' not in path.read_bytes()[:16]
+
+def test_legacy_pickled_snapshot_is_refused(tmp_path):
+    path = tmp_path / 'ranges.bin'
+    path.write_bytes(b'GEOIDX1\n' + b'\x80\x05anything')
+    with pytest.raises(ValueError, match='rebuild'):
+        GeoIPDatabase.load(str(path))
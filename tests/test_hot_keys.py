@@ -0,0 +1,96 @@
+import time
+from collections import Counter
+
+import pytest
+
+from utils import persistent_cache
+from utils.hot_keys import CountMinSketch, HotKeyTracker
+from utils.persistent_cache import PersistentCache
+
+def test_sketch_never_undercounts():
+    sketch = CountMinSketch(64, 4)
+    counts = Counter()
+    for index in range(2000):
+        key = f'key{index * 7919 % 150}'
+        counts[key] += 1
+        sketch.add(key)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+    assert sketch.estimate('never-seen') <= max(counts.values())
+
+def test_sketch_decay_halves_counts():
+    sketch = CountMinSketch(1024, 4)
+    for _ in range(10):
+        sketch.add('hot')
+    sketch.decay()
+    assert sketch.estimate('hot') == 5
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = PersistentCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(persistent_cache, '_cache', cache)
+    monkeypatch.setattr(persistent_cache, '_cache_loaded', True)
+    return cache
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_only_hot_entries_close_to_expiry_are_refreshed(cache, monkeypatch):
+    monkeypatch.setattr('utils.hot_keys.HOT_KEY_REFRESH_AHEAD', 0.5)
+    tracker = HotKeyTracker(min_hits=3)
+    monkeypatch.setattr(tracker, 'start', lambda: None)
+    fetched = []
+
+    def fetch(key):
+        return lambda: fetched.append(key) or {'success': True, 'key': key}
+
+    cache.set('email', 'hot@example.com', {'success': True}, ttl=0.2)
+    cache.set('email', 'later@example.com', {'success': True}, ttl=3600)
+    cache.set('email', 'cold@example.com', {'success': True}, ttl=0.2)
+    for _ in range(3):
+        tracker.record('email', 'hot@example.com', fetch('hot@example.com'))
+        tracker.record('email', 'later@example.com', fetch('later@example.com'))
+    tracker.record('email', 'cold@example.com', fetch('cold@example.com'))
+
+    time.sleep(0.15)
+    assert tracker.refresh_due() == 1
+    assert wait_for(lambda: fetched == ['hot@example.com'])
+    assert wait_for(lambda: cache.get('email', 'hot@example.com')[0].get('key') == 'hot@example.com')
+    # The refreshed entry is fresh again, nothing else is due
+    assert tracker.refresh_due() == 0
+
+def test_refreshes_beyond_the_budget_are_deferred(cache, monkeypatch):
+    monkeypatch.setattr('utils.hot_keys.HOT_KEY_REFRESH_AHEAD', 1.0)
+    monkeypatch.setattr('utils.hot_keys.HOT_KEY_REFRESH_BUDGET', 2)
+    tracker = HotKeyTracker(min_hits=1)
+    monkeypatch.setattr(tracker, 'start', lambda: None)
+    for index in range(5):
+        cache.set('geo', f'192.0.2.{index}', {'success': True}, ttl=60)
+        tracker.record('geo', f'192.0.2.{index}', lambda: {'success': True})
+    assert tracker.refresh_due() == 2
+    assert tracker.stats()['deferred'] == 3
+
+def test_decay_drops_keys_that_cooled_down(monkeypatch):
+    tracker = HotKeyTracker(min_hits=2)
+    monkeypatch.setattr(tracker, 'start', lambda: None)
+    for _ in range(2):
+        tracker.record('whois', 'example.com', lambda: None)
+    assert tracker.stats()['tracked'] == 1
+    tracker.decay()
+    assert tracker.stats()['tracked'] == 0
+
+def test_hot_keys_without_an_entry_are_fetched_and_stored(cache, monkeypatch):
+    tracker = HotKeyTracker(min_hits=2)
+    monkeypatch.setattr(tracker, 'start', lambda: None)
+    fetched = []
+    # Answered from the block cache, so never stored under its own key
+    for _ in range(2):
+        tracker.record('geo', '198.51.100.7', lambda: fetched.append(1) or {'success': True, 'ip': '198.51.100.7'})
+    assert tracker.refresh_due() == 1
+    assert wait_for(lambda: cache.get('geo', '198.51.100.7') is not None)
+    assert fetched == [1]
+    assert wait_for(lambda: tracker.stats()['fills'] == 1)
+    # Stored and fresh, so it is only refreshed again close to expiry
+    assert tracker.refresh_due() == 0
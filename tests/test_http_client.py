@@ -0,0 +1,7 @@
+from utils.http_client import build_session
+
+def test_rate_limited_responses_are_left_to_the_limiter():
+    retry = build_session(pool_maxsize=1, retries=2).get_adapter('https://example.com').max_retries
+    assert 429 not in retry.status_forcelist
+    assert 503 in retry.status_forcelist
+    assert not retry.respect_retry_after_header
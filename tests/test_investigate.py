@@ -0,0 +1,38 @@
+import pytest
+
+from routes import investigate_routes
+from routes.investigate_routes import Investigation, detect_seed_type
+from utils.jobs import Job, QueueFullError
+
+@pytest.fixture(autouse=True)
+def offline_bootstrap(monkeypatch):
+    monkeypatch.setattr(investigate_routes.rdap_bootstrap, 'servers', lambda: {'shop': 'https://rdap.example/'})
+
+def test_dotted_usernames_are_not_taken_for_domains():
+    assert detect_seed_type('john.doe') == 'username'
+    assert detect_seed_type('example.com') == 'domain'
+    assert detect_seed_type('example.de') == 'domain'
+    assert detect_seed_type('example.shop') == 'domain'
+    assert detect_seed_type('john@example.com') == 'email'
+
+def run_username(monkeypatch, submit):
+    monkeypatch.setattr(investigate_routes, 'submit_sherlock_job', submit)
+    investigation = Investigation('johndoe', 'username')
+    investigation.start()
+    return {section: result for section, _, result in investigation.completed()}
+
+def test_busy_sherlock_queue_is_reported_in_the_section(monkeypatch):
+    def submit(username, options):
+        raise QueueFullError('sherlock job queue is full (20 pending)')
+
+    sections = run_username(monkeypatch, submit)
+    assert sections['sherlock'] == {'success': False, 'error': 'Sherlock workers are busy, please retry later'}
+
+def test_sherlock_section_comes_from_the_job(monkeypatch):
+    def submit(username, options):
+        job = Job('job', {'username': username})
+        job.set_status('completed', result={'success': True, 'username': username, 'results': [], 'total_found': 0})
+        return job
+
+    sections = run_username(monkeypatch, submit)
+    assert sections['sherlock']['username'] == 'johndoe'
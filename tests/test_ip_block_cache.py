@@ -0,0 +1,85 @@
+import pytest
+
+from routes import ip_routes
+from routes.ip_routes import format_ip_result, get_ip_geolocation, localize_geolocation
+from utils import persistent_cache
+from utils.persistent_cache import PersistentCache
+from utils.prefix_cache import PrefixCache
+
+NEIGHBOUR = {
+    'success': True,
+    'source': 'ipwho.is',
+    'geolocation_data': {
+        'ip': '198.51.100.7',
+        'type': 'IPv4',
+        'country': 'Exampleland',
+        'city': 'Example City',
+        'latitude': 1.5,
+        'longitude': 2.5,
+        'as': 64500,
+        'asname': 'EXAMPLE-AS',
+        'isp': 'Example ISP',
+        'proxy': True,
+        'vpn': True,
+        'tor': True,
+        'hosting': True,
+        'mobile': False,
+        'security': {'anonymous': True, 'vpn': True}
+    }
+}
+
+def test_block_answers_share_location_and_asn_but_not_address_flags():
+    result = localize_geolocation(NEIGHBOUR, '198.51.100.42', '198.51.100.0/24')
+    data = result['geolocation_data']
+
+    assert data['ip'] == '198.51.100.42'
+    assert data['city'] == 'Example City'
+    assert data['as'] == 64500
+    for field in ('proxy', 'vpn', 'tor', 'hosting', 'mobile', 'security'):
+        assert field not in data
+    assert format_ip_result('198.51.100.42', result)['network'] == '198.51.100.0/24'
+
+def test_cached_neighbour_result_is_not_modified():
+    localize_geolocation(NEIGHBOUR, '198.51.100.42', '198.51.100.0/24')
+    assert NEIGHBOUR['geolocation_data']['ip'] == '198.51.100.7'
+    assert NEIGHBOUR['geolocation_data']['vpn'] is True
+
+def test_result_for_the_same_address_is_not_stripped():
+    assert localize_geolocation(NEIGHBOUR, '198.51.100.7', '198.51.100.0/24') is NEIGHBOUR
+
+@pytest.fixture
+def geo_lookups(tmp_path, monkeypatch):
+    cache = PersistentCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(persistent_cache, 'get_persistent_cache', lambda: cache)
+    monkeypatch.setattr(ip_routes, 'GEO_PREFIX_CACHE', True)
+    monkeypatch.setattr(ip_routes, 'geo_prefix_cache', PrefixCache('test', ttl=60))
+    monkeypatch.setattr(ip_routes, 'lookup_local_geolocation', lambda ip: None)
+    calls = []
+
+    def fetch(ip):
+        calls.append(ip)
+        result = dict(NEIGHBOUR)
+        result['geolocation_data'] = dict(NEIGHBOUR['geolocation_data'], ip=ip)
+        return result
+
+    monkeypatch.setattr(ip_routes, 'fetch_ip_geolocation', fetch)
+    return cache, calls
+
+def test_repeat_lookup_keeps_the_address_flags(geo_lookups):
+    cache, calls = geo_lookups
+    get_ip_geolocation('198.51.100.7')
+    again = get_ip_geolocation('198.51.100.7')
+
+    assert calls == ['198.51.100.7']
+    assert again['geolocation_data']['vpn'] is True
+    assert 'network' not in again
+
+def test_block_answers_are_not_cached_for_the_neighbour(geo_lookups):
+    cache, calls = geo_lookups
+    get_ip_geolocation('198.51.100.7')
+    neighbour = get_ip_geolocation('198.51.100.42')
+
+    assert calls == ['198.51.100.7']
+    assert neighbour['network'] == '198.51.100.0/24'
+    assert 'vpn' not in neighbour['geolocation_data']
+    assert cache.get('geo', '198.51.100.42') is None
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import pickle
+import sqlite3
+import threading
+from datetime import date, datetime
+
+import pytest
+
+from utils import persistent_cache
+from utils.persistent_cache import PersistentCache, cached_call_async
+
+def test_values_round_trip_as_json(tmp_path):
+    cache = PersistentCache(str(tmp_path / 'cache.sqlite3'))
+    value = {
+        'success': True,
+        'creation_date': datetime(2001, 2, 3, 4, 5, 6),
+        'expires': date(2030, 1, 1),
+        'name_servers': ('ns1.example.com', 'ns2.example.com')
+    }
+    cache.set('whois', 'example.com', value, ttl=60)
+
+    stored = sqlite3.connect(str(tmp_path / 'cache.sqlite3')).execute('SELECT value FROM entries').fetchone()[0]
+    assert isinstance(stored, str)
+
+    cached, _, stale = PersistentCache(str(tmp_path / 'cache.sqlite3')).get('whois', 'example.com')
+    assert not stale
+    assert cached['creation_date'] == datetime(2001, 2, 3, 4, 5, 6)
+    assert cached['expires'] == date(2030, 1, 1)
+    assert cached['name_servers'] == ['ns1.example.com', 'ns2.example.com']
+
+def test_pickled_entries_from_older_versions_are_dropped(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE entries (source TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, '
+                 'size INTEGER NOT NULL, stored_at REAL NOT NULL, expires_at REAL NOT NULL, '
+                 'stale_until REAL NOT NULL, refresh_until REAL NOT NULL DEFAULT 0, PRIMARY KEY (source, key))')
+    data = pickle.dumps({'success': True})
+    conn.execute('INSERT INTO entries VALUES (?, ?, ?, ?, 0, 9e18, 9e18, 0)', ('whois', 'example.com', data, len(data)))
+    conn.commit()
+    conn.close()
+
+    cache = PersistentCache(path)
+    assert cache.get('whois', 'example.com') is None
+
+def test_symlinked_database_is_refused(tmp_path):
+    target = tmp_path / 'elsewhere.sqlite3'
+    target.write_bytes(b'')
+    link = tmp_path / 'cache.sqlite3'
+    link.symlink_to(target)
+    with pytest.raises(PermissionError):
+        PersistentCache(str(link))
+
+@pytest.mark.skipif(not hasattr(os, 'getuid') or os.getuid() != 0, reason='needs root to chown')
+def test_database_owned_by_another_user_is_refused(tmp_path):
+    path = tmp_path / 'cache.sqlite3'
+    PersistentCache(str(path))
+    os.chown(path, 12345, -1)
+    with pytest.raises(PermissionError):
+        PersistentCache(str(path))
+
+def test_async_calls_keep_sqlite_off_the_event_loop_and_honour_ttl_for(tmp_path, monkeypatch):
+    cache = PersistentCache(str(tmp_path / 'cache.sqlite3'))
+    monkeypatch.setattr(persistent_cache, '_cache', cache)
+    monkeypatch.setattr(persistent_cache, '_cache_loaded', True)
+    threads = []
+    for name in ('get', 'set'):
+        original = getattr(cache, name)
+        def tracked(*args, _original=original, **kwargs):
+            threads.append(threading.get_ident())
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(cache, name, tracked)
+
+    async def fetch():
+        return {'success': True}
+
+    async def main():
+        loop_thread = threading.get_ident()
+        result = await cached_call_async('whois', 'example.com', fetch, ttl_for=lambda result: 30)
+        assert result == {'success': True}
+        return loop_thread
+
+    loop_thread = asyncio.run(main())
+    assert len(threads) == 2
+    assert loop_thread not in threads
+    stored_at, expires_at = cache.expiry('whois', 'example.com')
+    assert expires_at - stored_at == pytest.approx(30)
@@ -0,0 +1,40 @@
+import time
+
+from utils.prefix_cache import PrefixCache
+
+def test_longest_matching_prefix_wins():
+    cache = PrefixCache('test', ttl=60)
+    cache.set('10.0.0.0/8', 'wide')
+    cache.set('10.1.0.0/16', 'narrow')
+    cache.set('10.1.2.3/32', 'host')
+
+    assert cache.get('10.1.2.3') == ('host', '10.1.2.3/32')
+    assert cache.get('10.1.9.9') == ('narrow', '10.1.0.0/16')
+    assert cache.get('10.200.0.1') == ('wide', '10.0.0.0/8')
+    assert cache.get('192.0.2.1') is None
+
+def test_ipv6_networks_are_kept_apart_from_ipv4():
+    cache = PrefixCache('test', ttl=60)
+    cache.set('2001:db8::/48', 'v6')
+    assert cache.get('2001:db8::1') == ('v6', '2001:db8::/48')
+    assert cache.get('2001:db9::1') is None
+    assert cache.get('32.1.13.184') is None
+
+def test_expired_entries_fall_through_to_shorter_prefixes():
+    cache = PrefixCache('test', ttl=0.05)
+    cache.set('10.1.0.0/16', 'narrow')
+    cache.ttl = 60
+    cache.set('10.0.0.0/8', 'wide')
+    time.sleep(0.06)
+    assert cache.get('10.1.0.1') == ('wide', '10.0.0.0/8')
+    assert cache.stats()['prefix_lengths']['ipv4'] == [8]
+
+def test_least_recently_used_entries_are_evicted():
+    cache = PrefixCache('test', ttl=60, max_entries=2)
+    cache.set('192.0.2.0/24', 'a')
+    cache.set('198.51.100.0/24', 'b')
+    cache.get('192.0.2.1')
+    cache.set('203.0.113.0/24', 'c')
+    assert cache.get('198.51.100.1') is None
+    assert cache.get('192.0.2.1') is not None
+    assert cache.stats()['entries'] == 2
@@ -0,0 +1,41 @@
+import sys
+import threading
+import time
+
+from utils.process_pool import ProcessPool
+
+# Reads one job from stdin like the Sherlock worker and prints its arguments
+WORKER = [sys.executable, '-c', 'import json, sys; print(" ".join(json.loads(sys.stdin.readline())))']
+
+def test_jobs_run_on_warm_workers_that_are_replaced():
+    pool = ProcessPool('test', WORKER, size=2, max_queued=2)
+    try:
+        lines = []
+        assert pool.run(['hello', 'world'], timeout=10, on_line=lines.append) == (0, '')
+        assert lines == ['hello world\n']
+        assert pool.stats()['idle'] == 2
+    finally:
+        pool.shutdown()
+
+def test_workers_are_spawned_without_holding_the_lock():
+    pool = ProcessPool('test', WORKER, size=2, max_queued=2)
+    spawn = pool._spawn
+    started = threading.Event()
+
+    def slow_spawn():
+        started.set()
+        time.sleep(0.3)
+        return spawn()
+
+    pool._spawn = slow_spawn
+    starter = threading.Thread(target=pool.start)
+    starter.start()
+    try:
+        started.wait(5)
+        begin = time.monotonic()
+        pool.stats()
+        assert time.monotonic() - begin < 0.1
+    finally:
+        starter.join()
+        pool.shutdown()
+    assert pool.stats()['idle'] == 0
@@ -0,0 +1,110 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from utils.rate_limit import RateLimiter, RateLimitExceeded, TokenBucket, client_id
+
+def test_bucket_allows_burst_then_reports_delay(tmp_path):
+    bucket = TokenBucket('test', rate=2.0, burst=3, state_dir=str(tmp_path))
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    delay = bucket.try_acquire()
+    assert 0 < delay <= 0.5
+
+def test_buckets_with_the_same_state_file_share_the_quota(tmp_path):
+    first = TokenBucket('shared', rate=1.0, burst=2, state_dir=str(tmp_path))
+    second = TokenBucket('shared', rate=1.0, burst=2, state_dir=str(tmp_path))
+    assert first.try_acquire() == 0
+    assert second.try_acquire() == 0
+    assert first.try_acquire() > 0
+
+def test_limiter_gives_up_after_max_wait(tmp_path, monkeypatch):
+    monkeypatch.setattr('utils.rate_limit.RATE_LIMIT_DIR', str(tmp_path))
+    limiter = RateLimiter('slow', rate=0.1, burst=1, max_wait=0.2)
+    limiter.bucket = TokenBucket('slow', 0.1, 1, state_dir=str(tmp_path))
+    assert limiter.acquire('a') == pytest.approx(0, abs=0.05)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire('a')
+    assert limiter.stats()['rejected'] == 1
+
+def test_limiter_with_zero_rate_never_waits():
+    limiter = RateLimiter('off', rate=0, burst=1)
+    assert limiter.bucket is None
+    assert all(limiter.acquire() == 0 for _ in range(100))
+
+def test_client_id_uses_the_hop_added_by_the_trusted_proxy():
+    # The client sent '198.51.100.1, 203.0.113.7' itself, the proxy appended 192.0.2.10
+    assert client_id('198.51.100.1, 203.0.113.7, 192.0.2.10', '10.0.0.2', trusted_proxies=1) == '192.0.2.10'
+    assert client_id('203.0.113.7, 192.0.2.10, 10.0.0.1', '10.0.0.2', trusted_proxies=2) == '192.0.2.10'
+    assert client_id('192.0.2.10', '10.0.0.2', trusted_proxies=2) == '10.0.0.2'
+
+def test_client_id_ignores_forwarded_for_without_trusted_proxies():
+    assert client_id('203.0.113.7', '10.0.0.2', trusted_proxies=0) == '10.0.0.2'
+    assert client_id(None, '10.0.0.2', trusted_proxies=1) == '10.0.0.2'
+    assert client_id(None, None) == 'anonymous'
+
+def async_limiter(tmp_path, name, rate, burst, max_wait=5.0):
+    limiter = RateLimiter(name, rate=0, burst=burst, max_wait=max_wait)
+    limiter.rate = rate
+    limiter.bucket = TokenBucket(name, rate, burst, state_dir=str(tmp_path))
+    return limiter
+
+def test_async_waiters_are_served_round_robin_without_threads(tmp_path):
+    limiter = async_limiter(tmp_path, 'fair', rate=50.0, burst=1)
+    order = []
+
+    async def lookup(client):
+        await limiter.acquire_async(client)
+        order.append(client)
+
+    async def main():
+        # One client queues many lookups before another queues two
+        tasks = [asyncio.create_task(lookup('heavy')) for _ in range(6)]
+        tasks += [asyncio.create_task(lookup('light')) for _ in range(2)]
+        await asyncio.gather(*tasks)
+
+    threads = threading.active_count()
+    asyncio.run(main())
+    assert threading.active_count() == threads
+    assert order.index('light') <= 2
+    assert order[:5].count('light') == 2
+    stats = limiter.stats()
+    assert stats['acquired'] == 8 and stats['queue_depth'] == 0 and stats['queued_clients'] == 0
+
+def test_async_wait_gives_up_after_max_wait(tmp_path):
+    limiter = async_limiter(tmp_path, 'slow-async', rate=0.1, burst=1, max_wait=0.2)
+
+    async def main():
+        await limiter.acquire_async('a')
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire_async('a')
+
+    asyncio.run(main())
+    assert limiter.stats()['rejected'] == 1
+
+def test_cancelled_async_waiter_leaves_the_queue(tmp_path):
+    limiter = async_limiter(tmp_path, 'cancel', rate=5.0, burst=1)
+
+    async def main():
+        await limiter.acquire_async('a')
+        blocked = asyncio.create_task(limiter.acquire_async('a'))
+        behind = asyncio.create_task(limiter.acquire_async('b'))
+        await asyncio.sleep(0.01)
+        blocked.cancel()
+        await asyncio.gather(blocked, return_exceptions=True)
+        # The next waiter takes over the head of the line
+        assert await asyncio.wait_for(behind, 1) < 1
+
+    asyncio.run(main())
+    assert limiter.stats()['queue_depth'] == 0
+
+def test_bucket_in_an_unsafe_directory_falls_back_to_a_private_file(tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    bucket = TokenBucket('unsafe', rate=1.0, burst=1, state_dir=str(shared))
+    assert bucket.path is None
+    assert list(shared.iterdir()) == []
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
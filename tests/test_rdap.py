@@ -0,0 +1,85 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from routes.domain_routes import parse_rdap_response, rdap_referral
+from utils.rdap import RDAPBootstrap, parse_bootstrap
+
+BOOTSTRAP = {
+    'services': [
+        [['com', 'net'], ['http://rdap.verisign.example/', 'https://rdap.verisign.example/com/v1']],
+        [['ORG'], ['https://rdap.pir.example']],
+        [['empty'], []]
+    ]
+}
+
+def test_parse_bootstrap_prefers_https_and_normalizes():
+    servers = parse_bootstrap(BOOTSTRAP)
+    assert servers == {
+        'com': 'https://rdap.verisign.example/com/v1/',
+        'net': 'https://rdap.verisign.example/com/v1/',
+        'org': 'https://rdap.pir.example/'
+    }
+
+def test_fresh_disk_copy_is_used_without_downloading(tmp_path, monkeypatch):
+    path = tmp_path / 'dns.json'
+    path.write_text(json.dumps(BOOTSTRAP))
+    bootstrap = RDAPBootstrap('https://unused.example/dns.json', str(path), ttl=3600)
+    monkeypatch.setattr(bootstrap, '_download', lambda: (_ for _ in ()).throw(AssertionError('downloaded')))
+    assert bootstrap.server_for('Example.ORG') == 'https://rdap.pir.example/'
+    assert bootstrap.server_for('example.unknown') is None
+
+def test_expired_copy_is_kept_when_download_fails(tmp_path, monkeypatch):
+    path = tmp_path / 'dns.json'
+    path.write_text(json.dumps(BOOTSTRAP))
+    old = time.time() - 7200
+    os.utime(path, (old, old))
+    bootstrap = RDAPBootstrap('https://unused.example/dns.json', str(path), ttl=3600)
+    downloads = []
+    monkeypatch.setattr(bootstrap, '_download', lambda: downloads.append(1))
+    assert bootstrap.server_for('example.com') == 'https://rdap.verisign.example/com/v1/'
+    assert downloads == [1]
+    # The failed download is not retried on every lookup
+    bootstrap.server_for('example.net')
+    assert downloads == [1]
+
+def test_parse_rdap_response_maps_events_and_contacts():
+    data = {
+        'events': [
+            {'eventAction': 'registration', 'eventDate': '1995-08-14T04:00:00Z'},
+            {'eventAction': 'expiration', 'eventDate': '2025-08-13T04:00:00Z'}
+        ],
+        'status': ['client delete prohibited'],
+        'nameservers': [{'ldhName': 'A.IANA-SERVERS.NET.'}],
+        'secureDNS': {'delegationSigned': False},
+        'entities': [{
+            'roles': ['registrar'],
+            'vcardArray': ['vcard', [['fn', {}, 'text', 'Example Registrar']]],
+            'entities': [{
+                'roles': ['registrant', 'technical'],
+                'vcardArray': ['vcard', [
+                    ['fn', {}, 'text', 'Jane Doe'],
+                    ['tel', {}, 'uri', 'tel:+1.5555550100'],
+                    ['adr', {'label': '1 Main St, Springfield'}, 'text', ['', '', '', '', '', '', '']]
+                ]]
+            }]
+        }]
+    }
+    record = parse_rdap_response(data)
+    assert record.creation_date == datetime(1995, 8, 14, 4, 0)
+    assert record.registrar == 'Example Registrar'
+    assert record.name_servers == ['a.iana-servers.net']
+    assert record.dnssec == 'unsigned'
+    assert record.registrant_name == 'Jane Doe'
+    assert record.tech_phone == '+1.5555550100'
+    assert record.registrant_address == '1 Main St, Springfield'
+
+def test_rdap_referral_only_follows_related_rdap_links():
+    data = {'links': [
+        {'rel': 'self', 'type': 'application/rdap+json', 'href': 'https://rdap.registry.example/domain/x'},
+        {'rel': 'related', 'type': 'text/html', 'href': 'https://registrar.example/x'},
+        {'rel': 'related', 'type': 'application/rdap+json', 'href': 'https://rdap.registrar.example/domain/x'}
+    ]}
+    assert rdap_referral(data, 'https://rdap.registry.example/domain/x') == 'https://rdap.registrar.example/domain/x'
+    assert rdap_referral(data, 'https://rdap.registrar.example/domain/x') is None
@@ -0,0 +1,34 @@
+from utils import sherlock_sites
+from utils.sherlock_sites import SiteStats, ScanOptions, select_sites
+
+def failing_stats(monkeypatch, *sites):
+    stats = SiteStats()
+    for site in sites:
+        for _ in range(sherlock_sites.SHERLOCK_SKIP_AFTER_FAILURES):
+            stats.record(site, 'error', 1.0)
+    monkeypatch.setattr(sherlock_sites, 'site_stats', stats)
+    return stats
+
+def test_failing_sites_are_skipped_unless_asked_for_by_name(monkeypatch):
+    stats = failing_stats(monkeypatch, 'Broken', 'Flaky')
+
+    ordered, skipped = stats.plan(['GitHub', 'Broken', 'Flaky'])
+    assert ordered == ['GitHub']
+    assert sorted(skipped) == ['Broken', 'Flaky']
+
+    ordered, skipped = stats.plan(['GitHub', 'Broken', 'Flaky'], pinned=['Broken'])
+    assert ordered == ['Broken', 'GitHub']
+    assert skipped == ['Flaky']
+
+def test_explicit_sites_survive_top_selection(monkeypatch):
+    stats = failing_stats(monkeypatch)
+    for _ in range(5):
+        stats.record('GitHub', 'found', 0.1)
+    available = ['GitHub', 'Reddit', 'Obscure']
+
+    options = ScanOptions(sites=['Obscure'], top=1)
+    assert select_sites(options, available) == ['Obscure', 'GitHub']
+
+def test_unknown_explicit_sites_are_dropped(monkeypatch):
+    failing_stats(monkeypatch)
+    assert select_sites(ScanOptions(sites=['GitHub', 'Nope']), ['GitHub', 'Reddit']) == ['GitHub']
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.singleflight import AsyncSingleFlight, SingleFlight
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight('test')
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        time.sleep(0.1)
+        return value * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('key', slow, 21))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [21]
+    assert sorted(joined for _, joined in results) == [False, True, True, True, True]
+    assert all(result == 42 for result, _ in results)
+
+def test_errors_reach_every_caller_and_are_not_remembered():
+    flight = SingleFlight('test')
+
+    def fail():
+        raise ValueError('upstream failed')
+
+    with pytest.raises(ValueError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 'ok') == ('ok', False)
+
+def test_async_joiners_keep_the_call_when_the_leader_is_cancelled():
+    flight = AsyncSingleFlight('test')
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'ok'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do('key', slow))
+        await asyncio.sleep(0)
+        joiner = asyncio.ensure_future(flight.do('key', slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await joiner == ('ok', True)
+        assert flight.in_flight() == 0
+
+    asyncio.run(main())
+    assert calls == [1]
+
+def test_async_call_is_cancelled_when_every_caller_is():
+    flight = AsyncSingleFlight('test')
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do('key', slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        await asyncio.sleep(0)
+        assert flight.in_flight() == 0
+        # A new caller starts a fresh call instead of joining the cancelled one
+        assert await flight.do('key', asyncio.sleep, 0, 'fresh') == ('fresh', False)
+
+    asyncio.run(main())
+    assert cancelled == [True]
+
+def test_async_errors_reach_joiners_and_are_not_remembered():
+    flight = AsyncSingleFlight('test')
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('upstream failed')
+
+    async def main():
+        results = await asyncio.gather(flight.do('key', fail), flight.do('key', fail), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert flight.in_flight() == 0
+
+    asyncio.run(main())
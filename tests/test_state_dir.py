@@ -0,0 +1,43 @@
+import os
+import stat
+
+import pytest
+
+from utils.state_dir import check_owned_file, private_dir
+
+def test_private_dir_is_created_with_mode_0700(tmp_path):
+    path = private_dir(str(tmp_path / 'state'))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+
+def test_group_writable_dir_is_refused(tmp_path):
+    path = tmp_path / 'shared'
+    path.mkdir()
+    os.chmod(path, 0o770)
+    with pytest.raises(PermissionError):
+        private_dir(str(path))
+
+def test_symlinked_dir_is_refused(tmp_path):
+    target = tmp_path / 'target'
+    target.mkdir(mode=0o700)
+    link = tmp_path / 'link'
+    link.symlink_to(target)
+    with pytest.raises(PermissionError):
+        private_dir(str(link))
+
+def test_symlinked_file_is_refused(tmp_path):
+    target = tmp_path / 'target'
+    target.write_text('{}')
+    link = tmp_path / 'link'
+    link.symlink_to(target)
+    with pytest.raises(PermissionError):
+        check_owned_file(str(link))
+    check_owned_file(str(target))
+    check_owned_file(str(tmp_path / 'missing'))
+
+@pytest.mark.skipif(not hasattr(os, 'getuid') or os.getuid() != 0, reason='needs root to chown')
+def test_file_owned_by_another_user_is_refused(tmp_path):
+    path = tmp_path / 'foreign'
+    path.write_text('{}')
+    os.chown(path, 12345, -1)
+    with pytest.raises(PermissionError):
+        check_owned_file(str(path))
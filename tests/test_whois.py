@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from routes.domain_routes import parse_whois_response, referral_server
+
+REGISTRY_RESPONSE = """
+   Domain Name: EXAMPLE.COM
+   Registry Domain ID: 2336799_DOMAIN_COM-VRSN
+   Registrar WHOIS Server: whois.registrar.example
+   Updated Date: 2024-08-14T07:01:34Z
+   Creation Date: 1995-08-14T04:00:00Z
+   Registry Expiry Date: 2025-08-13T04:00:00Z
+   Registrar: RESERVED-Internet Assigned Numbers Authority
+   Domain Status: clientDeleteProhibited https://icann.org/epp#clientDeleteProhibited
+   Domain Status: clientTransferProhibited https://icann.org/epp#clientTransferProhibited
+   Name Server: A.IANA-SERVERS.NET
+   Name Server: B.IANA-SERVERS.NET.
+   DNSSEC: signedDelegation
+"""
+
+def test_parse_whois_response_extracts_known_fields():
+    record = parse_whois_response(REGISTRY_RESPONSE)
+    assert record.registrar == 'RESERVED-Internet Assigned Numbers Authority'
+    assert record.creation_date == datetime(1995, 8, 14, 4, 0)
+    assert record.expiration_date == datetime(2025, 8, 13, 4, 0)
+    assert record.name_servers == ['a.iana-servers.net', 'b.iana-servers.net']
+    assert len(record.status) == 2
+    assert record.dnssec == 'signedDelegation'
+    assert record.registrant_name is None
+
+def test_referral_server_follows_registrar_and_ignores_self():
+    assert referral_server(REGISTRY_RESPONSE, 'whois.verisign-grs.com') == 'whois.registrar.example'
+    assert referral_server(REGISTRY_RESPONSE, 'whois.registrar.example') is None
+    assert referral_server('Registrar WHOIS Server: https://whois.other.example:43/', 'x') == 'whois.other.example'
+    assert referral_server('Domain Name: EXAMPLE.COM', 'x') is None
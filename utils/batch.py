@@ -0,0 +1,56 @@
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '1000'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '8'))
+
+# Shared by all batch endpoints so concurrent batches stay within the limit
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+
+def get_batch_items(payload: Optional[Dict], key: str) -> List[str]:
+    """
+    Extract the list of items from a batch request body
+    Accepts either {"<key>": [...]} or {"items": [...]}
+    Raises ValueError with a client-facing message when the body is invalid
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('JSON body is required')
+
+    items = payload.get(key, payload.get('items'))
+    if not isinstance(items, list) or not items:
+        raise ValueError(f'"{key}" must be a non-empty list')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'Too many items: {len(items)} (maximum {BATCH_MAX_ITEMS})')
+    if not all(isinstance(item, str) for item in items):
+        raise ValueError(f'"{key}" must only contain strings')
+    return items
+
+def run_batch(items: List[str], normalize: Callable[[str], str],
+              lookup: Callable[[str], Dict]) -> Dict[str, Dict]:
+    """
+    Look up every distinct item once with bounded concurrency
+    Returns the results keyed by the original input strings
+    """
+    normalized = {item: normalize(item) for item in items}
+    unique = list(dict.fromkeys(normalized.values()))
+
+    # Run each lookup in the caller's context so it is attributed to the same client
+    futures = {key: batch_executor.submit(contextvars.copy_context().run, lookup, key) for key in unique}
+    outcomes = {}
+    for key, future in futures.items():
+        try:
+            outcomes[key] = future.result()
+        except Exception as e:
+            logger.error(f"Batch lookup failed for {key}: {str(e)}")
+            outcomes[key] = {
+                'success': False,
+                'error': f'Unexpected error: {str(e)}'
+            }
+
+    logger.info(f"Batch of {len(items)} items completed ({len(unique)} distinct)")
+    return {item: outcomes[normalized[item]] for item in items}
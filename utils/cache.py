@@ -0,0 +1,100 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+def estimate_size(value: Any) -> int:
+    """
+    Rough size of a cached value in bytes, based on its JSON encoding
+    """
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry and a memory bound
+    Negative entries ("not found" outcomes) use a shorter TTL
+    """
+
+    def __init__(self, name: str, ttl: float, negative_ttl: float,
+                 max_entries: int = 1000, max_bytes: int = 50 * 1024 * 1024):
+        self.name = name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, stored_at, expires_at, size)
+        self._entries: 'OrderedDict[str, Tuple[Any, float, float, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Return (value, age in seconds) or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels(self.name, 'miss').inc()
+                return None
+
+            value, stored_at, expires_at, size = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.misses += 1
+                CACHE_LOOKUPS.labels(self.name, 'miss').inc()
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.labels(self.name, 'hit').inc()
+            return value, now - stored_at
+
+    def set(self, key: str, value: Any, negative: bool = False):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logger.warning(f"Not caching {self.name} entry {key}: {size} bytes exceeds cache bound")
+            return
+
+        now = time.time()
+        ttl = self.negative_ttl if negative else self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, now, now + ttl, size)
+            self._bytes += size
+
+            # Evict least recently used entries until within bounds
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        _, _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
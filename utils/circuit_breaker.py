@@ -0,0 +1,289 @@
+"""
+Circuit breakers and hedged requests for upstream APIs
+
+A breaker opens after CIRCUIT_FAILURE_THRESHOLD consecutive failed calls
+(connection errors, 429/5xx responses, or calls slower than
+CIRCUIT_SLOW_CALL_SECONDS). While open, calls fail immediately. After
+CIRCUIT_RESET_TIMEOUT seconds one probe call is let through (half-open),
+and its outcome closes or re-opens the circuit.
+
+With HEDGE_REQUESTS enabled, a call that has not answered by the upstream's
+recent p95 latency gets a second attempt, and the first answer wins.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+from typing import Callable, Dict, List, Optional
+
+from utils.metrics import track_upstream
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('CIRCUIT_SLOW_CALL_SECONDS', '5'))
+
+HEDGE_REQUESTS = os.getenv('HEDGE_REQUESTS', 'false').lower() == 'true'
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '0.05'))
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '1'))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WORKERS = int(os.getenv('HEDGE_WORKERS', '32'))
+
+LATENCY_WINDOW = 200
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Attempts run here when hedging so the caller can return on the first answer
+hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+
+class CircuitOpenError(Exception):
+    pass
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of sorted samples
+    """
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+def is_failure_response(response) -> bool:
+    """
+    Responses that indicate an unhealthy upstream (requests or httpx)
+    """
+    return response.status_code == 429 or response.status_code >= 500
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures and recent latencies of one upstream
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = CIRCUIT_RESET_TIMEOUT, slow_call_seconds: float = CIRCUIT_SLOW_CALL_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rejected = 0
+        self.hedged = 0
+        self.times_opened = 0
+
+    def check(self):
+        """
+        Raise CircuitOpenError while the circuit is open and not due for a probe
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpenError(f'{self.name} circuit is open')
+            if self.state == HALF_OPEN and self.probing:
+                self.rejected += 1
+                raise CircuitOpenError(f'{self.name} circuit is half-open')
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'{self.name} circuit is open')
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == HALF_OPEN:
+                # Only one probe at a time while half-open
+                if self.probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(f'{self.name} circuit is half-open')
+                self.probing = True
+            self.calls += 1
+
+    def record(self, ok: bool, elapsed: float):
+        with self._lock:
+            if ok:
+                self.latencies.append(elapsed)
+                if elapsed > self.slow_call_seconds:
+                    ok = False
+
+            if self.state == HALF_OPEN:
+                self.probing = False
+                if ok:
+                    logger.info(f"Circuit for {self.name} closed after successful probe")
+                    self.state = CLOSED
+                    self.failures = 0
+                else:
+                    self._open()
+                return
+
+            if ok:
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == CLOSED and self.failures >= self.failure_threshold:
+                    self._open()
+
+    def _open(self):
+        logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+    def call(self, func: Callable, *args, **kwargs):
+        """
+        Run func (returning a response) through the breaker
+        """
+        self.before_call()
+        start = time.monotonic()
+        try:
+            with track_upstream(self.name) as upstream_call:
+                response = func(*args, **kwargs)
+                upstream_call.outcome = str(response.status_code)
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(not is_failure_response(response), time.monotonic() - start)
+        return response
+
+    async def call_async(self, func: Callable, *args, **kwargs):
+        """
+        Await func (returning a response) through the breaker
+        """
+        self.before_call()
+        start = time.monotonic()
+        try:
+            with track_upstream(self.name) as upstream_call:
+                response = await func(*args, **kwargs)
+                upstream_call.outcome = str(response.status_code)
+        except asyncio.CancelledError:
+            # A cancelled hedge says nothing about the upstream
+            with self._lock:
+                if self.state == HALF_OPEN:
+                    self.probing = False
+            raise
+        except Exception:
+            self.record(False, time.monotonic() - start)
+            raise
+        self.record(not is_failure_response(response), time.monotonic() - start)
+        return response
+
+    def note_hedge(self):
+        with self._lock:
+            self.hedged += 1
+        logger.info(f"Hedging slow {self.name} request")
+
+    def hedge_delay(self) -> float:
+        """
+        Delay before a hedged attempt, the recent p95 latency of successful calls
+        """
+        with self._lock:
+            samples = sorted(self.latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, percentile(samples, HEDGE_PERCENTILE))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            samples = sorted(self.latencies)
+            p50, p95 = percentile(samples, 50), percentile(samples, 95)
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'hedged': self.hedged,
+                'times_opened': self.times_opened,
+                'p50_latency': round(p50, 3) if p50 is not None else None,
+                'p95_latency': round(p95, 3) if p95 is not None else None
+            }
+
+def call_hedged(breaker: CircuitBreaker, limiter, func: Callable, *args, **kwargs):
+    """
+    Call func through the breaker, sending a second attempt when the first
+    is slower than the upstream's p95 and the rate limiter has a spare token
+    """
+    if not HEDGE_REQUESTS:
+        return breaker.call(func, *args, **kwargs)
+
+    primary = hedge_executor.submit(breaker.call, func, *args, **kwargs)
+    try:
+        return primary.result(timeout=breaker.hedge_delay())
+    except FuturesTimeout:
+        pass
+
+    if not limiter.try_acquire():
+        return primary.result()
+
+    breaker.note_hedge()
+    pending = {primary, hedge_executor.submit(breaker.call, func, *args, **kwargs)}
+
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result()
+            except Exception as e:
+                # A half-open breaker rejects the hedge, keep waiting for the primary
+                if error is None or isinstance(error, CircuitOpenError):
+                    error = e
+    raise error
+
+async def call_hedged_async(breaker: CircuitBreaker, limiter, func: Callable, *args, **kwargs):
+    """
+    Async counterpart of call_hedged, the losing attempt is cancelled
+    """
+    if not HEDGE_REQUESTS:
+        return await breaker.call_async(func, *args, **kwargs)
+
+    primary = asyncio.ensure_future(breaker.call_async(func, *args, **kwargs))
+    done, _ = await asyncio.wait({primary}, timeout=breaker.hedge_delay())
+    if done or not limiter.try_acquire():
+        return await primary
+
+    breaker.note_hedge()
+    pending = {primary, asyncio.ensure_future(breaker.call_async(func, *args, **kwargs))}
+
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                if error is None or isinstance(error, CircuitOpenError):
+                    error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Shared circuit breaker for an upstream
+    """
+    breaker = _breakers.get(name)
+    if breaker is not None:
+        return breaker
+
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def circuit_stats() -> Dict[str, Dict]:
+    return {name: breaker.stats() for name, breaker in list(_breakers.items())}
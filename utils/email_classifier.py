@@ -0,0 +1,206 @@
+"""
+Local email classification that runs before the emailrep.io lookup
+
+Domains are matched against hash sets of disposable and free webmail
+providers, walking up the labels so subdomains match too, and local parts
+against common role accounts. Extra disposable or free domains can be
+loaded from text files with one domain per line. Outcomes of emailrep.io
+lookups are aggregated per domain, and a domain that emailrep.io keeps
+reporting as disposable is classified locally for EMAIL_LEARNED_TTL seconds,
+after which the next address is checked upstream again.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+DISPOSABLE_DOMAINS = frozenset([
+    '10minutemail.com', '10minutemail.net', '1secmail.com', '1secmail.net', '1secmail.org',
+    '20minutemail.com', '33mail.com', 'anonbox.net', 'burnermail.io', 'byom.de',
+    'discard.email', 'dispostable.com', 'dropmail.me', 'emailfake.com', 'emailondeck.com',
+    'fakeinbox.com', 'fakemail.net', 'getairmail.com', 'getnada.com', 'grr.la',
+    'guerrillamail.biz', 'guerrillamail.com', 'guerrillamail.de', 'guerrillamail.info',
+    'guerrillamail.net', 'guerrillamail.org', 'guerrillamailblock.com', 'harakirimail.com',
+    'inboxbear.com', 'inboxkitten.com', 'incognitomail.org', 'jetable.org', 'mailcatch.com',
+    'maildrop.cc', 'mailinator.com', 'mailinator.net', 'mailinator.org', 'mailinator2.com',
+    'mailnesia.com', 'mailpoof.com', 'mailsac.com', 'mailtemp.net', 'mintemail.com',
+    'moakt.com', 'mohmal.com', 'mytemp.email', 'mytrashmail.com', 'nada.email',
+    'pokemail.net', 'sharklasers.com', 'spam4.me', 'spambog.com', 'spamgourmet.com',
+    'spamex.com', 'temp-mail.io', 'temp-mail.org', 'tempail.com', 'tempinbox.com',
+    'tempmail.dev', 'tempmail.net', 'tempmailo.com', 'tempr.email', 'throwawaymail.com',
+    'tmail.ws', 'tmpmail.net', 'tmpmail.org', 'trash-mail.com', 'trashmail.com',
+    'trashmail.de', 'trashmail.net', 'wegwerfmail.de', 'yopmail.com', 'yopmail.fr',
+    'yopmail.net'
+])
+
+FREE_PROVIDER_DOMAINS = frozenset([
+    '126.com', '163.com', 'aim.com', 'aol.com', 'fastmail.com', 'free.fr', 'gmail.com',
+    'gmx.com', 'gmx.de', 'gmx.net', 'googlemail.com', 'hey.com', 'hotmail.co.uk',
+    'hotmail.com', 'hotmail.de', 'hotmail.fr', 'hushmail.com', 'icloud.com', 'inbox.com',
+    'laposte.net', 'libero.it', 'live.com', 'mac.com', 'mail.com', 'mail.ru', 'me.com',
+    'msn.com', 'naver.com', 'orange.fr', 'outlook.com', 'pm.me', 'proton.me',
+    'protonmail.com', 'qq.com', 'rediffmail.com', 'seznam.cz', 't-online.de',
+    'tuta.io', 'tutanota.com', 'web.de', 'yahoo.co.in', 'yahoo.co.jp', 'yahoo.co.uk',
+    'yahoo.com', 'yahoo.de', 'yahoo.fr', 'yandex.com', 'yandex.ru', 'ymail.com',
+    'zoho.com'
+])
+
+ROLE_LOCAL_PARTS = frozenset([
+    'abuse', 'admin', 'administrator', 'billing', 'careers', 'contact', 'donotreply',
+    'do-not-reply', 'help', 'hello', 'hostmaster', 'hr', 'info', 'jobs', 'legal',
+    'mailer-daemon', 'marketing', 'newsletter', 'no-reply', 'noreply', 'notifications',
+    'office', 'postmaster', 'privacy', 'root', 'sales', 'security', 'support', 'team',
+    'webmaster'
+])
+
+# A domain is treated as disposable once this many emailrep.io answers
+# agree and none disagree
+DOMAIN_MIN_SAMPLES = int(os.getenv('EMAIL_DOMAIN_MIN_SAMPLES', '5'))
+DOMAIN_STATS_MAX_ENTRIES = int(os.getenv('EMAIL_DOMAIN_STATS_MAX_ENTRIES', '10000'))
+# How long a learned disposable verdict is trusted before emailrep.io is asked again
+LEARNED_TTL = float(os.getenv('EMAIL_LEARNED_TTL', '86400'))
+
+def load_domain_file(path: Optional[str]) -> FrozenSet[str]:
+    """
+    Domains from a text file with one per line, '#' starts a comment
+    """
+    if not path:
+        return frozenset()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            domains = {line.split('#', 1)[0].strip().lower() for line in f}
+    except OSError as e:
+        logger.error(f"Failed to load email domain list from {path}: {str(e)}")
+        return frozenset()
+    domains.discard('')
+    logger.info(f"Loaded {len(domains)} email domains from {path}")
+    return frozenset(domains)
+
+def domain_suffixes(domain: str) -> Iterator[str]:
+    """
+    The domain and each parent domain with at least two labels
+    """
+    labels = domain.split('.')
+    for index in range(len(labels) - 1):
+        yield '.'.join(labels[index:])
+
+class DomainReputation:
+    """
+    Per-domain aggregates of emailrep.io answers, least recently seen domains evicted first
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # domain -> counters, plus learned_at once the domain is learned as disposable
+        self._domains: 'OrderedDict[str, Dict[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, domain: str, reputation: Dict):
+        details = reputation.get('details') or {}
+        with self._lock:
+            stats = self._domains.pop(domain, None) or {
+                'lookups': 0, 'suspicious': 0, 'disposable': 0, 'blacklisted': 0
+            }
+            stats['lookups'] += 1
+            stats['suspicious'] += bool(reputation.get('suspicious'))
+            stats['disposable'] += bool(details.get('disposable'))
+            stats['blacklisted'] += bool(details.get('blacklisted'))
+            if stats['lookups'] >= DOMAIN_MIN_SAMPLES and stats['disposable'] == stats['lookups']:
+                # Each agreeing upstream answer renews the verdict
+                stats['learned_at'] = time.monotonic()
+            else:
+                stats.pop('learned_at', None)
+            self._domains[domain] = stats
+            while len(self._domains) > self.max_entries:
+                self._domains.popitem(last=False)
+
+    def get(self, domain: str) -> Optional[Dict]:
+        with self._lock:
+            stats = self._domains.get(domain)
+            if stats is None:
+                return None
+            lookups = stats['lookups']
+            return {
+                'lookups': lookups,
+                'suspicious_rate': round(stats['suspicious'] / lookups, 3),
+                'disposable_rate': round(stats['disposable'] / lookups, 3),
+                'blacklisted_rate': round(stats['blacklisted'] / lookups, 3)
+            }
+
+    def learned_disposable(self, domain: str) -> bool:
+        """
+        Whether domain was learned as disposable within the last LEARNED_TTL seconds
+        """
+        with self._lock:
+            stats = self._domains.get(domain)
+            learned_at = stats.get('learned_at') if stats else None
+            return learned_at is not None and time.monotonic() - learned_at < LEARNED_TTL
+
+class EmailClassifier:
+    """
+    Disposable, free provider and role account checks for an email address
+    """
+
+    def __init__(self, disposable: FrozenSet[str], free: FrozenSet[str], roles: FrozenSet[str]):
+        self.disposable = disposable
+        self.free = free
+        self.roles = roles
+        self.domain_reputation = DomainReputation(DOMAIN_STATS_MAX_ENTRIES)
+
+    def _match(self, domains: FrozenSet[str], domain: str) -> Optional[str]:
+        return next((suffix for suffix in domain_suffixes(domain) if suffix in domains), None)
+
+    def classify(self, email: str) -> Dict:
+        """
+        Local verdict for email; conclusive means emailrep.io need not be asked
+        """
+        local_part, domain = email.lower().rsplit('@', 1)
+        # Sub-addressing tags do not change the mailbox
+        local_part = local_part.split('+', 1)[0]
+
+        disposable_match = self._match(self.disposable, domain)
+        learned = disposable_match is None and self.domain_reputation.learned_disposable(domain)
+        classification = {
+            'domain': domain,
+            'disposable': disposable_match is not None or learned,
+            'free_provider': self._match(self.free, domain) is not None,
+            'role_account': local_part in self.roles,
+            'conclusive': disposable_match is not None or learned
+        }
+        if learned:
+            classification['learned'] = True
+        domain_stats = self.domain_reputation.get(domain)
+        if domain_stats is not None:
+            classification['domain_reputation'] = domain_stats
+        return classification
+
+    def record(self, email: str, reputation: Dict):
+        """
+        Add an emailrep.io answer to its domain's aggregates
+        """
+        self.domain_reputation.record(email.lower().rsplit('@', 1)[-1], reputation)
+
+def local_reputation(email: str, classification: Dict) -> Dict:
+    """
+    Reputation in emailrep.io's format for an address classified locally
+    """
+    return {
+        'email': email,
+        'reputation': 'low',
+        'suspicious': True,
+        'references': 0,
+        'details': {
+            'disposable': classification['disposable'],
+            'free_provider': classification['free_provider']
+        }
+    }
+
+email_classifier = EmailClassifier(
+    DISPOSABLE_DOMAINS | load_domain_file(os.getenv('DISPOSABLE_DOMAINS_PATH')),
+    FREE_PROVIDER_DOMAINS | load_domain_file(os.getenv('FREE_PROVIDER_DOMAINS_PATH')),
+    ROLE_LOCAL_PARTS
+)
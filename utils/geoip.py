@@ -0,0 +1,243 @@
+"""
+Local IP geolocation backed by a sorted IP-range index
+
+The database is a CSV file with one range per row. The range is given either
+as start_ip/end_ip columns (dotted addresses or integers, ip_from/ip_to are
+accepted too) or as a network column in CIDR notation. The remaining columns
+use the field names of the /api/ip response: country, country_code, region,
+region_code, city, latitude, longitude, continent, continent_code, postal,
+timezone, isp, org, asn and asname.
+
+A CSV can be converted once into a compact binary snapshot that loads faster:
+
+    python -m utils.geoip build ranges.csv ranges.bin
+
+The snapshot holds the sorted range bounds as raw little-endian arrays and
+the location records as JSON, so loading it never runs code from the file.
+"""
+import bisect
+import csv
+import ipaddress
+import logging
+import json
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BINARY_MAGIC = b'GEOIDX2\n'
+# Pickled snapshots written by earlier versions, refused rather than unpickled
+LEGACY_MAGIC = b'GEOIDX1\n'
+HEADER_SIZE = struct.Struct('<Q')
+IPV6_BYTES = 16
+
+FIELDS = (
+    'continent', 'continent_code', 'country', 'country_code', 'region', 'region_code',
+    'city', 'latitude', 'longitude', 'postal', 'timezone', 'isp', 'org', 'asn', 'asname'
+)
+FLOAT_FIELDS = ('latitude', 'longitude')
+
+def parse_address(value: str) -> int:
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(ipaddress.ip_address(value))
+
+class GeoIPDatabase:
+    """
+    Sorted, array-backed index of IPv4 and IPv6 ranges answered by binary search
+    """
+
+    def __init__(self):
+        # IPv4 bounds fit in unsigned 32-bit arrays, IPv6 bounds need Python ints
+        self.v4_starts = array('I')
+        self.v4_ends = array('I')
+        self.v4_records = array('I')
+        self.v6_starts: List[int] = []
+        self.v6_ends: List[int] = []
+        self.v6_records = array('I')
+        self.records: List[Tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    @classmethod
+    def load(cls, path: str) -> 'GeoIPDatabase':
+        with open(path, 'rb') as f:
+            magic = f.read(len(BINARY_MAGIC))
+        if magic == LEGACY_MAGIC:
+            raise ValueError(f'{path} is an old pickled snapshot, rebuild it with python -m utils.geoip build')
+        return cls.load_binary(path) if magic == BINARY_MAGIC else cls.load_csv(path)
+
+    @classmethod
+    def load_csv(cls, path: str) -> 'GeoIPDatabase':
+        v4, v6 = [], []
+        record_ids: Dict[Tuple, int] = {}
+        records: List[Tuple] = []
+
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                row = {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}
+                if row.get('network'):
+                    network = ipaddress.ip_network(row['network'], strict=False)
+                    start, end = int(network.network_address), int(network.broadcast_address)
+                    is_v6 = network.version == 6
+                else:
+                    start = parse_address(row.get('start_ip') or row['ip_from'])
+                    end = parse_address(row.get('end_ip') or row['ip_to'])
+                    is_v6 = ':' in (row.get('start_ip') or row.get('ip_from', '')) or end > 0xFFFFFFFF
+
+                record = tuple(row.get(field) or None for field in FIELDS)
+                # Many ranges share a location, store each distinct record once
+                record_id = record_ids.get(record)
+                if record_id is None:
+                    record_id = record_ids[record] = len(records)
+                    records.append(record)
+
+                (v6 if is_v6 else v4).append((start, end, record_id))
+
+        db = cls()
+        db.records = records
+        for start, end, record_id in sorted(v4):
+            db.v4_starts.append(start)
+            db.v4_ends.append(end)
+            db.v4_records.append(record_id)
+        for start, end, record_id in sorted(v6):
+            db.v6_starts.append(start)
+            db.v6_ends.append(end)
+            db.v6_records.append(record_id)
+        return db
+
+    @staticmethod
+    def _read_uint32(f, count: int) -> array:
+        values = array('I')
+        data = f.read(count * values.itemsize)
+        if len(data) != count * values.itemsize:
+            raise ValueError('GeoIP snapshot is truncated')
+        values.frombytes(data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    @staticmethod
+    def _write_uint32(f, values: array):
+        if sys.byteorder == 'big':
+            values = array('I', values)
+            values.byteswap()
+        f.write(values.tobytes())
+
+    @staticmethod
+    def _read_ipv6(f, count: int) -> List[int]:
+        data = f.read(count * IPV6_BYTES)
+        if len(data) != count * IPV6_BYTES:
+            raise ValueError('GeoIP snapshot is truncated')
+        return [int.from_bytes(data[i:i + IPV6_BYTES], 'big') for i in range(0, len(data), IPV6_BYTES)]
+
+    @classmethod
+    def load_binary(cls, path: str) -> 'GeoIPDatabase':
+        """
+        Load a snapshot: magic, header length, JSON header with the counts and
+        records, then the IPv4 start/end/record arrays and the IPv6 ones
+        """
+        with open(path, 'rb') as f:
+            f.read(len(BINARY_MAGIC))
+            (header_size,) = HEADER_SIZE.unpack(f.read(HEADER_SIZE.size))
+            header = json.loads(f.read(header_size).decode('utf-8'))
+            v4_count, v6_count = int(header['v4_count']), int(header['v6_count'])
+            if header.get('fields') != list(FIELDS):
+                raise ValueError('GeoIP snapshot was built with different fields, rebuild it')
+
+            db = cls()
+            db.records = [tuple(record) for record in header['records']]
+            db.v4_starts = cls._read_uint32(f, v4_count)
+            db.v4_ends = cls._read_uint32(f, v4_count)
+            db.v4_records = cls._read_uint32(f, v4_count)
+            db.v6_starts = cls._read_ipv6(f, v6_count)
+            db.v6_ends = cls._read_ipv6(f, v6_count)
+            db.v6_records = cls._read_uint32(f, v6_count)
+
+        highest = max(max(db.v4_records, default=-1), max(db.v6_records, default=-1))
+        if highest >= len(db.records):
+            raise ValueError('GeoIP snapshot refers to a missing record')
+        return db
+
+    def save_binary(self, path: str):
+        header = json.dumps({
+            'v4_count': len(self.v4_starts),
+            'v6_count': len(self.v6_starts),
+            'fields': FIELDS,
+            'records': self.records
+        }, separators=(',', ':')).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(BINARY_MAGIC)
+            f.write(HEADER_SIZE.pack(len(header)))
+            f.write(header)
+            self._write_uint32(f, self.v4_starts)
+            self._write_uint32(f, self.v4_ends)
+            self._write_uint32(f, self.v4_records)
+            f.write(b''.join(value.to_bytes(IPV6_BYTES, 'big') for value in self.v6_starts))
+            f.write(b''.join(value.to_bytes(IPV6_BYTES, 'big') for value in self.v6_ends))
+            self._write_uint32(f, self.v6_records)
+
+    def lookup(self, ip: str) -> Optional[Dict]:
+        """
+        Return the geolocation fields for ip, or None when no range covers it
+        """
+        address = ipaddress.ip_address(ip)
+        value = int(address)
+        if address.version == 4:
+            starts, ends, record_ids = self.v4_starts, self.v4_ends, self.v4_records
+        else:
+            starts, ends, record_ids = self.v6_starts, self.v6_ends, self.v6_records
+
+        index = bisect.bisect_right(starts, value) - 1
+        if index < 0 or value > ends[index]:
+            return None
+
+        data = dict(zip(FIELDS, self.records[record_ids[index]]))
+        for field in FLOAT_FIELDS:
+            if data[field] is not None:
+                try:
+                    data[field] = float(data[field])
+                except ValueError:
+                    data[field] = None
+        data['ip'] = ip
+        data['type'] = f'IPv{address.version}'
+        return data
+
+_database: Optional[GeoIPDatabase] = None
+_database_lock = threading.Lock()
+_database_loaded = False
+
+def get_geoip_database() -> Optional[GeoIPDatabase]:
+    """
+    Return the local database configured by GEOIP_DB_PATH, loading it on first use
+    Returns None when no database is configured or it cannot be loaded
+    """
+    global _database, _database_loaded
+    if _database_loaded:
+        return _database
+
+    with _database_lock:
+        if not _database_loaded:
+            path = os.getenv('GEOIP_DB_PATH')
+            if path:
+                try:
+                    _database = GeoIPDatabase.load(path)
+                    logger.info(f"Loaded {len(_database)} GeoIP ranges from {path}")
+                except Exception as e:
+                    logger.error(f"Failed to load GeoIP database from {path}: {str(e)}")
+            _database_loaded = True
+    return _database
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        print('Usage: python -m utils.geoip build <ranges.csv> <ranges.bin>')
+        sys.exit(1)
+    database = GeoIPDatabase.load_csv(sys.argv[2])
+    database.save_binary(sys.argv[3])
+    print(f'Wrote {len(database)} ranges to {sys.argv[3]}')
@@ -0,0 +1,232 @@
+"""
+Popularity-aware refresh of hot persistent cache entries
+
+Every lookup is counted in a count-min sketch, a few fixed-size rows of
+counters that estimate how often a key was asked for without storing the
+keys themselves. Keys whose estimate reaches HOT_KEY_MIN_HITS are tracked
+along with the function that re-fetches them. A background thread
+periodically re-fetches tracked entries in the last HOT_KEY_REFRESH_AHEAD
+fraction of their TTL, hottest first and at most HOT_KEY_REFRESH_BUDGET per
+round, so popular lookups are refreshed before they expire instead of all
+missing at once. Hot keys with no entry at all, such as IPs answered from
+the geolocation block cache, are fetched and stored within the same budget
+so they are refreshed ahead of expiry from then on. Counters are halved every HOT_KEY_DECAY_INTERVAL so keys
+that cool down stop being refreshed.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.persistent_cache import get_persistent_cache, is_success, refresh_executor, revalidate, store
+
+logger = logging.getLogger(__name__)
+
+HOT_KEY_REFRESH = os.getenv('HOT_KEY_REFRESH', 'true').lower() == 'true'
+HOT_KEY_MIN_HITS = int(os.getenv('HOT_KEY_MIN_HITS', '5'))
+HOT_KEY_MAX_TRACKED = int(os.getenv('HOT_KEY_MAX_TRACKED', '1000'))
+HOT_KEY_REFRESH_INTERVAL = float(os.getenv('HOT_KEY_REFRESH_INTERVAL', '30'))
+HOT_KEY_REFRESH_AHEAD = float(os.getenv('HOT_KEY_REFRESH_AHEAD', '0.1'))
+HOT_KEY_REFRESH_BUDGET = int(os.getenv('HOT_KEY_REFRESH_BUDGET', '20'))
+HOT_KEY_DECAY_INTERVAL = float(os.getenv('HOT_KEY_DECAY_INTERVAL', '3600'))
+HOT_KEY_SKETCH_WIDTH = int(os.getenv('HOT_KEY_SKETCH_WIDTH', '4096'))
+HOT_KEY_SKETCH_DEPTH = int(os.getenv('HOT_KEY_SKETCH_DEPTH', '4'))
+
+class CountMinSketch:
+    """
+    Approximate per-key counts in depth rows of width counters
+
+    Estimates never undercount and overcount by a small fraction of the
+    total, whatever the number of distinct keys. Increments are conservative:
+    only the counters holding the current minimum are raised.
+    """
+
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self._rows: List[List[int]] = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, item: str) -> List[int]:
+        # Two halves of one digest give every row its own hash (double hashing)
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, item: str) -> int:
+        """
+        Count one occurrence of item and return its new estimate
+        """
+        indexes = self._indexes(item)
+        estimate = min(row[index] for row, index in zip(self._rows, indexes)) + 1
+        for row, index in zip(self._rows, indexes):
+            if row[index] < estimate:
+                row[index] = estimate
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(item)))
+
+    def decay(self):
+        """
+        Halve every counter so old popularity fades
+        """
+        for row in self._rows:
+            row[:] = [count >> 1 for count in row]
+
+class HotKeyTracker:
+    """
+    Tracks popular (source, key) pairs and refreshes their cache entries ahead of expiry
+    """
+
+    def __init__(self, min_hits: int = HOT_KEY_MIN_HITS, max_tracked: int = HOT_KEY_MAX_TRACKED):
+        self.min_hits = min_hits
+        self.max_tracked = max_tracked
+        self.sketch = CountMinSketch(HOT_KEY_SKETCH_WIDTH, HOT_KEY_SKETCH_DEPTH)
+        # (source, key) -> (estimate, fetch, cacheable, ttl_for)
+        self._hot: 'OrderedDict[Tuple[str, str], Tuple[int, Callable, Callable, Optional[Callable]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._decayed_at = time.monotonic()
+        # Missing keys being fetched, an entry has no refresh lease until it exists
+        self._filling = set()
+        self.refreshes = 0
+        self.fills = 0
+        self.deferred = 0
+        self.rounds = 0
+
+    def record(self, source: str, key: str, fetch: Callable[[], Any],
+               cacheable: Callable[[Any], bool] = is_success,
+               ttl_for: Optional[Callable[[Any], Optional[float]]] = None):
+        """
+        Count a lookup of (source, key), fetch re-fetches its result when it is hot
+        """
+        if not HOT_KEY_REFRESH:
+            return
+        with self._lock:
+            estimate = self.sketch.add(f'{source}:{key}')
+            if estimate < self.min_hits:
+                return
+            self._hot[(source, key)] = (estimate, fetch, cacheable, ttl_for)
+            if len(self._hot) > self.max_tracked:
+                coldest = min(self._hot, key=lambda hot_key: self._hot[hot_key][0])
+                del self._hot[coldest]
+        self.start()
+
+    def start(self):
+        """
+        Start the refresh thread, later calls do nothing
+        """
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='hot-key-refresh', daemon=True)
+                self._thread.start()
+                logger.info(f"Started hot key refresh every {HOT_KEY_REFRESH_INTERVAL:g}s")
+
+    def _run(self):
+        while True:
+            time.sleep(HOT_KEY_REFRESH_INTERVAL)
+            try:
+                self.refresh_due()
+                if time.monotonic() - self._decayed_at >= HOT_KEY_DECAY_INTERVAL:
+                    self.decay()
+            except Exception as e:
+                logger.error(f"Hot key refresh failed: {str(e)}")
+
+    def decay(self):
+        """
+        Halve all popularity counts and stop tracking keys that are no longer hot
+        """
+        with self._lock:
+            self.sketch.decay()
+            for hot_key, (_, fetch, cacheable, ttl_for) in list(self._hot.items()):
+                estimate = self.sketch.estimate(f'{hot_key[0]}:{hot_key[1]}')
+                if estimate < self.min_hits:
+                    del self._hot[hot_key]
+                else:
+                    self._hot[hot_key] = (estimate, fetch, cacheable, ttl_for)
+            self._decayed_at = time.monotonic()
+
+    def refresh_due(self) -> int:
+        """
+        Start background refreshes for hot entries close to expiry or not
+        cached at all, hottest first and within the budget, returning how
+        many were started
+        """
+        cache = get_persistent_cache()
+        if cache is None:
+            return 0
+
+        with self._lock:
+            candidates = sorted(self._hot.items(), key=lambda item: item[1][0], reverse=True)
+            self.rounds += 1
+
+        now = time.time()
+        started = 0
+        for (source, key), (_, fetch, cacheable, ttl_for) in candidates:
+            expiry = cache.expiry(source, key)
+            if expiry is not None:
+                stored_at, expires_at = expiry
+                if expires_at - now > (expires_at - stored_at) * HOT_KEY_REFRESH_AHEAD:
+                    continue
+            elif (source, key) in self._filling:
+                continue
+            if started >= HOT_KEY_REFRESH_BUDGET:
+                with self._lock:
+                    self.deferred += 1
+                continue
+            if expiry is None:
+                self.fill(cache, source, key, fetch, cacheable, ttl_for)
+                started += 1
+            # The refresh lease keeps other workers from refreshing the same entry
+            elif revalidate(source, key, fetch, cacheable, ttl_for):
+                started += 1
+
+        if started:
+            with self._lock:
+                self.refreshes += started
+            logger.info(f"Refreshing {started} hot cache entries ahead of expiry or missing")
+        return started
+
+    def fill(self, cache, source: str, key: str, fetch: Callable[[], Any],
+             cacheable: Callable[[Any], bool], ttl_for: Optional[Callable[[Any], Optional[float]]]):
+        """
+        Fetch and store a hot key that has no cache entry in the background
+        """
+        with self._lock:
+            self._filling.add((source, key))
+
+        def run():
+            try:
+                store(cache, source, key, fetch(), cacheable, ttl_for)
+                with self._lock:
+                    self.fills += 1
+            except Exception as e:
+                logger.error(f"Hot key fill failed for {source}:{key}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._filling.discard((source, key))
+
+        logger.info(f"Caching hot {source} key {key}")
+        refresh_executor.submit(run)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hottest = sorted(self._hot.items(), key=lambda item: item[1][0], reverse=True)[:10]
+            return {
+                'enabled': HOT_KEY_REFRESH,
+                'tracked': len(self._hot),
+                'hottest': [{'source': source, 'key': key, 'estimate': estimate}
+                            for (source, key), (estimate, _, _, _) in hottest],
+                'rounds': self.rounds,
+                'refreshes': self.refreshes,
+                'fills': self.fills,
+                'deferred': self.deferred
+            }
+
+hot_keys = HotKeyTracker()
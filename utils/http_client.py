@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Connect and read timeouts are set separately so a dead host fails fast
+# while a slow but healthy upstream still gets time to answer
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+HTTP_TIMEOUT: Tuple[float, float] = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.3'))
+
+def default_pool_size() -> int:
+    """
+    Keep-alive connections per host, one per request thread of this worker
+    """
+    threads = int(os.getenv('GUNICORN_THREADS', '1'))
+    return int(os.getenv('HTTP_POOL_MAXSIZE', str(max(10, threads * 2))))
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+def build_session(pool_maxsize: int, retries: int, pool_connections: int = 10) -> requests.Session:
+    """
+    Session with a per-host keep-alive pool and retries for idempotent requests
+    429 is not retried here, a retry would skip the rate limiter's bucket, it
+    counts as a failure for the circuit breaker instead. Retry-After is not
+    honoured either, so a retry never sleeps longer than the backoff
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=HTTP_RETRY_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        raise_on_status=False,
+        respect_retry_after_header=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'OSINT-Dashboard/1.0'
+    return session
+
+def get_session(name: str, pool_maxsize: Optional[int] = None, retries: Optional[int] = None,
+                pool_connections: int = 10) -> requests.Session:
+    """
+    Shared session for an upstream, created on first use
+    pool_connections is the number of distinct hosts whose pools are kept alive
+    """
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        if name not in _sessions:
+            pool_maxsize = pool_maxsize or default_pool_size()
+            retries = HTTP_RETRIES if retries is None else retries
+            _sessions[name] = build_session(pool_maxsize, retries, pool_connections)
+            logger.info(f"Created HTTP session for {name} (pool size {pool_maxsize}, retries {retries})")
+        return _sessions[name]
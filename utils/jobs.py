@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import JOB_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    pass
+
+class Job:
+    """
+    A single background job with its partial and final results
+    """
+
+    def __init__(self, job_id: str, params: Dict):
+        self.job_id = job_id
+        self.params = params
+        self.status = 'queued'
+        self.results: List[Dict] = []
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._condition = threading.Condition()
+        self._done_callbacks: List[Callable[['Job'], None]] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed')
+
+    def add_result(self, item: Dict):
+        """
+        Record a partial result as soon as it is available
+        """
+        with self._condition:
+            self.results.append(item)
+            self._condition.notify_all()
+
+    def set_status(self, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._condition:
+            self.status = status
+            if status == 'running':
+                self.started_at = time.time()
+            if result is not None:
+                self.result = result
+            if error is not None:
+                self.error = error
+            if self.finished:
+                self.finished_at = time.time()
+            self._condition.notify_all()
+            callbacks = self._done_callbacks if self.finished else []
+            if self.finished:
+                self._done_callbacks = []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Done callback for job {self.job_id} failed: {str(e)}")
+
+    def add_done_callback(self, callback: Callable[['Job'], None]):
+        """
+        Call callback(job) once the job has finished, right away if it already has
+        """
+        with self._condition:
+            if not self.finished:
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait_for_update(self, seen: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """
+        Wait until there are results beyond the first `seen` ones or the job finishes
+        Returns the new results and whether the job has finished
+        """
+        with self._condition:
+            if len(self.results) <= seen and not self.finished:
+                self._condition.wait(timeout)
+            return self.results[seen:], self.finished
+
+    def to_dict(self) -> Dict:
+        with self._condition:
+            data = {
+                'job_id': self.job_id,
+                'status': self.status,
+                'params': self.params,
+                'results': list(self.results),
+                'total_found': len(self.results),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+            if self.result is not None:
+                data['result'] = self.result
+            if self.error is not None:
+                data['error'] = self.error
+            return data
+
+class JobQueue:
+    """
+    Bounded background executor that keeps track of submitted jobs
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, retention: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f'{name}-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        # Drop finished jobs once their retention period is over
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == 'queued')
+
+    def running_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == 'running')
+
+    def submit(self, func: Callable[[Job], Dict], params: Dict) -> Job:
+        """
+        Queue func(job) for execution and return the job right away
+        """
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if job.status == 'queued')
+            if pending >= self.max_pending:
+                raise QueueFullError(f'{self.name} job queue is full ({pending} pending)')
+
+            job = Job(uuid.uuid4().hex, params)
+            self._jobs[job.job_id] = job
+
+        JOB_QUEUE_DEPTH.labels(self.name, 'queued').inc()
+        self._executor.submit(self._run, job, func)
+        logger.info(f"Queued {self.name} job {job.job_id}: {params}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, func: Callable[[Job], Dict]):
+        job.set_status('running')
+        JOB_QUEUE_DEPTH.labels(self.name, 'queued').dec()
+        JOB_QUEUE_DEPTH.labels(self.name, 'running').inc()
+        try:
+            result = func(job)
+            if result.get('success'):
+                job.set_status('completed', result=result)
+            else:
+                job.set_status('failed', result=result, error=result.get('error'))
+            logger.info(f"{self.name} job {job.job_id} finished with status {job.status}")
+        except Exception as e:
+            logger.error(f"Unexpected error in {self.name} job {job.job_id}: {str(e)}")
+            job.set_status('failed', error=f'Unexpected error: {str(e)}')
+        finally:
+            JOB_QUEUE_DEPTH.labels(self.name, 'running').dec()
@@ -0,0 +1,95 @@
+"""
+Prometheus metrics
+
+Metrics are recorded where the events happen and exported by /metrics.
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set by gunicorn.conf.py), and the scrape aggregates all of them.
+"""
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+from prometheus_client import multiprocess
+
+# Upstream calls range from sub-millisecond DNS cache hits to minute-long Sherlock scans
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram(
+    'osint_http_request_duration_seconds', 'Time to produce a response, per route',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'osint_http_requests_in_flight', 'Requests being handled',
+    multiprocess_mode='livesum'
+)
+UPSTREAM_LATENCY = Histogram(
+    'osint_upstream_request_duration_seconds', 'Upstream call latency by outcome (status code, timeout or error type)',
+    ['upstream', 'outcome'], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'osint_upstream_requests_in_flight', 'Upstream calls in progress',
+    ['upstream'], multiprocess_mode='livesum'
+)
+CACHE_LOOKUPS = Counter(
+    'osint_cache_lookups_total', 'Cache lookups by result (hit, stale or miss)',
+    ['cache', 'result']
+)
+COALESCED_CALLS = Counter(
+    'osint_coalesced_calls_total', 'Lookups that joined an identical in-flight call',
+    ['upstream']
+)
+JOB_QUEUE_DEPTH = Gauge(
+    'osint_job_queue_depth', 'Background jobs by state',
+    ['queue', 'state'], multiprocess_mode='livesum'
+)
+
+class UpstreamCall:
+    """
+    Outcome of a tracked upstream call, set by the caller when it is not 'ok'
+    """
+
+    def __init__(self):
+        self.outcome = 'ok'
+
+def error_outcome(error: BaseException) -> str:
+    if isinstance(error, (socket.timeout, TimeoutError)) or 'Timeout' in type(error).__name__:
+        return 'timeout'
+    return type(error).__name__
+
+@contextmanager
+def track_upstream(upstream: str):
+    """
+    Time an upstream call and count it as in flight while it runs
+    """
+    call = UpstreamCall()
+    in_flight = UPSTREAM_IN_FLIGHT.labels(upstream)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield call
+    except BaseException as e:
+        call.outcome = error_outcome(e)
+        raise
+    finally:
+        in_flight.dec()
+        UPSTREAM_LATENCY.labels(upstream, call.outcome).observe(time.perf_counter() - start)
+
+def metrics_registry():
+    """
+    Registry to export, aggregating all worker processes in multiprocess mode
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def render_metrics():
+    """
+    Body and content type for a /metrics response
+    """
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
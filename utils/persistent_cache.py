@@ -0,0 +1,393 @@
+"""
+Persistent lookup cache shared by all workers and kept across restarts
+
+Entries live in a SQLite database in WAL mode, so readers in every gunicorn
+worker never block each other or the writer. Each source (whois, geo, email,
+sherlock) has its own TTL and stale window. An entry past its TTL but
+inside the stale window is still served while one worker refreshes it in
+the background (stale-while-revalidate). The database is trimmed to
+PERSISTENT_CACHE_MAX_BYTES, dropping the entries that expire first.
+
+Values are stored as JSON, never pickled, and the database defaults to the
+app's private state directory. A database file owned by another user is
+refused, because anyone who can write it controls what every worker serves.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.metrics import CACHE_LOOKUPS
+from utils.state_dir import check_owned_file, state_path
+
+logger = logging.getLogger(__name__)
+
+PERSISTENT_CACHE = os.getenv('PERSISTENT_CACHE', 'true').lower() == 'true'
+# Defaults to cache.sqlite3 in the state directory
+PERSISTENT_CACHE_PATH = os.getenv('PERSISTENT_CACHE_PATH')
+PERSISTENT_CACHE_MAX_BYTES = int(os.getenv('PERSISTENT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+PERSISTENT_CACHE_REFRESH_WORKERS = int(os.getenv('PERSISTENT_CACHE_REFRESH_WORKERS', '4'))
+
+# Fresh TTL and additional stale window per source, in seconds
+CACHE_POLICIES = {
+    'whois': (86400, 7 * 86400),
+    'geo': (86400, 7 * 86400),
+    'email': (6 * 3600, 86400),
+    'sherlock': (3600, 3600)
+}
+
+# How long a worker owns a background refresh before another may retry it
+REFRESH_LEASE = 120
+EVICTION_CHECK_INTERVAL = 100
+
+# Bumped when stored values change format, older databases are emptied
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    refresh_until REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (source, key)
+);
+CREATE INDEX IF NOT EXISTS entries_stale_until ON entries (stale_until);
+"""
+
+def cache_policy(source: str) -> Tuple[float, float]:
+    """
+    (ttl, stale window) for source, overridable with CACHE_TTL_<SOURCE> and CACHE_STALE_<SOURCE>
+    """
+    ttl, stale = CACHE_POLICIES.get(source, (3600, 0))
+    return (float(os.getenv(f'CACHE_TTL_{source.upper()}', str(ttl))),
+            float(os.getenv(f'CACHE_STALE_{source.upper()}', str(stale))))
+
+def is_success(result: Any) -> bool:
+    return isinstance(result, dict) and bool(result.get('success'))
+
+def json_default(value: Any) -> Any:
+    """
+    Encode the non-JSON values found in lookup results, dates are tagged so
+    they decode back to the same type
+    """
+    if isinstance(value, datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def json_object_hook(obj: Dict) -> Any:
+    if len(obj) == 1:
+        if '$datetime' in obj:
+            return datetime.fromisoformat(obj['$datetime'])
+        if '$date' in obj:
+            return date.fromisoformat(obj['$date'])
+    return obj
+
+def encode_value(value: Any) -> str:
+    # Tuples become lists, which responses render the same way
+    return json.dumps(value, default=json_default, separators=(',', ':'), ensure_ascii=False)
+
+def decode_value(data: str) -> Any:
+    return json.loads(data, object_hook=json_object_hook)
+
+def check_database_files(path: str):
+    """
+    Refuse a database, or its WAL and shared-memory files, owned by another user
+    """
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        check_owned_file(path + suffix)
+
+class PersistentCache:
+    """
+    SQLite-backed cache with one connection per thread
+    """
+
+    def __init__(self, path: str, max_bytes: int = PERSISTENT_CACHE_MAX_BYTES):
+        check_database_files(path)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+        self._migrate()
+
+    def _migrate(self):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                # Entries written in an older format are never read back
+                conn.execute('DROP TABLE IF EXISTS entries')
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, source: str, key: str) -> Optional[Tuple[Any, float, bool]]:
+        """
+        Return (value, age in seconds, stale) or None on a miss
+        """
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                'SELECT value, stored_at, expires_at FROM entries WHERE source = ? AND key = ? AND stale_until > ?',
+                (source, key, now)
+            ).fetchone()
+            if row is None:
+                self._count('misses')
+                CACHE_LOOKUPS.labels(f'persistent:{source}', 'miss').inc()
+                return None
+            value = decode_value(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Persistent cache read failed for {source}:{key}: {str(e)}")
+            self._count('errors')
+            return None
+
+        stale = row[2] <= now
+        self._count('stale_hits' if stale else 'hits')
+        CACHE_LOOKUPS.labels(f'persistent:{source}', 'stale' if stale else 'hit').inc()
+        return value, now - row[1], stale
+
+    def set(self, source: str, key: str, value: Any, ttl: Optional[float] = None):
+        default_ttl, stale_window = cache_policy(source)
+        ttl = default_ttl if ttl is None else ttl
+        now = time.time()
+        try:
+            data = encode_value(value)
+            self._connection().execute(
+                'INSERT OR REPLACE INTO entries (source, key, value, size, stored_at, expires_at, stale_until) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (source, key, data, len(data.encode('utf-8')), now, now + ttl, now + ttl + stale_window)
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Persistent cache write failed for {source}:{key}: {str(e)}")
+            self._count('errors')
+            return
+
+        with self._lock:
+            self._writes += 1
+            check = self._writes % EVICTION_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    def expiry(self, source: str, key: str) -> Optional[Tuple[float, float]]:
+        """
+        (stored_at, expires_at) of a live entry, None when there is none
+        """
+        try:
+            row = self._connection().execute(
+                'SELECT stored_at, expires_at FROM entries WHERE source = ? AND key = ? AND stale_until > ?',
+                (source, key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Persistent cache expiry read failed for {source}:{key}: {str(e)}")
+            return None
+        return (row[0], row[1]) if row else None
+
+    def delete(self, source: str, key: str):
+        try:
+            self._connection().execute('DELETE FROM entries WHERE source = ? AND key = ?', (source, key))
+        except sqlite3.Error as e:
+            logger.error(f"Persistent cache delete failed for {source}:{key}: {str(e)}")
+
+    def claim_refresh(self, source: str, key: str) -> bool:
+        """
+        Take the refresh lease for an entry, so only one worker revalidates it
+        """
+        now = time.time()
+        try:
+            cursor = self._connection().execute(
+                'UPDATE entries SET refresh_until = ? WHERE source = ? AND key = ? AND refresh_until < ?',
+                (now + REFRESH_LEASE, source, key, now)
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.error(f"Persistent cache refresh claim failed for {source}:{key}: {str(e)}")
+            return False
+
+    def evict(self):
+        """
+        Drop dead entries, then the ones expiring first until within the size bound
+        """
+        try:
+            conn = self._connection()
+            conn.execute('DELETE FROM entries WHERE stale_until <= ?', (time.time(),))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            excess = total - self.max_bytes
+            freed = 0
+            doomed = []
+            for source, key, size in conn.execute('SELECT source, key, size FROM entries ORDER BY stale_until'):
+                doomed.append((source, key))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany('DELETE FROM entries WHERE source = ? AND key = ?', doomed)
+            logger.info(f"Evicted {len(doomed)} persistent cache entries ({freed} bytes)")
+        except sqlite3.Error as e:
+            logger.error(f"Persistent cache eviction failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        try:
+            entries, size = self._connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries'
+            ).fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': size,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'errors': self.errors
+            }
+
+_cache: Optional[PersistentCache] = None
+_cache_lock = threading.Lock()
+_cache_loaded = False
+
+def get_persistent_cache() -> Optional[PersistentCache]:
+    """
+    Shared cache at PERSISTENT_CACHE_PATH, None when disabled or unavailable
+    """
+    global _cache, _cache_loaded
+    if _cache_loaded:
+        return _cache
+
+    with _cache_lock:
+        if not _cache_loaded:
+            if PERSISTENT_CACHE:
+                path = PERSISTENT_CACHE_PATH
+                try:
+                    path = path or state_path('cache.sqlite3')
+                    _cache = PersistentCache(path)
+                    logger.info(f"Persistent cache at {path}")
+                except (sqlite3.Error, OSError) as e:
+                    logger.error(f"Failed to open persistent cache at {path or 'the state directory'}: {str(e)}")
+            _cache_loaded = True
+    return _cache
+
+def persistent_cache_stats() -> Optional[Dict]:
+    cache = get_persistent_cache()
+    return cache.stats() if cache else None
+
+# Background revalidation of stale entries
+refresh_executor = ThreadPoolExecutor(max_workers=PERSISTENT_CACHE_REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+
+def store(cache: PersistentCache, source: str, key: str, result: Any,
+          cacheable: Callable[[Any], bool], ttl_for: Optional[Callable[[Any], Optional[float]]]):
+    if cacheable(result):
+        cache.set(source, key, result, ttl=ttl_for(result) if ttl_for else None)
+
+def revalidate(source: str, key: str, fetch: Callable[[], Any], cacheable: Callable[[Any], bool] = is_success,
+               ttl_for: Optional[Callable[[Any], Optional[float]]] = None) -> bool:
+    """
+    Refresh an entry in the background unless another worker already is
+    Returns whether this call started the refresh
+    """
+    cache = get_persistent_cache()
+    if cache is None or not cache.claim_refresh(source, key):
+        return False
+
+    def refresh():
+        try:
+            store(cache, source, key, fetch(), cacheable, ttl_for)
+            cache._count('refreshes')
+        except Exception as e:
+            # The stale entry keeps being served until its window ends
+            logger.error(f"Background refresh failed for {source}:{key}: {str(e)}")
+
+    logger.info(f"Revalidating {source} entry for {key}")
+    refresh_executor.submit(refresh)
+    return True
+
+def cached_call(source: str, key: str, fetch: Callable[[], Any], cacheable: Callable[[Any], bool] = is_success,
+                ttl_for: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+    """
+    Return the cached result for (source, key), calling fetch on a miss
+    """
+    cache = get_persistent_cache()
+    if cache is None:
+        return fetch()
+
+    entry = cache.get(source, key)
+    if entry is not None:
+        value, _, stale = entry
+        if stale:
+            revalidate(source, key, fetch, cacheable, ttl_for)
+        return value
+
+    result = fetch()
+    store(cache, source, key, result, cacheable, ttl_for)
+    return result
+
+async def cached_call_async(source: str, key: str, fetch: Callable[[], Awaitable[Any]],
+                            cacheable: Callable[[Any], bool] = is_success,
+                            ttl_for: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+    """
+    Async counterpart of cached_call, SQLite work runs in a thread so it never blocks the event loop
+    """
+    cache = get_persistent_cache()
+    if cache is None:
+        return await fetch()
+    entry = await asyncio.to_thread(cache.get, source, key)
+    if entry is not None:
+        value, _, stale = entry
+        if stale and await asyncio.to_thread(cache.claim_refresh, source, key):
+            async def refresh():
+                try:
+                    await asyncio.to_thread(store, cache, source, key, await fetch(), cacheable, ttl_for)
+                    cache._count('refreshes')
+                except Exception as e:
+                    logger.error(f"Background refresh failed for {source}:{key}: {str(e)}")
+            logger.info(f"Revalidating stale {source} entry for {key}")
+            task = asyncio.ensure_future(refresh())
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return value
+    result = await fetch()
+    await asyncio.to_thread(store, cache, source, key, result, cacheable, ttl_for)
+    return result
+
+# Strong references so pending refresh tasks are not garbage collected
+_refresh_tasks = set()
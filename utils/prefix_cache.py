@@ -0,0 +1,103 @@
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+ADDRESS_BITS = {4: 32, 6: 128}
+
+class PrefixCache:
+    """
+    Thread-safe cache of values per IPv4/IPv6 network, answered by longest-prefix match
+
+    Each prefix length in use has its own table keyed by the network number,
+    so a lookup is one dictionary probe per length, longest first. Entries
+    expire after ttl and the least recently used are evicted past max_entries.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 100000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (version, prefix length) -> network number -> (value, expires_at)
+        self._tables: Dict[Tuple[int, int], 'OrderedDict[int, Tuple[Any, float]]'] = {}
+        # Prefix lengths in use per IP version, longest first
+        self._lengths: Dict[int, List[int]] = {4: [], 6: []}
+        self._lock = threading.Lock()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ip: str) -> Optional[Tuple[Any, str]]:
+        """
+        Return (value, network in CIDR notation) for the most specific
+        network containing ip, or None on a miss
+        """
+        address = ipaddress.ip_address(ip)
+        bits = ADDRESS_BITS[address.version]
+        number = int(address)
+        now = time.time()
+        with self._lock:
+            for length in list(self._lengths[address.version]):
+                table = self._tables[(address.version, length)]
+                key = number >> (bits - length)
+                entry = table.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at <= now:
+                    self._remove(address.version, length, key)
+                    continue
+                table.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS.labels(self.name, 'hit').inc()
+                network = ipaddress.ip_network((key << (bits - length), length))
+                return value, str(network)
+
+            self.misses += 1
+            CACHE_LOOKUPS.labels(self.name, 'miss').inc()
+            return None
+
+    def set(self, network: str, value: Any):
+        """
+        Store value for a network in CIDR notation, host bits are ignored
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        version, length = network.version, network.prefixlen
+        key = int(network.network_address) >> (ADDRESS_BITS[version] - length)
+        with self._lock:
+            table = self._tables.get((version, length))
+            if table is None:
+                table = self._tables[(version, length)] = OrderedDict()
+                self._lengths[version] = sorted(self._lengths[version] + [length], reverse=True)
+            if key in table:
+                self._remove(version, length, key)
+            table[key] = (value, time.time() + self.ttl)
+            self._size += 1
+
+            # Evict the least recently used entry of the largest table
+            while self._size > self.max_entries:
+                version, length = max(self._tables, key=lambda table_key: len(self._tables[table_key]))
+                self._remove(version, length, next(iter(self._tables[(version, length)])))
+
+    def _remove(self, version: int, length: int, key: int):
+        table = self._tables[(version, length)]
+        del table[key]
+        self._size -= 1
+        if not table:
+            del self._tables[(version, length)]
+            self._lengths[version].remove(length)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': self._size,
+                'prefix_lengths': {f'ipv{version}': list(lengths) for version, lengths in self._lengths.items()},
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,280 @@
+import atexit
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.jobs import QueueFullError
+from utils.metrics import JOB_QUEUE_DEPTH
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# prlimit is Linux only, elsewhere jobs only get the wall-clock limit
+prlimit = getattr(resource, 'prlimit', None)
+
+logger = logging.getLogger(__name__)
+
+class ProcessPool:
+    """
+    Fixed number of warm worker processes that each run one job
+
+    At most size jobs run at once and at most max_queued more wait for a
+    slot, further jobs are rejected with QueueFullError. Workers start in
+    their own session with memory and CPU limits, a job that runs past its
+    timeout has its whole process group killed, and every worker is waited
+    for so none is left behind as a zombie. A finished worker is replaced
+    by a fresh one that starts warming up right away.
+    """
+
+    def __init__(self, name: str, command: List[str], size: int, max_queued: int,
+                 memory_mb: int = 0, cpu_seconds: int = 0, kill_grace: float = 2,
+                 cwd: Optional[str] = None):
+        self.name = name
+        self.command = command
+        self.size = size
+        self.max_queued = max_queued
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.kill_grace = kill_grace
+        self.cwd = cwd
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        # Workers being started outside the lock, counted towards size
+        self._spawning = 0
+        self._started = False
+        self._closed = False
+        self.rejected = 0
+        self.killed = 0
+        atexit.register(self.shutdown)
+
+    def _spawn(self) -> subprocess.Popen:
+        process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=self.cwd,
+            start_new_session=True
+        )
+        # Limits are set from here rather than in a preexec_fn, which is unsafe with threads
+        try:
+            if prlimit and self.memory_mb:
+                limit = self.memory_mb * 1024 * 1024
+                prlimit(process.pid, resource.RLIMIT_AS, (limit, limit))
+            if prlimit and self.cpu_seconds:
+                # SIGXCPU at the soft limit, SIGKILL at the hard one
+                prlimit(process.pid, resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 5))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not limit {self.name} worker {process.pid}: {str(e)}")
+        return process
+
+    def _spawn_idle(self):
+        """
+        Start a worker reserved in _spawning and add it to the idle list,
+        stopping it again if the pool shut down meanwhile
+        """
+        try:
+            process = self._spawn()
+        except BaseException:
+            with self._lock:
+                self._spawning -= 1
+            raise
+        with self._lock:
+            self._spawning -= 1
+            if not self._closed:
+                self._idle.append(process)
+                return
+        self._stop_idle(process)
+
+    def start(self):
+        """
+        Start the warm workers, later calls do nothing
+        Workers are forked outside the lock so stats and other jobs are not
+        held up while they start
+        """
+        with self._lock:
+            if self._started or self._closed:
+                return
+            self._started = True
+            self._spawning += self.size
+        for _ in range(self.size):
+            self._spawn_idle()
+        logger.info(f"Started {self.size} {self.name} workers")
+
+    def _take_worker(self) -> subprocess.Popen:
+        dead = []
+        process = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.poll() is None:
+                    process = candidate
+                    break
+                dead.append(candidate)
+        for candidate in dead:
+            logger.warning(f"Idle {self.name} worker {candidate.pid} exited with {candidate.returncode}")
+            self._close_pipes(candidate)
+        # No warm worker left, start one cold
+        return process or self._spawn()
+
+    def _replace_worker(self):
+        with self._lock:
+            if self._closed or len(self._idle) + self._running + self._spawning >= self.size:
+                return
+            self._spawning += 1
+        self._spawn_idle()
+
+    def kill(self, process: subprocess.Popen):
+        """
+        Terminate the worker and everything it started, then reap it
+        """
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(process.pid, sig)
+            except (ProcessLookupError, PermissionError):
+                break
+            try:
+                process.wait(timeout=self.kill_grace)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        process.wait()
+
+    @staticmethod
+    def _close_pipes(process: subprocess.Popen):
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            if pipe is not None:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+    def run(self, args: List[str], timeout: float,
+            on_line: Optional[Callable[[str], None]] = None) -> Tuple[Optional[int], str]:
+        """
+        Run one job with args, calling on_line with each line it prints
+        Returns the exit status, or None when the job (including its time
+        waiting for a slot) ran past timeout, and the job's stderr
+        Raises QueueFullError when every slot is busy and the queue is full
+        """
+        with self._lock:
+            if self._closed:
+                raise QueueFullError(f'{self.name} pool is shut down')
+            if self._running + self._queued >= self.size + self.max_queued:
+                self.rejected += 1
+                raise QueueFullError(f'{self.name} pool is full ({self._running} running, {self._queued} queued)')
+            self._queued += 1
+        JOB_QUEUE_DEPTH.labels(self.name, 'queued').inc()
+
+        self.start()
+        deadline = time.monotonic() + timeout
+        acquired = False
+        try:
+            acquired = self._slots.acquire(timeout=timeout)
+        finally:
+            with self._lock:
+                self._queued -= 1
+                if acquired:
+                    self._running += 1
+            JOB_QUEUE_DEPTH.labels(self.name, 'queued').dec()
+        if not acquired:
+            return None, ''
+
+        JOB_QUEUE_DEPTH.labels(self.name, 'running').inc()
+        try:
+            return self._run_job(args, deadline, on_line)
+        finally:
+            with self._lock:
+                self._running -= 1
+            JOB_QUEUE_DEPTH.labels(self.name, 'running').dec()
+            self._replace_worker()
+            self._slots.release()
+
+    def _run_job(self, args: List[str], deadline: float,
+                 on_line: Optional[Callable[[str], None]]) -> Tuple[Optional[int], str]:
+        process = self._take_worker()
+        stderr_output = []
+
+        def read_stdout():
+            for line in process.stdout:
+                if on_line:
+                    on_line(line)
+
+        def read_stderr():
+            stderr_output.append(process.stderr.read())
+
+        readers = [
+            threading.Thread(target=read_stdout, daemon=True),
+            threading.Thread(target=read_stderr, daemon=True)
+        ]
+        for reader in readers:
+            reader.start()
+
+        try:
+            try:
+                process.stdin.write(json.dumps(args) + '\n')
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                # The worker died while idle, its exit status tells why
+                pass
+
+            try:
+                process.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.killed += 1
+                logger.warning(f"Killing {self.name} worker {process.pid} after its timeout")
+                self.kill(process)
+                returncode = None
+            else:
+                returncode = process.returncode
+        except BaseException:
+            self.kill(process)
+            raise
+        finally:
+            # Grandchildren holding the pipes open are gone with the process group
+            for reader in readers:
+                reader.join(timeout=self.kill_grace)
+            self._close_pipes(process)
+
+        return returncode, ''.join(stderr_output)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'size': self.size,
+                'running': self._running,
+                'queued': self._queued,
+                'max_queued': self.max_queued,
+                'idle': sum(1 for process in self._idle if process.poll() is None),
+                'rejected': self.rejected,
+                'killed': self.killed
+            }
+
+    def _stop_idle(self, process: subprocess.Popen):
+        # An idle worker exits when its stdin closes without a job
+        self._close_pipes(process)
+        try:
+            process.wait(timeout=self.kill_grace)
+        except subprocess.TimeoutExpired:
+            self.kill(process)
+
+    def shutdown(self):
+        """
+        Stop the idle workers, running jobs finish on their own
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for process in idle:
+            self._stop_idle(process)
@@ -0,0 +1,326 @@
+"""
+Per-upstream rate limiting
+
+Each upstream has a token bucket whose state lives in a small file under
+RATE_LIMIT_DIR, by default the app's private state directory. The file is updated under an exclusive flock, so every worker
+process on the host draws from the same quota. Callers that find the bucket
+empty wait for the next token instead of failing. Waiters are queued per client and
+served round-robin, so one heavy caller cannot starve the others. Async callers
+wait with asyncio.sleep in their own round-robin queue, so waiting never ties
+up a thread.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, the bucket is then per process
+    fcntl = None
+
+from utils.state_dir import app_state_dir, check_owned_file, private_dir
+
+logger = logging.getLogger(__name__)
+
+# Defaults to the state directory
+RATE_LIMIT_DIR = os.getenv('RATE_LIMIT_DIR')
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '10'))
+# Reverse proxies in front of the app that append to X-Forwarded-For, 0 ignores the header
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', '0'))
+
+# Requests per second and burst size per upstream, a rate of 0 disables limiting
+RATE_LIMIT_DEFAULTS = {
+    'emailrep': (1.0, 5),
+    'ipwhois': (5.0, 10)
+}
+
+BUCKET_STATE = struct.Struct('dd')
+
+# Identity of the client the current request is served for
+current_client: contextvars.ContextVar[str] = contextvars.ContextVar('current_client', default='anonymous')
+
+class RateLimitExceeded(Exception):
+    pass
+
+def client_id(forwarded_for: Optional[str], remote_addr: Optional[str],
+              trusted_proxies: Optional[int] = None) -> str:
+    """
+    Client identity used for fair scheduling
+    Behind trusted_proxies proxies (TRUSTED_PROXY_COUNT by default) this is
+    the X-Forwarded-For hop the outermost one appended. Earlier hops are
+    set by the client and are ignored, so rotating them does not earn a
+    fresh queue
+    """
+    trusted_proxies = TRUSTED_PROXY_COUNT if trusted_proxies is None else trusted_proxies
+    if forwarded_for and trusted_proxies > 0:
+        hops = [hop.strip() for hop in forwarded_for.split(',') if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr or 'anonymous'
+
+class TokenBucket:
+    """
+    Token bucket shared between processes through a state file
+
+    The file must sit in a directory only this user controls. When it does
+    not, the bucket falls back to an unlinked temporary file and only limits
+    this process.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, state_dir: Optional[str] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        try:
+            directory = private_dir(state_dir or RATE_LIMIT_DIR or app_state_dir())
+            self.path = os.path.join(directory, f'ratelimit-{name}.bucket')
+            check_owned_file(self.path)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+        except OSError as e:
+            logger.error(f"Rate limit state for {name} is not shared between workers: {str(e)}")
+            self.path = None
+            self._file = tempfile.TemporaryFile()
+            self._fd = self._file.fileno()
+
+    def try_acquire(self) -> float:
+        """
+        Take a token if one is available
+        Returns 0 on success, otherwise the seconds until the next token
+        """
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                data = os.pread(self._fd, BUCKET_STATE.size, 0)
+                if len(data) == BUCKET_STATE.size:
+                    tokens, updated = BUCKET_STATE.unpack(data)
+                    tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                else:
+                    tokens = float(self.burst)
+
+                if tokens >= 1:
+                    tokens -= 1
+                    delay = 0.0
+                else:
+                    delay = (1 - tokens) / self.rate
+                os.pwrite(self._fd, BUCKET_STATE.pack(tokens, now), 0)
+                return delay
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+class RateLimiter:
+    """
+    Blocks callers until the upstream's bucket has a token, serving waiting
+    clients round-robin
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(name, rate, burst) if rate > 0 else None
+        self._queues: 'OrderedDict[str, deque]' = OrderedDict()
+        self._cond = threading.Condition()
+        # Async waiters, only touched from the event loop thread
+        self._async_queues: 'OrderedDict[str, deque[asyncio.Future]]' = OrderedDict()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    def _head(self) -> Optional[object]:
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _remove(self, client: str, ticket: object):
+        queue = self._queues[client]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[client]
+
+    def acquire(self, client: Optional[str] = None) -> float:
+        """
+        Wait for a token on behalf of client (the current request's client by default)
+        Returns the seconds spent waiting, raises RateLimitExceeded after max_wait
+        """
+        if self.bucket is None:
+            return 0.0
+
+        client = client or current_client.get()
+        ticket = object()
+        start = time.monotonic()
+        deadline = start + self.max_wait
+
+        with self._cond:
+            self._queues.setdefault(client, deque()).append(ticket)
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                while True:
+                    delay = None
+                    if self._head() is ticket:
+                        delay = self.bucket.try_acquire()
+                        if delay == 0:
+                            self._remove(client, ticket)
+                            # Rotate so the next waiting client is served first
+                            if client in self._queues:
+                                self._queues.move_to_end(client)
+                            break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(client, ticket)
+                        self.rejected += 1
+                        logger.warning(f"Rate limit wait for {self.name} exceeded {self.max_wait}s ({client})")
+                        raise RateLimitExceeded(f'{self.name} rate limit exceeded')
+                    self._cond.wait(remaining if delay is None else min(delay, remaining))
+            finally:
+                self.waiting -= 1
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self.acquired += 1
+            if waited > 0.001:
+                self.delayed += 1
+                self.total_wait += waited
+            return waited
+
+    def _async_head(self) -> Optional[asyncio.Future]:
+        for queue in self._async_queues.values():
+            return queue[0]
+        return None
+
+    def _leave_async(self, client: str, waiter: asyncio.Future, acquired: bool):
+        queue = self._async_queues[client]
+        queue.remove(waiter)
+        if not queue:
+            del self._async_queues[client]
+        elif acquired:
+            # Rotate so the next waiting client is served first
+            self._async_queues.move_to_end(client)
+        # Wake whoever is now at the head of the line
+        head = self._async_head()
+        if head is not None and not head.done():
+            head.set_result(None)
+
+    async def acquire_async(self, client: Optional[str] = None) -> float:
+        """
+        Async counterpart of acquire, waits on the event loop instead of blocking a thread
+        Returns the seconds spent waiting, raises RateLimitExceeded after max_wait
+        """
+        if self.bucket is None:
+            return 0.0
+
+        client = client or current_client.get()
+        waiter = asyncio.get_running_loop().create_future()
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        self._async_queues.setdefault(client, deque()).append(waiter)
+        with self._cond:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+        acquired = False
+        try:
+            while True:
+                delay = None
+                if self._async_head() is waiter:
+                    delay = self.bucket.try_acquire()
+                    if delay == 0:
+                        acquired = True
+                        break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._cond:
+                        self.rejected += 1
+                    logger.warning(f"Rate limit wait for {self.name} exceeded {self.max_wait}s ({client})")
+                    raise RateLimitExceeded(f'{self.name} rate limit exceeded')
+                if delay is not None:
+                    await asyncio.sleep(min(delay, remaining))
+                else:
+                    # Woken when this waiter reaches the head of the line
+                    try:
+                        await asyncio.wait_for(asyncio.shield(waiter), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self._leave_async(client, waiter, acquired)
+            with self._cond:
+                self.waiting -= 1
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self.acquired += 1
+            if waited > 0.001:
+                self.delayed += 1
+                self.total_wait += waited
+        return waited
+
+    def try_acquire(self) -> bool:
+        """
+        Take a token only if nobody is waiting and one is available now,
+        used for optional extra requests such as hedges
+        """
+        if self.bucket is None:
+            return True
+        with self._cond:
+            if self._queues or self._async_queues:
+                return False
+            if self.bucket.try_acquire() != 0:
+                return False
+            self.acquired += 1
+            return True
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'queue_depth': self.waiting,
+                'queued_clients': len(self._queues) + len(self._async_queues),
+                'max_queue_depth': self.max_waiting,
+                'acquired': self.acquired,
+                'delayed': self.delayed,
+                'rejected': self.rejected,
+                'avg_wait': round(self.total_wait / self.delayed, 3) if self.delayed else 0.0
+            }
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(name: str) -> RateLimiter:
+    """
+    Shared limiter for an upstream, configured by RATE_LIMIT_<NAME> and RATE_LIMIT_<NAME>_BURST
+    """
+    limiter = _limiters.get(name)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        if name not in _limiters:
+            default_rate, default_burst = RATE_LIMIT_DEFAULTS.get(name, (0.0, 1))
+            rate = float(os.getenv(f'RATE_LIMIT_{name.upper()}', str(default_rate)))
+            burst = int(os.getenv(f'RATE_LIMIT_{name.upper()}_BURST', str(default_burst)))
+            _limiters[name] = RateLimiter(name, rate, max(1, burst))
+            logger.info(f"Rate limiter for {name}: {rate}/s, burst {burst}")
+        return _limiters[name]
+
+def rate_limit_stats() -> Dict[str, Dict]:
+    for name in RATE_LIMIT_DEFAULTS:
+        get_rate_limiter(name)
+    return {name: limiter.stats() for name, limiter in list(_limiters.items())}
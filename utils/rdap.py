@@ -0,0 +1,164 @@
+"""
+RDAP bootstrap registry for domain lookups
+
+The IANA bootstrap file maps TLDs to the base URLs of their RDAP servers
+(RFC 9224). It is downloaded once, kept on disk for RDAP_BOOTSTRAP_TTL
+seconds in the app's private state directory and shared by all workers on
+the host. When the download fails an expired copy is still used.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from utils.http_client import HTTP_TIMEOUT, get_session
+from utils.metrics import track_upstream
+from utils.state_dir import check_owned_file, state_path
+
+logger = logging.getLogger(__name__)
+
+RDAP_BOOTSTRAP_URL = os.getenv('RDAP_BOOTSTRAP_URL', 'https://data.iana.org/rdap/dns.json')
+# Defaults to rdap-dns.json in the state directory
+RDAP_BOOTSTRAP_PATH = os.getenv('RDAP_BOOTSTRAP_PATH')
+RDAP_BOOTSTRAP_TTL = float(os.getenv('RDAP_BOOTSTRAP_TTL', '86400'))
+BOOTSTRAP_RETRY_INTERVAL = 300
+# Registries whose keep-alive connections are kept open at once
+RDAP_POOL_CONNECTIONS = int(os.getenv('RDAP_POOL_CONNECTIONS', '32'))
+# Send every query to this server instead of the TLD's registry (for testing)
+RDAP_URL = os.getenv('RDAP_URL')
+
+def rdap_session() -> requests.Session:
+    """
+    Shared session keeping a keep-alive pool per RDAP server
+    """
+    return get_session('rdap', pool_connections=RDAP_POOL_CONNECTIONS)
+
+def parse_bootstrap(data: Dict) -> Dict[str, str]:
+    """
+    Map each TLD in a bootstrap file to its RDAP base URL, preferring HTTPS
+    """
+    servers = {}
+    for entry in data.get('services', []):
+        if len(entry) < 2 or not entry[1]:
+            continue
+        tlds, urls = entry[0], entry[1]
+        url = next((url for url in urls if url.startswith('https://')), urls[0])
+        if not url.endswith('/'):
+            url += '/'
+        for tld in tlds:
+            servers[tld.lower()] = url
+    return servers
+
+class RDAPBootstrap:
+    """
+    TLD to RDAP server table, loaded from the disk copy or IANA on first use
+    """
+
+    def __init__(self, url: str, path: Optional[str], ttl: float):
+        self.url = url
+        self._path = path
+        self._path_resolved = path is not None
+        self.ttl = ttl
+        self._servers: Optional[Dict[str, str]] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Optional[str]:
+        """
+        Disk copy location, None when the state directory is not safe to use
+        """
+        if not self._path_resolved:
+            try:
+                self._path = state_path('rdap-dns.json')
+            except OSError as e:
+                logger.error(f"RDAP bootstrap will not be kept on disk: {str(e)}")
+            self._path_resolved = True
+        return self._path
+
+    def _read(self) -> Optional[Dict[str, str]]:
+        if self.path is None:
+            return None
+        try:
+            check_owned_file(self.path)
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return parse_bootstrap(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read RDAP bootstrap from {self.path}: {str(e)}")
+            return None
+
+    def _download(self) -> Optional[Dict[str, str]]:
+        try:
+            with track_upstream('rdap-bootstrap'):
+                response = rdap_session().get(self.url, timeout=HTTP_TIMEOUT)
+                response.raise_for_status()
+                data = response.json()
+            servers = parse_bootstrap(data)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Failed to download RDAP bootstrap from {self.url}: {str(e)}")
+            return None
+
+        logger.info(f"Downloaded RDAP bootstrap with {len(servers)} TLDs")
+        if self.path is None:
+            return servers
+        try:
+            # Write to a temporary file and rename so readers never see a partial file
+            directory = os.path.dirname(self.path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.rdap-dns-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save RDAP bootstrap to {self.path}: {str(e)}")
+        return servers
+
+    def _age(self) -> float:
+        if self.path is None:
+            return float('inf')
+        try:
+            return time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return float('inf')
+
+    def servers(self) -> Dict[str, str]:
+        """
+        TLD to base URL table, empty when no bootstrap file could be loaded
+        """
+        if self._servers is not None and time.monotonic() < self._expires_at:
+            return self._servers
+
+        with self._lock:
+            if self._servers is not None and time.monotonic() < self._expires_at:
+                return self._servers
+
+            # Another worker may have refreshed the disk copy already
+            age = self._age()
+            servers = self._read() if age < self.ttl else None
+            if servers is not None:
+                self._expires_at = time.monotonic() + self.ttl - age
+            else:
+                servers = self._download()
+                self._expires_at = time.monotonic() + self.ttl
+            if servers is None:
+                # Keep using an expired copy and try again a bit later
+                servers = self._read() or self._servers or {}
+                self._expires_at = time.monotonic() + BOOTSTRAP_RETRY_INTERVAL
+            self._servers = servers
+            return servers
+
+    def server_for(self, domain: str) -> Optional[str]:
+        """
+        RDAP base URL for the domain's TLD, None when the TLD has no RDAP service
+        """
+        if RDAP_URL:
+            return RDAP_URL if RDAP_URL.endswith('/') else RDAP_URL + '/'
+        return self.servers().get(domain.rsplit('.', 1)[-1].lower())
+
+rdap_bootstrap = RDAPBootstrap(RDAP_BOOTSTRAP_URL, RDAP_BOOTSTRAP_PATH, RDAP_BOOTSTRAP_TTL)
@@ -0,0 +1,224 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from utils.http_client import get_session
+from utils.sherlock_sites import SHERLOCK_SITE_TIMEOUT, site_stats, site_stats_file
+
+logger = logging.getLogger(__name__)
+
+# Same browser user agent Sherlock sends, some sites misbehave for bots
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/116.0'
+}
+
+# Fingerprints of WAF challenge pages that would otherwise look like claimed profiles
+WAF_FINGERPRINTS = [
+    '.loading-spinner{visibility:hidden}body.no-js .challenge-running{display:none}',
+    '{return l.onPageView}}),Object.defineProperty(r,"perimeterxIdentifiers",{enumerable:'
+]
+
+def default_data_path() -> Optional[str]:
+    """
+    Locate the site manifest bundled with the sherlock-project package
+    """
+    try:
+        import sherlock_project
+        path = os.path.join(os.path.dirname(sherlock_project.__file__), 'resources', 'data.json')
+        return path if os.path.exists(path) else None
+    except ImportError:
+        return None
+
+def interpolate(value, username: str):
+    """
+    Substitute the username into a manifest string, list or dict
+    """
+    if isinstance(value, str):
+        return value.replace('{}', username)
+    if isinstance(value, dict):
+        return {k: interpolate(v, username) for k, v in value.items()}
+    if isinstance(value, list):
+        return [interpolate(v, username) for v in value]
+    return value
+
+class SherlockEngine:
+    """
+    In-process Sherlock implementation that checks sites concurrently
+    through one pooled HTTP session
+    """
+
+    def __init__(self, data_path: str, max_workers: int = 32, site_timeout: float = 10,
+                 include_nsfw: bool = False):
+        self.data_path = data_path
+        self.max_workers = max_workers
+        self.site_timeout = site_timeout
+        self.sites = self._load_sites(data_path, include_nsfw)
+
+        # Site probes are not retried, a miss is cheaper than a slower scan
+        self.session = get_session('sherlock', pool_maxsize=max_workers, retries=0,
+                                   pool_connections=len(self.sites))
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sherlock-site')
+        logger.info(f"Sherlock engine loaded {len(self.sites)} sites from {data_path}")
+
+    @staticmethod
+    def _load_sites(data_path: str, include_nsfw: bool) -> Dict[str, Dict]:
+        with open(data_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        data.pop('$schema', None)
+        sites = {}
+        for name, info in data.items():
+            if not isinstance(info, dict) or 'url' not in info or 'errorType' not in info:
+                continue
+            if info.get('isNSFW') and not include_nsfw:
+                continue
+            # Precompile username rules once instead of on every request
+            regex_check = info.get('regexCheck')
+            info['_regex'] = re.compile(regex_check) if regex_check else None
+            sites[name] = info
+        return sites
+
+    def check_site(self, username: str, site: str, info: Dict, timeout: Optional[float] = None) -> Dict:
+        """
+        Check a single site, mirroring the detection rules of the Sherlock CLI
+        """
+        url = interpolate(info['url'], username.replace(' ', '%20'))
+        record = {'site': site, 'url': url, 'status': 'unknown', 'elapsed': None}
+
+        if info['_regex'] is not None and info['_regex'].search(username) is None:
+            record['status'] = 'illegal'
+            return record
+
+        error_type = info['errorType']
+        url_probe = interpolate(info['urlProbe'], username) if info.get('urlProbe') else url
+        payload = interpolate(info['request_payload'], username) if info.get('request_payload') else None
+
+        method = info.get('request_method')
+        if method is None:
+            # A HEAD request is enough when the status code decides
+            method = 'HEAD' if error_type == 'status_code' else 'GET'
+
+        headers = dict(DEFAULT_HEADERS)
+        headers.update(info.get('headers', {}))
+
+        start = time.monotonic()
+        try:
+            response = self.session.request(
+                method,
+                url_probe,
+                headers=headers,
+                json=payload,
+                # Sites that redirect missing users are judged on the original status
+                allow_redirects=error_type != 'response_url',
+                timeout=timeout or self.site_timeout
+            )
+        except requests.exceptions.RequestException as e:
+            record['status'] = 'error'
+            record['error'] = type(e).__name__
+            record['elapsed'] = time.monotonic() - start
+            return record
+        record['elapsed'] = time.monotonic() - start
+
+        text = response.text if method != 'HEAD' else ''
+        if any(fingerprint in text for fingerprint in WAF_FINGERPRINTS):
+            record['status'] = 'waf'
+        elif error_type == 'message':
+            errors = info.get('errorMsg')
+            if isinstance(errors, str):
+                errors = [errors]
+            record['status'] = 'not_found' if any(error in text for error in errors or []) else 'found'
+        elif error_type == 'status_code':
+            error_codes = info.get('errorCode')
+            if isinstance(error_codes, int):
+                error_codes = [error_codes]
+            if error_codes is not None and response.status_code in error_codes:
+                record['status'] = 'not_found'
+            elif response.status_code >= 300 or response.status_code < 200:
+                record['status'] = 'not_found'
+            else:
+                record['status'] = 'found'
+        elif error_type == 'response_url':
+            record['status'] = 'found' if 200 <= response.status_code < 300 else 'not_found'
+
+        return record
+
+    def search(self, username: str, timeout: Optional[float] = None,
+               on_result: Optional[Callable[[Dict], None]] = None,
+               sites: Optional[Sequence[str]] = None,
+               pinned: Optional[Sequence[str]] = None) -> Tuple[List[Dict], bool]:
+        """
+        Check every site (or only sites) for username
+        Returns the found profiles and whether the overall timeout was hit
+
+        Each site gets a timeout learned from its own latency, and sites that
+        keep failing are skipped until their next probe, except the pinned
+        sites the caller asked for by name.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        names = self.sites if sites is None else [site for site in sites if site in self.sites]
+        ordered, skipped = site_stats.plan(names, pinned or ())
+        if skipped:
+            logger.info(f"Sherlock scan for {username} skips {len(skipped)} failing sites")
+        futures = [self._executor.submit(self.check_site, username, site, self.sites[site],
+                                         site_stats.timeout_for(site, self.site_timeout))
+                   for site in ordered]
+
+        results = []
+        timed_out = False
+        try:
+            remaining = deadline - time.monotonic() if deadline else None
+            for future in as_completed(futures, timeout=remaining):
+                record = future.result()
+                # Outcomes and latencies feed site ranking, timeouts and skipping
+                site_stats.record(record['site'], record['status'], record['elapsed'])
+                if record['status'] != 'found':
+                    continue
+                found = {'site': record['site'], 'url': record['url'], 'status': 'found'}
+                results.append(found)
+                if on_result:
+                    on_result(found)
+        except FuturesTimeoutError:
+            timed_out = True
+            for future in futures:
+                future.cancel()
+
+        site_stats.save(site_stats_file)
+        return results, timed_out
+
+_engine: Optional[SherlockEngine] = None
+_engine_lock = threading.Lock()
+
+def get_sherlock_engine() -> Optional[SherlockEngine]:
+    """
+    Return the shared engine, loading the site manifest on first use
+    Returns None when the manifest is not available
+    """
+    global _engine
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is None:
+            data_path = os.getenv('SHERLOCK_DATA_PATH') or default_data_path()
+            if not data_path:
+                logger.warning("Sherlock site manifest not found, native engine unavailable")
+                return None
+            try:
+                _engine = SherlockEngine(
+                    data_path,
+                    max_workers=int(os.getenv('SHERLOCK_MAX_FANOUT', '32')),
+                    site_timeout=SHERLOCK_SITE_TIMEOUT,
+                    include_nsfw=os.getenv('SHERLOCK_INCLUDE_NSFW', 'false').lower() == 'true'
+                )
+            except Exception as e:
+                logger.error(f"Failed to load Sherlock site manifest from {data_path}: {str(e)}")
+                return None
+    return _engine
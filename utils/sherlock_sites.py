@@ -0,0 +1,423 @@
+"""
+Sherlock site selection and per-site history
+
+A scan can be limited to an explicit site list, to named site groups and to
+the top N sites by historical hit rate, and can be given a deadline after
+which the profiles found so far are returned. Hit rates are learned from
+completed site checks; until a site has history, sites in the 'major' group
+rank first.
+
+The native engine also records each site's recent response times and
+outcomes. A site's timeout follows its own latency percentile instead of the
+global SHERLOCK_SITE_TIMEOUT, and a site that keeps failing is skipped for a
+while and then probed again. The history is saved to SHERLOCK_SITE_STATS_PATH,
+by default in the app's private state directory, so it survives restarts.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from utils.circuit_breaker import percentile
+from utils.state_dir import check_owned_file, state_path
+
+logger = logging.getLogger(__name__)
+
+SITE_GROUPS: Dict[str, List[str]] = {
+    'major': [
+        'GitHub', 'GitLab', 'Reddit', 'Twitter', 'Instagram', 'YouTube', 'Twitch', 'LinkedIn',
+        'Telegram', 'Snapchat', 'Spotify', 'SoundCloud', 'Medium', 'Patreon', 'Steam Community (User)',
+        'Xbox Gamertag', 'Roblox', 'Chess', 'Vimeo', 'Flickr', 'DeviantART', 'Dribbble', 'Behance',
+        'Pastebin', 'Keybase', 'HackerNews', 'Docker Hub', 'Linktree', 'Gravatar', 'Imgur'
+    ],
+    'social': [
+        'Twitter', 'Instagram', 'Reddit', 'Snapchat', 'Telegram', 'VK', 'Tellonym.me', 'AskFM',
+        'Clubhouse', 'mastodon.social', 'Fosstodon', 'Myspace', 'LiveJournal', 'Linktree',
+        'AllMyLinks', 'About.me', 'minds'
+    ],
+    'developer': [
+        'GitHub', 'GitLab', 'BitBucket', 'Codeberg', 'Docker Hub', 'npm', 'PyPi', 'RubyGems',
+        'Packagist', 'HackerNews', 'DEV Community', 'Hashnode', 'LeetCode', 'HackerRank', 'Codewars',
+        'Codepen', 'Replit.com', 'Kaggle', 'Keybase', 'SourceForge', 'Launchpad'
+    ],
+    'gaming': [
+        'Steam Community (User)', 'Xbox Gamertag', 'Roblox', 'Twitch', 'Kick', 'Chess', 'Lichess',
+        'osu!', 'Minecraft', 'FortniteTracker', 'PSNProfiles.com', 'Speedrun.com', 'Itch.io',
+        'NitroType', 'RuneScape'
+    ],
+    'creative': [
+        'DeviantART', 'ArtStation', 'Behance', 'Dribbble', 'Flickr', 'SoundCloud', 'Bandcamp',
+        'MixCloud', 'Vimeo', 'YouTube', 'Unsplash', 'VSCO', 'Wattpad', 'Patreon', 'kofi', 'BuyMeACoffee'
+    ],
+    'security': [
+        'HackerOne', 'BugCrowd', 'HackTheBox', 'TryHackMe', 'Intigriti', 'CyberDefenders',
+        'PentesterLab', 'VirusTotal', 'HudsonRock'
+    ]
+}
+
+# Longest scan deadline a request may ask for, in seconds
+SHERLOCK_MAX_DEADLINE = float(os.getenv('SHERLOCK_MAX_DEADLINE', '300'))
+
+# Prior hit rates for sites without history, weighted as PRIOR_WEIGHT checks
+MAJOR_PRIOR = 0.5
+DEFAULT_PRIOR = 0.05
+PRIOR_WEIGHT = 2
+
+# Adaptive per-site timeouts: multiplier x latency percentile, within [minimum, SHERLOCK_SITE_TIMEOUT]
+SHERLOCK_SITE_TIMEOUT = float(os.getenv('SHERLOCK_SITE_TIMEOUT', '10'))
+SHERLOCK_ADAPTIVE_TIMEOUTS = os.getenv('SHERLOCK_ADAPTIVE_TIMEOUTS', 'true').lower() == 'true'
+SHERLOCK_TIMEOUT_PERCENTILE = float(os.getenv('SHERLOCK_TIMEOUT_PERCENTILE', '99'))
+SHERLOCK_TIMEOUT_MULTIPLIER = float(os.getenv('SHERLOCK_TIMEOUT_MULTIPLIER', '1.5'))
+SHERLOCK_MIN_SITE_TIMEOUT = float(os.getenv('SHERLOCK_MIN_SITE_TIMEOUT', '2'))
+SHERLOCK_TIMEOUT_MIN_SAMPLES = int(os.getenv('SHERLOCK_TIMEOUT_MIN_SAMPLES', '10'))
+SHERLOCK_LATENCY_WINDOW = int(os.getenv('SHERLOCK_LATENCY_WINDOW', '50'))
+
+# Sites failing this many checks in a row are skipped for SHERLOCK_SKIP_SECONDS, then probed again
+SHERLOCK_SKIP_AFTER_FAILURES = int(os.getenv('SHERLOCK_SKIP_AFTER_FAILURES', '5'))
+SHERLOCK_SKIP_SECONDS = float(os.getenv('SHERLOCK_SKIP_SECONDS', '600'))
+
+# Defaults to sherlock-sites.json in the state directory
+SHERLOCK_SITE_STATS_PATH = os.getenv('SHERLOCK_SITE_STATS_PATH')
+SITE_STATS_SAVE_INTERVAL = 60
+
+def site_stats_path() -> Optional[str]:
+    """
+    Where site history is kept, None when the state directory is not safe to use
+    """
+    try:
+        return SHERLOCK_SITE_STATS_PATH or state_path('sherlock-sites.json')
+    except OSError as e:
+        logger.error(f"Sherlock site stats will not be saved: {str(e)}")
+        return None
+
+def split_names(value: Union[str, Sequence[str], None]) -> List[str]:
+    """
+    Names from a comma-separated string or a list, without blanks or duplicates
+    """
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return list(dict.fromkeys(name.strip() for name in value if isinstance(name, str) and name.strip()))
+
+class ScanOptions:
+    """
+    Which sites a Sherlock scan checks and how long it may run
+    """
+
+    def __init__(self, sites: Optional[List[str]] = None, groups: Optional[List[str]] = None,
+                 top: Optional[int] = None, deadline: Optional[float] = None):
+        self.sites = sites or []
+        self.groups = groups or []
+        self.top = top
+        self.deadline = deadline
+
+    @property
+    def full_scan(self) -> bool:
+        return not (self.sites or self.groups or self.top)
+
+    def cache_key(self, username: str) -> str:
+        """
+        Result cache key, scans of different site selections are cached separately
+        The deadline is not part of the key because only complete scans are cached
+        """
+        if self.full_scan:
+            return username
+        parts = [username]
+        if self.sites:
+            parts.append('sites=' + ','.join(sorted(site.lower() for site in self.sites)))
+        if self.groups:
+            parts.append('groups=' + ','.join(sorted(self.groups)))
+        if self.top:
+            parts.append(f'top={self.top}')
+        return '|'.join(parts)
+
+    def to_dict(self) -> Dict:
+        return {
+            'sites': self.sites or None,
+            'groups': self.groups or None,
+            'top': self.top,
+            'deadline': self.deadline
+        }
+
+def parse_scan_options(sites=None, groups=None, top=None, deadline=None) -> ScanOptions:
+    """
+    Build scan options from request values
+    Raises ValueError with a client-facing message when a value is invalid
+    """
+    site_names = split_names(sites)
+    known = manifest_site_names()
+    if known and site_names:
+        by_name = {name.lower(): name for name in known}
+        unknown = [name for name in site_names if name.lower() not in by_name]
+        if unknown:
+            raise ValueError(f"Unknown sites: {', '.join(unknown)}")
+        site_names = [by_name[name.lower()] for name in site_names]
+
+    group_names = [name.lower() for name in split_names(groups)]
+    unknown = [name for name in group_names if name not in SITE_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown site groups: {', '.join(unknown)} (available: {', '.join(SITE_GROUPS)})")
+
+    try:
+        top = int(top) if top not in (None, '') else None
+        deadline = float(deadline) if deadline not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('top must be an integer and deadline a number of seconds')
+    if top is not None and top < 1:
+        raise ValueError('top must be at least 1')
+    if deadline is not None and not 0 < deadline <= SHERLOCK_MAX_DEADLINE:
+        raise ValueError(f'deadline must be between 0 and {SHERLOCK_MAX_DEADLINE:g} seconds')
+
+    return ScanOptions(site_names, group_names, top, deadline)
+
+class SiteStats:
+    """
+    Per-site check and hit counts, recent latencies and consecutive failures
+    """
+
+    def __init__(self, window: int = SHERLOCK_LATENCY_WINDOW):
+        self.window = window
+        self._checks: Dict[str, int] = {}
+        self._hits: Dict[str, int] = {}
+        # Scans of every site whose individual checks were not reported
+        self._full_scans = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._failures: Dict[str, int] = {}
+        self._skipped_until: Dict[str, float] = {}
+        self._saved_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, site: str, status: str, elapsed: Optional[float]):
+        """
+        Record one site check by its status (found, not_found, error, waf or illegal)
+        """
+        if status == 'illegal':
+            return
+        with self._lock:
+            if elapsed is not None:
+                self._latencies.setdefault(site, deque(maxlen=self.window)).append(round(elapsed, 3))
+            if status in ('found', 'not_found'):
+                self._checks[site] = self._checks.get(site, 0) + 1
+                if status == 'found':
+                    self._hits[site] = self._hits.get(site, 0) + 1
+                self._failures.pop(site, None)
+                self._skipped_until.pop(site, None)
+                return
+
+            failures = self._failures.get(site, 0) + 1
+            self._failures[site] = failures
+            now = time.time()
+            # A failed probe after the skip period starts another one
+            if failures >= SHERLOCK_SKIP_AFTER_FAILURES and self._skipped_until.get(site, 0) <= now:
+                logger.warning(f"Skipping Sherlock site {site} for {SHERLOCK_SKIP_SECONDS:.0f}s after {failures} failed checks")
+                self._skipped_until[site] = now + SHERLOCK_SKIP_SECONDS
+
+    def record_scan(self, sites: Optional[Iterable[str]], found: Iterable[str]):
+        """
+        Record a completed scan of sites (None for all sites) and the sites it found
+        """
+        with self._lock:
+            if sites is None:
+                self._full_scans += 1
+            else:
+                for site in sites:
+                    self._checks[site] = self._checks.get(site, 0) + 1
+            for site in found:
+                self._hits[site] = self._hits.get(site, 0) + 1
+
+    def hit_rate(self, site: str) -> float:
+        """
+        Smoothed hit rate, starting from a prior that favours major sites
+        """
+        prior = MAJOR_PRIOR if site in SITE_GROUPS['major'] else DEFAULT_PRIOR
+        with self._lock:
+            checks = self._checks.get(site, 0) + self._full_scans
+            hits = self._hits.get(site, 0)
+        return (hits + prior * PRIOR_WEIGHT) / (checks + PRIOR_WEIGHT)
+
+    def top(self, sites: Sequence[str], n: int) -> List[str]:
+        ranked = sorted(enumerate(sites), key=lambda item: (-self.hit_rate(item[1]), item[0]))
+        return [site for _, site in ranked[:n]]
+
+    def latency(self, site: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies.get(site, ()))
+        return percentile(samples, pct)
+
+    def timeout_for(self, site: str, default: float) -> float:
+        """
+        Timeout for a site check, from its latency percentile once there are enough samples
+        """
+        if not SHERLOCK_ADAPTIVE_TIMEOUTS:
+            return default
+        with self._lock:
+            samples = sorted(self._latencies.get(site, ()))
+        if len(samples) < SHERLOCK_TIMEOUT_MIN_SAMPLES:
+            return default
+        timeout = percentile(samples, SHERLOCK_TIMEOUT_PERCENTILE) * SHERLOCK_TIMEOUT_MULTIPLIER
+        return min(default, max(SHERLOCK_MIN_SITE_TIMEOUT, timeout))
+
+    def plan(self, sites: Iterable[str], pinned: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+        """
+        Order sites for a scan and split off the ones being skipped
+
+        Slow sites start first so they overlap with the fast ones, sites
+        with recent failures start last. Pinned sites were asked for by name,
+        so they are never skipped and start first in the order given.
+        """
+        now = time.time()
+        sites = list(sites)
+        present = set(sites)
+        pinned = [site for site in dict.fromkeys(pinned) if site in present]
+        pinned_set = set(pinned)
+        with self._lock:
+            keyed = []
+            skipped = []
+            for site in sites:
+                if site in pinned_set:
+                    continue
+                if self._skipped_until.get(site, 0) > now:
+                    skipped.append(site)
+                    continue
+                samples = self._latencies.get(site)
+                median = sorted(samples)[len(samples) // 2] if samples else 0
+                keyed.append((self._failures.get(site, 0) > 0, -median, site))
+        keyed.sort(key=lambda item: item[:2])
+        return pinned + [site for _, _, site in keyed], skipped
+
+    def stats(self, limit: int = 30) -> Dict:
+        now = time.time()
+        with self._lock:
+            sites = set(self._checks) | set(self._hits)
+            slowest = sorted(
+                ((site, sorted(samples)) for site, samples in self._latencies.items() if samples),
+                key=lambda item: -item[1][len(item[1]) // 2]
+            )[:limit]
+            skipped = sorted(site for site, until in self._skipped_until.items() if until > now)
+        return {
+            'top_sites': [{'site': site, 'hit_rate': round(self.hit_rate(site), 3)}
+                          for site in self.top(sorted(sites), limit)],
+            'slowest_sites': [{'site': site, 'p50': percentile(samples, 50), 'p99': percentile(samples, 99),
+                               'timeout': round(self.timeout_for(site, SHERLOCK_SITE_TIMEOUT), 3)}
+                              for site, samples in slowest],
+            'skipped_sites': skipped
+        }
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'checks': dict(self._checks),
+                'hits': dict(self._hits),
+                'full_scans': self._full_scans,
+                'latencies': {site: list(samples) for site, samples in self._latencies.items()},
+                'failures': dict(self._failures),
+                'skipped_until': dict(self._skipped_until)
+            }
+
+    def load(self, path: Optional[str]):
+        """
+        Restore history saved by save, ignoring a missing or unreadable file
+        and one owned by another user
+        """
+        if path is None:
+            return
+        try:
+            check_owned_file(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load Sherlock site stats from {path}: {str(e)}")
+            return
+
+        with self._lock:
+            self._checks = {site: int(n) for site, n in data.get('checks', {}).items()}
+            self._hits = {site: int(n) for site, n in data.get('hits', {}).items()}
+            self._full_scans = int(data.get('full_scans', 0))
+            self._latencies = {site: deque(samples, maxlen=self.window) for site, samples in data.get('latencies', {}).items()}
+            self._failures = {site: int(n) for site, n in data.get('failures', {}).items()}
+            self._skipped_until = {site: float(until) for site, until in data.get('skipped_until', {}).items()}
+        logger.info(f"Loaded Sherlock history for {len(self._latencies)} sites from {path}")
+
+    def save(self, path: Optional[str], force: bool = False):
+        """
+        Write the history to path at most every SITE_STATS_SAVE_INTERVAL seconds
+        """
+        if path is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._saved_at < SITE_STATS_SAVE_INTERVAL:
+                return
+            self._saved_at = now
+        try:
+            # Write to a temporary file and rename so readers never see a partial file
+            directory = os.path.dirname(path) or '.'
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sherlock-sites-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to save Sherlock site stats to {path}: {str(e)}")
+
+site_stats = SiteStats()
+site_stats_file = site_stats_path()
+site_stats.load(site_stats_file)
+
+_manifest_names: Optional[List[str]] = None
+_manifest_lock = threading.Lock()
+
+def manifest_site_names() -> List[str]:
+    """
+    Site names in the Sherlock manifest, empty when it is not available
+    """
+    global _manifest_names
+    if _manifest_names is not None:
+        return _manifest_names
+
+    with _manifest_lock:
+        if _manifest_names is None:
+            from utils.sherlock_engine import default_data_path
+            data_path = os.getenv('SHERLOCK_DATA_PATH') or default_data_path()
+            names = []
+            if data_path:
+                try:
+                    with open(data_path, 'r', encoding='utf-8') as f:
+                        names = [name for name, info in json.load(f).items()
+                                 if isinstance(info, dict) and 'url' in info]
+                except (OSError, ValueError) as e:
+                    logger.error(f"Failed to read Sherlock site names from {data_path}: {str(e)}")
+            _manifest_names = names
+    return _manifest_names
+
+def select_sites(options: ScanOptions, available: Optional[Sequence[str]] = None) -> Optional[List[str]]:
+    """
+    Sites to scan for options, None for every site
+    Sites named explicitly are always included, top only ranks the group
+    members (or every site when no group was named)
+    """
+    if options.full_scan:
+        return None
+
+    available = list(available if available is not None else manifest_site_names())
+    present = set(available)
+
+    explicit = [site for site in options.sites if not present or site in present]
+    candidates = []
+    for group in options.groups:
+        candidates.extend(SITE_GROUPS[group])
+    candidates = list(dict.fromkeys(candidates))
+    if present:
+        candidates = [site for site in candidates if site in present]
+
+    if options.top:
+        if not options.groups:
+            candidates = available or list(dict.fromkeys(site for group in SITE_GROUPS.values() for site in group))
+        candidates = site_stats.top([site for site in candidates if site not in explicit], options.top)
+    return list(dict.fromkeys(explicit + candidates))
@@ -0,0 +1,34 @@
+"""
+Warm worker for the Sherlock process pool
+
+    python -m utils.sherlock_worker MODULE [PRELOAD ...]
+
+Imports the PRELOAD modules up front, then waits for a single job on stdin:
+a JSON list of command line arguments. The job runs like
+`python -m MODULE ARGS` and the worker exits with its status.
+"""
+import importlib
+import json
+import runpy
+import sys
+
+def main() -> int:
+    module = sys.argv[1]
+    for name in sys.argv[2:]:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # The job itself reports a missing module
+            pass
+
+    line = sys.stdin.readline()
+    if not line:
+        # Closed without a job, the pool is shutting down
+        return 0
+
+    sys.argv = [module] + json.loads(line)
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from utils.metrics import COALESCED_CALLS
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one upstream call
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Run func(*args, **kwargs) unless a call for key is already in flight,
+        in which case wait for it and share its result
+        Returns the result and whether this caller joined an in-flight call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                COALESCED_CALLS.labels(self.name).inc()
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            logger.info(f"Joining in-flight {self.name} lookup for {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class AsyncSingleFlight:
+    """
+    Event-loop counterpart of SingleFlight for coroutine functions
+
+    The call runs in its own task, so a cancelled caller does not cancel it
+    for the others. It is only cancelled once every caller has gone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, call: _AsyncCall):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, func: Callable, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Await func(*args, **kwargs) unless a call for key is already in flight
+        Returns the result and whether this caller joined an in-flight call
+        """
+        call = self._calls.get(key)
+        joined = call is not None
+        if joined:
+            self.coalesced += 1
+            COALESCED_CALLS.labels(self.name).inc()
+            logger.info(f"Joining in-flight {self.name} lookup for {key}")
+        else:
+            call = _AsyncCall(asyncio.ensure_future(func(*args, **kwargs)))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda task: self._forget(key, call))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), joined
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller was cancelled, nobody is left to use the result
+                call.task.cancel()
+                self._forget(key, call)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
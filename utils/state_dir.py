@@ -0,0 +1,63 @@
+"""
+Private directory for files the app keeps across requests and restarts
+
+The persistent cache, rate limit buckets, Sherlock site history and RDAP
+bootstrap copy live in OSINT_STATE_DIR, by default a per-user directory
+under the system temp directory. It is created with mode 0700 and refused
+when another user owns it or can write to it, so other local users cannot
+plant or tamper with these files.
+"""
+import os
+import stat
+import tempfile
+from typing import Optional
+
+OSINT_STATE_DIR = os.getenv('OSINT_STATE_DIR')
+
+def current_uid() -> Optional[int]:
+    """
+    This process's uid, None where the platform has no uids
+    """
+    getuid = getattr(os, 'getuid', None)
+    return getuid() if getuid else None
+
+def private_dir(path: str) -> str:
+    """
+    Create path with mode 0700 if needed and check that only this user controls it
+    Raises PermissionError when it is a symlink, owned by another user or
+    writable by group or others
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f'{path} is not a directory')
+    uid = current_uid()
+    if uid is not None and (st.st_uid != uid or st.st_mode & 0o022):
+        raise PermissionError(f'{path} must be owned by uid {uid} and not writable by group or others')
+    return path
+
+def check_owned_file(path: str):
+    """
+    Raise PermissionError when path exists as a symlink or belongs to another user
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+    uid = current_uid()
+    if stat.S_ISLNK(st.st_mode) or (uid is not None and st.st_uid != uid):
+        raise PermissionError(f'{path} is a symlink or owned by another user')
+
+def app_state_dir() -> str:
+    """
+    The state directory, created and checked on every call
+    """
+    uid = current_uid()
+    default = os.path.join(tempfile.gettempdir(), f'osint-backend-{"app" if uid is None else uid}')
+    return private_dir(OSINT_STATE_DIR or default)
+
+def state_path(name: str) -> str:
+    """
+    Path of a file inside the state directory
+    """
+    return os.path.join(app_state_dir(), name)